@@ -1,20 +1,56 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, ValidationError
+from typing import Optional, Dict, Any, List, Tuple
 import os
+import stat
 import uuid
 import base64
 import time
 import asyncio
 import json
+from email.utils import formatdate, parsedate_to_datetime
 from PIL import Image
 from io import BytesIO
-from concurrent.futures import ThreadPoolExecutor
-from function_agents import generate_complete_tryon, get_agents_status
-from function_agents.check_single_cloth import check_cloth_validity
+from function_agents import (
+    generate_complete_tryon_async,
+    prepare_model_image_async,
+    merge_batch_async,
+    get_agents_status,
+    get_translation_memo,
+    warm_up_clients,
+    warm_up_async_clients,
+    close_clients,
+    aclose_async_clients
+)
+from function_agents.metrics import REGISTRY, render_metrics
+from function_agents.tracing import (
+    TracingThreadPoolExecutor,
+    current_span,
+    flush_traces,
+    in_span,
+    parse_traceparent,
+    span,
+    traced
+)
+from function_agents.check_single_cloth import check_cloth_validity, check_cloth_validity_bytes
+from function_agents.artifact_store import ARTIFACT_REDIRECT, fetch_image_async, get_artifact_store, image_key
+from function_agents.single_flight import SingleFlight
+from function_agents.storage import (
+    IMAGE_FOLDER,
+    STORAGE_JANITOR_INTERVAL,
+    get_storage_manager,
+    resolve_image_path,
+    touch_access
+)
+from http_metrics import HTTPMetricsMiddleware
+from http_tracing import TracingMiddleware
+from image_derivatives import FORMATS, choose_format, derivative_key, derivative_path, make_derivative, snap_size
+from job_store import JobStore
+from upload_store import UploadStore, prepare_image_bytes, prepare_image_file
+from upload_stream import UploadTooLarge, parse_bool, receive_upload
 import datetime
 
 # Create FastAPI application
@@ -31,14 +67,92 @@ app.add_middleware(
 
 # Configure upload folder
 UPLOAD_FOLDER = 'uploads'
-MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
+# JSON bodies carry the image base64 encoded (4/3 of its size) plus parameters
+MAX_JSON_BODY_LENGTH = MAX_CONTENT_LENGTH * 4 // 3 + 64 * 1024
 
 # Ensure upload directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs('imgs', exist_ok=True)
+os.makedirs(IMAGE_FOLDER, exist_ok=True)
+
+# Temporary uploads owned by requests in this process; the storage janitor never sweeps them
+temp_files = set()
+
+# Generated images get uuid-unique names and are never rewritten, so clients may cache them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Arbitrary paths may change, so clients revalidate them with the ETag
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+@app.middleware("http")
+async def limit_request_body(request: Request, call_next):
+    """Reject JSON requests whose declared body exceeds the size limit before reading them"""
+    declared = request.headers.get('content-length')
+    is_upload = request.url.path.endswith('/upload')
+    if declared and declared.isdigit() and not is_upload and int(declared) > MAX_JSON_BODY_LENGTH:
+        return JSONResponse(
+            status_code=413,
+            content={'success': False, 'error': f"Request body exceeds {MAX_JSON_BODY_LENGTH} bytes"}
+        )
+    return await call_next(request)
+
+# The last middleware added is the outermost, so these two also see requests rejected above
+# Per-route request counts, latency and body sizes for /metrics
+app.add_middleware(HTTPMetricsMiddleware)
+# Outermost, so the request span covers every other middleware; adds the X-Trace-Id header
+app.add_middleware(TracingMiddleware)
 
 # Create thread pool for CPU-intensive tasks
-executor = ThreadPoolExecutor(max_workers=4)
+# Tasks run in the submitting request's context, so their spans join its trace
+executor = TracingThreadPoolExecutor(max_workers=int(os.getenv('REQUEST_EXECUTOR_WORKERS', 4)))
+# Resizing and encoding image derivatives is CPU-bound; Pillow releases the GIL while
+# doing it, so one worker per core keeps it off the request executor and event loop
+derivative_executor = TracingThreadPoolExecutor(max_workers=int(os.getenv('IMAGE_DERIVATIVE_WORKERS', os.cpu_count() or 4)))
+# Concurrent requests for the same derivative wait for one encode
+derivative_flight = SingleFlight('image_derivative')
+
+# Background job queue for asynchronous generation
+# Jobs await the async agent pipeline, so a worker is a coroutine rather than a thread
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 32))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+# How often a running job renews its lease; well below JOB_LEASE_SECONDS
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', 60))
+job_store = JobStore()
+job_wakeup: Optional[asyncio.Event] = None
+
+def collect_server_metrics():
+    """
+    Report thread pool saturation and job queue depth at scrape time
+
+    Reads the job store, so it must run off the event loop; /metrics renders in the default executor.
+    """
+    pools = {'request': executor, 'derivative': derivative_executor}
+    if default_executor is not None:
+        pools['default'] = default_executor
+    stats = {name: pool.get_stats() for name, pool in pools.items()}
+    return [
+        ('tryon_executor_tasks_submitted_total', 'counter', 'Tasks submitted to the thread pool',
+         [({'pool': name}, pool['submitted']) for name, pool in stats.items()]),
+        ('tryon_executor_tasks_finished_total', 'counter', 'Tasks that ran to completion or raised',
+         [({'pool': name}, pool['finished']) for name, pool in stats.items()]),
+        ('tryon_executor_queue_depth', 'gauge', 'Tasks waiting for a worker thread',
+         [({'pool': name}, pool['queued']) for name, pool in stats.items()]),
+        ('tryon_executor_active_workers', 'gauge', 'Worker threads running a task',
+         [({'pool': name}, pool['running']) for name, pool in stats.items()]),
+        ('tryon_executor_max_workers', 'gauge', 'Worker thread limit',
+         [({'pool': name}, pool['max_workers']) for name, pool in stats.items()]),
+        ('tryon_job_queue_depth', 'gauge', 'Background jobs waiting for a worker', [({}, job_store.queue_depth())])
+    ]
+
+# Default executor of the event loop, which runs blocking helpers; set at startup
+default_executor: Optional[TracingThreadPoolExecutor] = None
+REGISTRY.add_collector(collect_server_metrics)
+
+# Content-addressed garment uploads, referenced by garment ID
+upload_store = UploadStore()
+
+# Batch try-on limits
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 8))
 
 # Pydantic model definitions
 class CameraSettings(BaseModel):
@@ -47,7 +161,8 @@ class CameraSettings(BaseModel):
     angle: Optional[str] = "front"  # "front" or "side"
 
 class GenerateModelRequest(BaseModel):
-    clothingImage: str
+    clothingImage: Optional[str] = None  # base64 image, or use garmentId
+    garmentId: Optional[str] = None  # ID returned by /api/uploads
     gender: Optional[str] = "female"
     age: Optional[int] = 25
     nationality: Optional[str] = "Chinese"
@@ -56,6 +171,7 @@ class GenerateModelRequest(BaseModel):
     actionDescription: Optional[str] = None
     sceneDescription: Optional[str] = None
     camera: Optional[CameraSettings] = CameraSettings()
+    bypassModelCache: Optional[bool] = False  # Always generate a fresh base model
 
 class GenerateModelOnlyRequest(BaseModel):
     gender: Optional[str] = "female"
@@ -66,9 +182,11 @@ class GenerateModelOnlyRequest(BaseModel):
     actionDescription: Optional[str] = None
     sceneDescription: Optional[str] = None
     camera: Optional[CameraSettings] = CameraSettings()
+    bypassModelCache: Optional[bool] = False  # Always generate a fresh base model
 
 class MergeClothingRequest(BaseModel):
-    clothingImage: str
+    clothingImage: Optional[str] = None
+    garmentId: Optional[str] = None
     modelImagePath: str
     shot_type: Optional[str] = "全身"
     angle: Optional[str] = "正面"
@@ -76,29 +194,51 @@ class MergeClothingRequest(BaseModel):
     scene_description: Optional[str] = "简约工作室背景"
 
 class ClothingCheckRequest(BaseModel):
+    clothingImage: Optional[str] = None
+    garmentId: Optional[str] = None
+
+class UploadImageRequest(BaseModel):
     clothingImage: str
 
+class BatchGarment(BaseModel):
+    id: Optional[str] = None  # Caller's reference (e.g. SKU), echoed back in results
+    clothingImage: Optional[str] = None
+    garmentId: Optional[str] = None
+
+class BatchTryOnRequest(BaseModel):
+    garments: List[BatchGarment]
+    modelImagePath: Optional[str] = None  # Reuse an existing model image instead of generating one
+    gender: Optional[str] = "female"
+    age: Optional[int] = 25
+    nationality: Optional[str] = "Chinese"
+    height: Optional[int] = 170
+    weight: Optional[int] = 60
+    actionDescription: Optional[str] = None
+    sceneDescription: Optional[str] = None
+    camera: Optional[CameraSettings] = CameraSettings()
+    bypassModelCache: Optional[bool] = False
+    concurrency: Optional[int] = 4  # Concurrent merges, capped at BATCH_MAX_CONCURRENCY
+
 # Helper functions: Process image data
-def process_image_data(image_data: str) -> str:
-    """Process base64 image data and save as temporary file"""
+def decode_image_data(image_data: str) -> bytes:
+    """Decode base64 image data, with or without a data URL prefix"""
     if image_data.startswith('data:image'):
         image_data = image_data.split(',')[1]
     
-    image_bytes = base64.b64decode(image_data)
-    image = Image.open(BytesIO(image_bytes))
-    
-    # Convert RGBA to RGB
-    if image.mode == 'RGBA':
-        background = Image.new('RGB', image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[-1])
-        image = background
-    elif image.mode != 'RGB':
-        image = image.convert('RGB')
+    return base64.b64decode(image_data)
+
+@traced('process_image_data')
+def process_image_data(image_data: str) -> str:
+    """Process base64 image data and save as temporary file"""
+    # RGB JPEGs are written as uploaded, anything else is converted to an RGB JPEG
+    jpeg_bytes = prepare_image_bytes(decode_image_data(image_data))
     
     # Create temporary file
     unique_filename = f"{uuid.uuid4()}.jpg"
     filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
-    image.save(filepath, format="JPEG", quality=90)
+    with open(filepath, 'wb') as f:
+        f.write(jpeg_bytes)
+    temp_files.add(filepath)
     
     return filepath
 
@@ -130,11 +270,70 @@ def process_model_params(data: dict) -> dict:
         model_params['action_description'] = data['actionDescription']
     if data.get('sceneDescription'):
         model_params['scene_description'] = data['sceneDescription']
+    if data.get('bypassModelCache'):
+        model_params['bypass_model_cache'] = True
     
     return model_params
 
+def resolve_clothing_image(clothing_image: Optional[str], garment_id: Optional[str]) -> Tuple[str, bool]:
+    """
+    Resolve the clothing image of a request to a file path
+    
+    Returns (filepath, is_temporary); temporary files must be cleaned up by the caller.
+    Stored garments are shared and must not be deleted.
+    """
+    if garment_id:
+        filepath = upload_store.get_path(garment_id)
+        if filepath is None:
+            raise HTTPException(status_code=404, detail={'success': False, 'error': 'Garment not found'})
+        return filepath, False
+    
+    if not clothing_image:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': 'clothingImage or garmentId is required'})
+    
+    try:
+        return process_image_data(clothing_image), True
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': f"Invalid image data: {str(e)}"})
+
+async def receive_clothing_upload(request: Request) -> Tuple[str, Dict[str, str]]:
+    """
+    Stream a clothing image upload to disk and normalize it to an RGB JPEG
+    
+    Returns (filepath, form_fields); the file is temporary and must be cleaned up by the caller.
+    """
+    try:
+        spool_path, fields = await receive_upload(request, UPLOAD_FOLDER, MAX_CONTENT_LENGTH)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail={'success': False, 'error': str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': f"Invalid upload: {str(e)}"})
+    
+    try:
+        loop = asyncio.get_event_loop()
+        filepath = await loop.run_in_executor(executor, prepare_image_file, spool_path)
+    except Exception as e:
+        cleanup_temp_file(spool_path)
+        raise HTTPException(status_code=400, detail={'success': False, 'error': f"Invalid image data: {str(e)}"})
+    temp_files.add(filepath)
+    return filepath, fields
+
+def form_model_params(fields: Dict[str, str]) -> dict:
+    """Build model parameters from form fields (or query parameters) of an upload"""
+    data = {key: value for key, value in fields.items() if key not in ('shot_type', 'angle', 'bypassModelCache')}
+    data['camera'] = {
+        'shot_type': fields.get('shot_type', 'full_body'),
+        'angle': fields.get('angle', 'front')
+    }
+    data['bypassModelCache'] = parse_bool(fields.get('bypassModelCache'))
+    try:
+        return process_model_params(GenerateModelOnlyRequest(**data).dict())
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': f"Invalid parameters: {str(e)}"})
+
 def cleanup_temp_file(filepath: str):
     """Clean up temporary files"""
+    temp_files.discard(filepath)
     if os.path.exists(filepath):
         os.remove(filepath)
 
@@ -147,9 +346,9 @@ def extract_image_path(result_string: str) -> str:
         return result_string
     
     # 尝试从包含文本的字符串中提取路径
-    # 匹配模式如：imgs/tryon_f6026f8c.jpg
+    # 匹配模式如：imgs/tryon_f6026f8c.jpg 或分片目录下的 imgs/3e/tryon_f6026f8c.jpg
     patterns = [
-        r'imgs/[a-zA-Z0-9_]+\.jpg',  # 标准的imgs/文件名.jpg格式
+        r'imgs/(?:[0-9a-f]{2}/)*[a-zA-Z0-9_]+\.jpg',  # 标准的imgs/文件名.jpg格式
         r'[a-zA-Z0-9_/]+\.jpg',     # 任何以.jpg结尾的路径
     ]
     
@@ -177,7 +376,8 @@ def get_image_info(image_path: str) -> dict:
             'filename': filename,
             'file_size_kb': round(file_size / 1024, 2),
             'timestamp': timestamp,
-            'image_url': f"/imgs/{filename}?t={timestamp}"
+            # Names are uuid-unique and never rewritten, so no cache-busting query string is needed
+            'image_url': f"/imgs/{filename}"
         }
     else:
         return {
@@ -185,11 +385,143 @@ def get_image_info(image_path: str) -> dict:
             'error': 'Image not found'
         }
 
-# Async wrapper function for CPU-intensive tasks
+# Async wrapper function for the agent pipeline
 async def async_generate_complete_tryon(filepath: str, model_params: dict) -> str:
     """Asynchronously execute complete virtual try-on generation"""
+    return await generate_complete_tryon_async(filepath, model_params)
+
+# Background job workers
+async def run_tryon_job(job: dict) -> dict:
+    """Run a queued try-on job to completion, recording stage progress in the job store"""
+    payload = job['payload']
+    filepath = payload['clothing_path']
+    is_temporary = payload.get('cleanup_clothing', True)
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(executor, generate_complete_tryon, filepath, model_params)
+    try:
+        with span('tryon_job', remote_parent=parse_traceparent(payload.get('traceparent')), **{'job.id': job['job_id']}):
+            result_path = await generate_complete_tryon_async(
+                filepath,
+                payload['model_params'],
+                # The SQLite write runs off the event loop; the pipeline awaits it before the stage starts
+                progress_callback=lambda stage: loop.run_in_executor(None, job_store.mark_stage, job['job_id'], stage)
+            )
+        image_info = get_image_info(extract_image_path(result_path))
+        if not image_info['success']:
+            raise Exception('Generated image file not found')
+        return {'generated_image': image_info}
+    finally:
+        if is_temporary:
+            cleanup_temp_file(filepath)
+
+async def heartbeat_job(job_id: str):
+    """Keep renewing a job's lease until cancelled"""
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            await loop.run_in_executor(None, job_store.heartbeat, job_id)
+        except Exception as e:
+            print(f"⚠️ Heartbeat for job {job_id} failed: {e}")
+
+async def job_worker(worker_id: int):
+    """Drain the persistent job queue, one job at a time"""
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            job = await loop.run_in_executor(None, job_store.claim)
+            if job is None:
+                job_wakeup.clear()
+                try:
+                    await asyncio.wait_for(job_wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            print(f"🧵 Worker {worker_id} picked up job {job['job_id']} (attempt {job['attempts']})")
+            heartbeat = asyncio.create_task(heartbeat_job(job['job_id']))
+            try:
+                result = await run_tryon_job(job)
+                await loop.run_in_executor(None, job_store.complete, job['job_id'], result)
+                print(f"✅ Job {job['job_id']} completed")
+            except Exception as e:
+                print(f"❌ Job {job['job_id']} failed: {e}")
+                await loop.run_in_executor(None, job_store.fail, job['job_id'], str(e))
+            finally:
+                heartbeat.cancel()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Job worker {worker_id} error: {e}")
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Start background job workers"""
+    global job_wakeup, default_executor
+    job_wakeup = asyncio.Event()
+    # Blocking helpers run via run_in_executor(None, ...) keep the trace of their caller too
+    default_executor = TracingThreadPoolExecutor()
+    asyncio.get_running_loop().set_default_executor(default_executor)
+    app.state.job_workers = [asyncio.create_task(job_worker(i)) for i in range(JOB_WORKERS)]
+
+@app.on_event("startup")
+async def warm_up_upstream_clients():
+    """Establish pooled upstream connections in the background"""
+    # Fail fast on a misconfigured artifact backend
+    get_artifact_store()
+    loop = asyncio.get_event_loop()
+    loop.run_in_executor(None, warm_up_clients)
+    # Requests on this loop use its async client, which has its own connection pool
+    app.state.client_warm_up = asyncio.create_task(warm_up_async_clients())
+    # Load and seed the translation memo before the first merge needs it
+    loop.run_in_executor(None, get_translation_memo)
+
+async def storage_janitor():
+    """Periodically evict expired and over-quota files and sweep orphaned uploads"""
+    loop = asyncio.get_event_loop()
+    manager = get_storage_manager()
+    while True:
+        try:
+            await asyncio.sleep(STORAGE_JANITOR_INTERVAL)
+            # Inputs of queued jobs wait on disk until a worker picks them up
+            pending = await loop.run_in_executor(None, job_store.pending_payloads)
+            in_use = set(temp_files) | {payload.get('clothing_path') for payload in pending if payload.get('clothing_path')}
+            await loop.run_in_executor(None, manager.sweep, in_use)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Storage janitor error: {e}")
+
+@app.on_event("startup")
+async def start_storage_janitor():
+    """Start the background storage janitor"""
+    if STORAGE_JANITOR_INTERVAL > 0:
+        app.state.storage_janitor = asyncio.create_task(storage_janitor())
+
+@app.on_event("shutdown")
+async def stop_storage_janitor():
+    """Stop the background storage janitor"""
+    task = getattr(app.state, 'storage_janitor', None)
+    if task is not None:
+        task.cancel()
+
+@app.on_event("shutdown")
+async def export_pending_traces():
+    """Export spans still buffered"""
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, flush_traces)
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Stop background job workers; running jobs are picked up again once their lease expires"""
+    for task in getattr(app.state, 'job_workers', []):
+        task.cancel()
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    """Close pooled upstream connections"""
+    await aclose_async_clients()
+    close_clients()
 
 
 
@@ -198,22 +530,34 @@ async def async_generate_complete_tryon(filepath: str, model_params: dict) -> st
 async def generate_model(request: GenerateModelRequest):
     """
     Main virtual try-on generation endpoint
-    Accepts JSON data containing base64 encoded clothing image and model parameters
+    Accepts JSON data containing base64 encoded clothing image (or a garment ID) and model parameters
     """
+    # Process image data
+    filepath, is_temporary = resolve_clothing_image(request.clothingImage, request.garmentId)
+    return await generate_model_for_file(filepath, is_temporary, process_model_params(request.dict()))
+
+@app.post("/api/generate-model/upload")
+async def generate_model_upload(request: Request):
+    """
+    Same as /api/generate-model, with the clothing image streamed as multipart/form-data
+    (file field "clothing", model parameters as form fields) or as a raw image body
+    (model parameters in the query string)
+    """
+    filepath, fields = await receive_clothing_upload(request)
+    try:
+        model_params = form_model_params(fields)
+    except HTTPException:
+        cleanup_temp_file(filepath)
+        raise
+    return await generate_model_for_file(filepath, True, model_params)
+
+async def generate_model_for_file(filepath: str, is_temporary: bool, model_params: dict):
+    """Run the complete try-on for a resolved clothing file and build the response"""
     try:
-        # Process image data
-        filepath = process_image_data(request.clothingImage)
-        
-        # Process model parameters
-        model_params = process_model_params(request.dict())
-        
         # Execute AI generation asynchronously
         print("🚀 Starting virtual try-on generation with new agents...")
         result_path = await async_generate_complete_tryon(filepath, model_params)
         
-        # Clean up temporary files
-        cleanup_temp_file(filepath)
-        
         # Get generated image information
         image_info = get_image_info(result_path)
         
@@ -239,44 +583,136 @@ async def generate_model(request: GenerateModelRequest):
     except Exception as e:
         print(f"❌ Generation failed: {e}")
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
+    finally:
+        # Clean up temporary files
+        if is_temporary:
+            cleanup_temp_file(filepath)
 
 
-
-@app.post("/api/generate-step-by-step")
-async def generate_step_by_step(request: GenerateModelRequest):
+@app.post("/api/jobs")
+async def submit_generation_job(request: GenerateModelRequest):
     """
-    Step-by-step virtual try-on generation with intermediate results
+    Submit a virtual try-on job
+    Returns a job ID immediately; poll /api/jobs/{job_id} for progress and result
     """
+    filepath, is_temporary = resolve_clothing_image(request.clothingImage, request.garmentId)
+    
     try:
-        # Process image data
-        filepath = process_image_data(request.clothingImage)
-        
-        # Process model parameters
         model_params = process_model_params(request.dict())
         
-        print("🚀 Starting step-by-step virtual try-on generation...")
-        
-        # Async import functions
-        from function_agents import (
-            generate_model_description,
-            merge_model_with_clothing
-        )
-        from function_agents.model_generation_agent import generate_model_from_prompt
-        
-        # Use thread pool for CPU-intensive tasks
         loop = asyncio.get_event_loop()
+        job_id = await loop.run_in_executor(None, job_store.submit, 'tryon', {
+            'clothing_path': filepath,
+            'cleanup_clothing': is_temporary,
+            'model_params': model_params,
+            # The job's spans join the trace of the request that queued it
+            'traceparent': current_span().traceparent
+        })
+        if job_wakeup is not None:
+            job_wakeup.set()
         
-        # Step 1: Generate model description
-        print("📝 Step 1: Generating model description...")
-        description = await loop.run_in_executor(executor, generate_model_description, model_params)
-        
-        # Step 2: Generate model image
-        print("🎨 Step 2: Generating model image...")
-        model_result = await loop.run_in_executor(executor, generate_model_from_prompt, description)
+        print(f"📥 Queued try-on job {job_id}")
+        return {
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f"/api/jobs/{job_id}"
+        }
+    except Exception as e:
+        print(f"❌ Job submission failed: {e}")
+        if is_temporary:
+            cleanup_temp_file(filepath)
+        raise HTTPException(status_code=500, detail=f"Job submission failed: {str(e)}")
+
+@app.get("/api/jobs/{job_id}")
+async def get_generation_job(job_id: str):
+    """Get status, stage timings and result of a try-on job"""
+    loop = asyncio.get_event_loop()
+    job = await loop.run_in_executor(None, job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={'success': False, 'error': 'Job not found'})
+    return {
+        'success': True,
+        'job': JobStore.to_public(job)
+    }
+
+# Step-by-step pipeline shared by the JSON and Server-Sent Events endpoints
+SSE_HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments while a stage runs
+
+async def wait_with_heartbeat(future, stages: Optional[asyncio.Queue] = None):
+    """
+    Yield heartbeat events until the stage task finishes
+    
+    If a stages queue is given, stage names put on it by the task's progress
+    callback are yielded as ('stage', name) as they arrive.
+    """
+    while True:
+        waiting = {future}
+        getter = asyncio.ensure_future(stages.get()) if stages is not None else None
+        if getter is not None:
+            waiting.add(getter)
+        done, _ = await asyncio.wait(waiting, timeout=SSE_HEARTBEAT_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+        if getter is not None:
+            if getter in done:
+                yield ('stage', getter.result())
+                continue
+            getter.cancel()
+        if future in done:
+            while stages is not None and not stages.empty():
+                yield ('stage', stages.get_nowait())
+            return
+        yield ('heartbeat', None)
+
+async def step_by_step_events(filepath: str, model_params: dict, cleanup: bool = True):
+    """
+    Run description -> model image -> merge, yielding (event, data) tuples as stages progress
+    
+    Events: stage_started, stage_completed, heartbeat and a final result event.
+    If cleanup is set, the temporary clothing file is removed when the generator finishes.
+    """
+    from function_agents import merge_model_with_clothing_async
+    
+    stage_timings = {}
+    
+    try:
+        # Steps 1-2: model description and model image, both skipped on a model cache hit
+        stages: asyncio.Queue = asyncio.Queue()
+        future = asyncio.ensure_future(prepare_model_image_async(model_params, stages.put_nowait))
+        current_stage, started = None, time.time()
+        async for event, stage in wait_with_heartbeat(future, stages):
+            if event == 'heartbeat':
+                yield (event, None)
+                continue
+            if current_stage == 'description':
+                stage_timings['description'] = round(time.time() - started, 3)
+                yield ('stage_completed', {
+                    'stage': 'description',
+                    'elapsed_seconds': stage_timings['description']
+                })
+            current_stage, started = stage, time.time()
+            yield ('stage_started', {'stage': stage})
+        model_image_path, cached = future.result()
+        if cached:
+            stage_timings['description'] = stage_timings['model_generation'] = 0.0
+            yield ('stage_completed', {
+                'stage': 'description',
+                'elapsed_seconds': 0.0,
+                'cached': True
+            })
+        else:
+            stage_timings['model_generation'] = round(time.time() - started, 3)
         
         # Check if model image exists
-        if not os.path.exists(model_result.image_path):
-            raise Exception(f"Model image not generated: {model_result.image_path}")
+        if not os.path.exists(model_image_path):
+            raise Exception(f"Model image not generated: {model_image_path}")
+        
+        model_info = get_image_info(model_image_path)
+        yield ('stage_completed', {
+            'stage': 'model_generation',
+            'elapsed_seconds': stage_timings['model_generation'],
+            'cached': cached,
+            'model_image': model_info
+        })
         
         # Step 3: Merge images with camera parameters
         print("👕 Step 3: Merging model with clothing...")
@@ -287,44 +723,72 @@ async def generate_step_by_step(request: GenerateModelRequest):
         pose_description = model_params.get('action_description', '自然站立姿势')
         scene_description = model_params.get('scene_description', '简约工作室背景')
         
-        final_result = await loop.run_in_executor(
-            executor, 
-            merge_model_with_clothing, 
-            model_result.image_path, 
+        yield ('stage_started', {'stage': 'merge'})
+        started = time.time()
+        future = asyncio.ensure_future(in_span('tryon.merge', merge_model_with_clothing_async(
+            model_image_path,
             filepath,
             shot_type,
             angle,
             pose_description,
             scene_description
-        )
-        
-        # Clean up temporary files
-        cleanup_temp_file(filepath)
+        )))
+        async for beat in wait_with_heartbeat(future):
+            yield beat
+        final_result = future.result()
+        stage_timings['merge'] = round(time.time() - started, 3)
         
         # Extract actual image path from agent result
         final_image_path = extract_image_path(final_result)
-        
-        # Get image information
-        model_info = get_image_info(model_result.image_path)
         final_info = get_image_info(final_image_path)
+        if not final_info['success']:
+            raise Exception('Final image generation failed')
         
-        if final_info['success']:
-            return {
-                'success': True,
-                'result': {
-                    'model_image': model_info,
-                    'final_image': final_info
-                },
-                'message': 'Step-by-step generation completed successfully'
-            }
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail={
-                    'success': False,
-                    'error': 'Final image generation failed'
-                }
-            )
+        yield ('stage_completed', {
+            'stage': 'merge',
+            'elapsed_seconds': stage_timings['merge'],
+            'final_image': final_info
+        })
+        yield ('result', {
+            'model_image': model_info,
+            'final_image': final_info,
+            'stage_timings': stage_timings
+        })
+    finally:
+        # Clean up temporary files
+        if cleanup:
+            cleanup_temp_file(filepath)
+
+def format_sse(event: str, data: Optional[dict]) -> str:
+    """Format a Server-Sent Events message"""
+    if event == 'heartbeat':
+        return ": keep-alive\n\n"
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/generate-step-by-step")
+async def generate_step_by_step(request: GenerateModelRequest):
+    """
+    Step-by-step virtual try-on generation with intermediate results
+    """
+    # Process image data
+    filepath, is_temporary = resolve_clothing_image(request.clothingImage, request.garmentId)
+    
+    try:
+        # Process model parameters
+        model_params = process_model_params(request.dict())
+        
+        print("🚀 Starting step-by-step virtual try-on generation...")
+        
+        result = None
+        async for event, data in step_by_step_events(filepath, model_params, cleanup=is_temporary):
+            if event == 'result':
+                result = data
+        
+        return {
+            'success': True,
+            'result': result,
+            'message': 'Step-by-step generation completed successfully'
+        }
         
     except Exception as e:
         print(f"Step-by-step generation error: {str(e)}")
@@ -336,6 +800,159 @@ async def generate_step_by_step(request: GenerateModelRequest):
             }
         )
 
+@app.post("/api/generate-step-by-step/stream")
+async def generate_step_by_step_stream(request: GenerateModelRequest):
+    """
+    Step-by-step virtual try-on generation streamed as Server-Sent Events
+    Emits an event as each stage starts and finishes, including the intermediate model image
+    """
+    filepath, is_temporary = resolve_clothing_image(request.clothingImage, request.garmentId)
+    model_params = process_model_params(request.dict())
+    
+    print("🚀 Starting streamed step-by-step virtual try-on generation...")
+    
+    async def event_stream():
+        try:
+            async for event, data in step_by_step_events(filepath, model_params, cleanup=is_temporary):
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"Streamed step-by-step generation error: {str(e)}")
+            yield format_sse('error', {'success': False, 'error': str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+# Batch try-on: one model image, many garments
+async def batch_tryon_events(garments: List[dict], model_params: dict,
+                             model_image_path: Optional[str], concurrency: int):
+    """
+    Prepare the model image once, then merge it with every garment, yielding (event, data) tuples
+    
+    Events: model_ready, item_completed (once per garment, in completion order),
+    heartbeat and a final result event. Temporary clothing files are removed
+    when the generator finishes.
+    """
+    batch_started = time.time()
+    try:
+        if model_image_path:
+            model_cached = True
+        else:
+            future = asyncio.ensure_future(prepare_model_image_async(model_params))
+            async for beat in wait_with_heartbeat(future):
+                yield beat
+            model_image_path, model_cached = future.result()
+        
+        model_info = get_image_info(model_image_path)
+        if not model_info['success']:
+            raise Exception(f"Model image not generated: {model_image_path}")
+        yield ('model_ready', {
+            'cached': model_cached,
+            'elapsed_seconds': round(time.time() - batch_started, 3),
+            'model_image': model_info
+        })
+        
+        succeeded = 0
+        merges = merge_batch_async(
+            model_image_path,
+            [garment['filepath'] for garment in garments],
+            model_params,
+            concurrency=concurrency
+        )
+        while True:
+            future = asyncio.ensure_future(merges.__anext__())
+            async for beat in wait_with_heartbeat(future):
+                yield beat
+            try:
+                index, result_path, error = future.result()
+            except StopAsyncIteration:
+                break
+            
+            item = {'index': index, 'id': garments[index]['id']}
+            final_info = get_image_info(extract_image_path(result_path)) if result_path else None
+            if final_info and final_info['success']:
+                succeeded += 1
+                item.update({'success': True, 'final_image': final_info})
+            else:
+                item.update({'success': False, 'error': str(error) if error else 'Final image generation failed'})
+                print(f"❌ Batch item {index} failed: {item['error']}")
+            yield ('item_completed', item)
+        
+        yield ('result', {
+            'model_image': model_info,
+            'total': len(garments),
+            'succeeded': succeeded,
+            'failed': len(garments) - succeeded,
+            'elapsed_seconds': round(time.time() - batch_started, 3)
+        })
+    finally:
+        for garment in garments:
+            if garment['is_temporary']:
+                cleanup_temp_file(garment['filepath'])
+
+@app.post("/api/tryon/batch")
+async def batch_tryon(request: BatchTryOnRequest):
+    """
+    Dress one model in many garments, streamed as Server-Sent Events
+    The model image is generated (or taken from the cache / modelImagePath) once;
+    each garment then only needs a merge, and results are emitted as they complete
+    """
+    if not request.garments:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': 'garments must not be empty'})
+    if len(request.garments) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail={'success': False, 'error': f"At most {BATCH_MAX_ITEMS} garments per batch"}
+        )
+    model_image_path = None
+    if request.modelImagePath:
+        # The model image may have been generated on another node
+        model_image_path = await fetch_image_async(request.modelImagePath)
+        if model_image_path is None:
+            raise HTTPException(status_code=404, detail={'success': False, 'error': 'Model image not found'})
+    
+    garments = []
+    try:
+        for index, garment in enumerate(request.garments):
+            filepath, is_temporary = resolve_clothing_image(garment.clothingImage, garment.garmentId)
+            garments.append({
+                'id': garment.id if garment.id is not None else str(index),
+                'filepath': filepath,
+                'is_temporary': is_temporary
+            })
+    except HTTPException:
+        for garment in garments:
+            if garment['is_temporary']:
+                cleanup_temp_file(garment['filepath'])
+        raise
+    
+    model_params = process_model_params(request.dict())
+    concurrency = min(max(1, request.concurrency or 1), BATCH_MAX_CONCURRENCY)
+    
+    print(f"🚀 Starting batch try-on: {len(garments)} garments, concurrency {concurrency}")
+    
+    async def event_stream():
+        try:
+            async for event, data in batch_tryon_events(garments, model_params, model_image_path, concurrency):
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"Batch try-on error: {str(e)}")
+            yield format_sse('error', {'success': False, 'error': str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @app.post("/api/generate-model-only")
 async def generate_model_only(request: GenerateModelOnlyRequest):
     """
@@ -347,26 +964,15 @@ async def generate_model_only(request: GenerateModelOnlyRequest):
         
         print("🚀 Starting model-only generation...")
         
-        from function_agents import generate_model_description
-        from function_agents.model_generation_agent import generate_model_from_prompt
-        
-        # Use thread pool for CPU-intensive tasks
-        loop = asyncio.get_event_loop()
-        
-        # Step 1: Generate model description
-        print("📝 Step 1: Generating model description...")
-        description = await loop.run_in_executor(executor, generate_model_description, model_params)
-        
-        # Step 2: Generate model image
-        print("🎨 Step 2: Generating model image...")
-        model_result = await loop.run_in_executor(executor, generate_model_from_prompt, description)
+        # Steps 1-2 run only on a model cache miss
+        model_image_path, _ = await prepare_model_image_async(model_params)
         
         # Check if model image exists
-        if not os.path.exists(model_result.image_path):
-            raise Exception(f"Model image not generated: {model_result.image_path}")
+        if not os.path.exists(model_image_path):
+            raise Exception(f"Model image not generated: {model_image_path}")
         
         # Get image information
-        model_info = get_image_info(model_result.image_path)
+        model_info = get_image_info(model_image_path)
         
         return {
             'success': True,
@@ -386,21 +992,67 @@ async def generate_model_only(request: GenerateModelOnlyRequest):
             }
         )
 
+@app.post("/api/uploads")
+async def upload_image(request: UploadImageRequest):
+    """
+    Upload a clothing image once and get a content-addressed garment ID
+    Other endpoints accept garmentId in place of the base64 clothingImage
+    """
+    try:
+        image_bytes = decode_image_data(request.clothingImage)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': f"Invalid image data: {str(e)}"})
+    
+    try:
+        loop = asyncio.get_event_loop()
+        garment_id = await loop.run_in_executor(executor, upload_store.put, image_bytes)
+        return {
+            'success': True,
+            'garment_id': garment_id
+        }
+    except Exception as e:
+        print(f"❌ Upload failed: {e}")
+        raise HTTPException(status_code=400, detail={'success': False, 'error': f"Upload failed: {str(e)}"})
+
 @app.post("/api/check-clothing")
 async def check_clothing(request: ClothingCheckRequest):
     """
     Clothing validation endpoint
     Checks if the uploaded image contains exactly one piece of top clothing
     """
+    loop = asyncio.get_event_loop()
+    
+    if request.garmentId or not request.clothingImage:
+        clothing_filepath, _ = resolve_clothing_image(request.clothingImage, request.garmentId)
+        return await check_clothing_result(check_cloth_validity, clothing_filepath)
+    
+    # Inline images are validated from memory, they never need to touch the disk
     try:
-        # Process image data
-        clothing_filepath = process_image_data(request.clothingImage)
-        
-        # Check clothing validity
-        check_result = check_cloth_validity(clothing_filepath)
-        
-        # Clean up temporary file
-        cleanup_temp_file(clothing_filepath)
+        jpeg_bytes = await loop.run_in_executor(
+            executor, prepare_image_bytes, decode_image_data(request.clothingImage)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': f"Invalid image data: {str(e)}"})
+    return await check_clothing_result(check_cloth_validity_bytes, jpeg_bytes)
+
+@app.post("/api/check-clothing/upload")
+async def check_clothing_upload(request: Request):
+    """
+    Same as /api/check-clothing, with the image streamed as multipart/form-data
+    (file field "clothing") or as a raw image body
+    """
+    filepath, _ = await receive_clothing_upload(request)
+    try:
+        return await check_clothing_result(check_cloth_validity, filepath)
+    finally:
+        cleanup_temp_file(filepath)
+
+async def check_clothing_result(check, image):
+    """Run a clothing check in the thread pool and build the response"""
+    try:
+        # Check clothing validity in the thread pool so the event loop stays free
+        loop = asyncio.get_event_loop()
+        check_result = await loop.run_in_executor(executor, check, image)
         
         # Return result
         return {
@@ -420,23 +1072,37 @@ async def check_clothing(request: ClothingCheckRequest):
 @app.post("/api/merge-clothing-only")
 async def merge_clothing_only(request: MergeClothingRequest):
     """
-    Perform image merge only, requires model image path and clothing image
+    Perform image merge only, requires model image path and clothing image (or garment ID)
     """
+    # Process clothing image data
+    filepath, is_temporary = resolve_clothing_image(request.clothingImage, request.garmentId)
+    return await merge_clothing_for_file(filepath, is_temporary, request)
+
+@app.post("/api/merge-clothing-only/upload")
+async def merge_clothing_only_upload(request: Request):
+    """
+    Same as /api/merge-clothing-only, with the clothing image streamed as multipart/form-data
+    (file field "clothing", other parameters as form fields) or as a raw image body
+    (parameters in the query string)
+    """
+    filepath, fields = await receive_clothing_upload(request)
+    try:
+        merge_request = MergeClothingRequest(**fields)
+    except ValidationError as e:
+        cleanup_temp_file(filepath)
+        raise HTTPException(status_code=400, detail={'success': False, 'error': f"Invalid parameters: {str(e)}"})
+    return await merge_clothing_for_file(filepath, True, merge_request)
+
+async def merge_clothing_for_file(filepath: str, is_temporary: bool, request: MergeClothingRequest):
+    """Merge a resolved clothing file onto the requested model image and build the response"""
     try:
-        # Process clothing image data
-        filepath = process_image_data(request.clothingImage)
-        
         model_image_path = request.modelImagePath
         
         print("👕 Starting clothing merge...")
         
-        from function_agents import merge_model_with_clothing
+        from function_agents import merge_model_with_clothing_async
         
-        # Use thread pool for merge task with all parameters
-        loop = asyncio.get_event_loop()
-        final_result = await loop.run_in_executor(
-            executor, 
-            merge_model_with_clothing, 
+        final_result = await merge_model_with_clothing_async(
             model_image_path, 
             filepath,
             request.shot_type or "全身",
@@ -445,9 +1111,6 @@ async def merge_clothing_only(request: MergeClothingRequest):
             request.scene_description or "简约工作室背景"
         )
         
-        # Clean up temporary files
-        cleanup_temp_file(filepath)
-        
         # Extract actual image path from agent result
         final_image_path = extract_image_path(final_result)
         
@@ -480,30 +1143,135 @@ async def merge_clothing_only(request: MergeClothingRequest):
                 'error': str(e)
             }
         )
+    finally:
+        # Clean up temporary files
+        if is_temporary:
+            cleanup_temp_file(filepath)
 
 # File service endpoints
-@app.get("/api/get-image/{filename:path}")
-async def get_image(filename: str):
-    """Get generated image"""
+def image_etag(stat_result: os.stat_result) -> str:
+    """Strong ETag of an image file; files are never rewritten in place, so size and mtime identify the content"""
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+def is_not_modified(request: Request, etag: str, stat_result: os.stat_result) -> bool:
+    """Evaluate If-None-Match (or, without it, If-Modified-Since) against the file"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        # GET and HEAD use the weak comparison, so W/"x" matches "x"
+        return '*' in tags or any(tag.removeprefix('W/') == etag for tag in tags)
+    
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return since.timestamp() >= int(stat_result.st_mtime)
+    return False
+
+def stat_image(path: str) -> os.stat_result:
+    """Stat an image file, raising 404 if it is missing or not a file"""
     try:
-        if os.path.exists(filename):
-            return FileResponse(filename, media_type='image/jpeg')
-        else:
-            raise HTTPException(status_code=404, detail={'error': 'Image not found'})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail={'error': str(e)})
+        stat_result = os.stat(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail={'error': 'Image not found'})
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail={'error': 'Image not found'})
+    return stat_result
+
+def image_headers(etag: str, stat_result: os.stat_result, cache_control: str, vary: Optional[str] = None) -> Dict[str, str]:
+    """Validator and caching headers of an image response"""
+    headers = {
+        'ETag': etag,
+        'Cache-Control': cache_control,
+        'Last-Modified': formatdate(stat_result.st_mtime, usegmt=True)
+    }
+    if vary:
+        headers['Vary'] = vary
+    return headers
 
-@app.get("/imgs/{filename}")
-async def serve_imgs(filename: str):
-    """Serve images from imgs folder"""
+def image_file_response(request: Request, path: str, cache_control: str, vary: Optional[str] = None):
+    """
+    Serve an image file with validators and caching headers
+    
+    Answers conditional requests with 304; Range and HEAD requests are
+    handled by FileResponse.
+    """
+    stat_result = stat_image(path)
+    etag = image_etag(stat_result)
+    headers = image_headers(etag, stat_result, cache_control, vary)
+    if is_not_modified(request, etag, stat_result):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers, stat_result=stat_result)
+
+@app.api_route("/api/get-image/{filename:path}", methods=["GET", "HEAD"])
+async def get_image(filename: str, request: Request):
+    """Get generated image"""
+    if filename.startswith(f"{IMAGE_FOLDER}/"):
+        filename = await fetch_image_async(filename) or filename
+    return image_file_response(request, filename, REVALIDATE_CACHE_CONTROL)
+
+@app.api_route("/imgs/{filename}", methods=["GET", "HEAD"])
+async def serve_imgs(filename: str, request: Request, w: Optional[int] = None, h: Optional[int] = None):
+    """
+    Serve images from imgs folder
+    
+    `w`/`h` fit the image within that size (rounded up to an allowed size),
+    and clients that accept AVIF or WebP get that instead of JPEG. Such
+    derivatives are made once in the derivative pool and cached on disk.
+    
+    With shared (S3) artifact storage, requests for the original image are
+    redirected to a presigned URL, and images made on other nodes are
+    fetched into the local cache when a derivative is needed.
+    """
     try:
-        img_path = os.path.join('imgs', filename)
-        if os.path.exists(img_path):
-            return FileResponse(img_path, media_type='image/jpeg')
-        else:
-            raise HTTPException(status_code=404, detail={'error': 'Image not found'})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail={'error': str(e)})
+        width, height = snap_size(w), snap_size(h)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': str(e)})
+    fmt = choose_format(request.headers.get('accept'))
+    # The same URL serves different formats depending on the Accept header
+    vary = 'Accept' if len(FORMATS) > 1 else None
+    
+    store = get_artifact_store()
+    if store.remote and ARTIFACT_REDIRECT and width is None and height is None and fmt == 'jpeg':
+        headers = {'Cache-Control': f"private, max-age={store.presign_seconds // 2}"}
+        if vary:
+            headers['Vary'] = vary
+        return RedirectResponse(store.url(image_key(filename)), status_code=307, headers=headers)
+    
+    img_path = resolve_image_path(filename)
+    if img_path is None and store.remote:
+        img_path = await fetch_image_async(filename)
+    img_path = img_path or os.path.join(IMAGE_FOLDER, filename)
+    if width is None and height is None and fmt == 'jpeg':
+        response = image_file_response(request, img_path, IMMUTABLE_CACHE_CONTROL, vary)
+        touch_access(img_path)
+        return response
+    
+    source_stat = stat_image(img_path)
+    touch_access(img_path, source_stat)
+    key = derivative_key(source_stat, width, height, fmt)
+    headers = image_headers(f'"{key}"', source_stat, IMMUTABLE_CACHE_CONTROL, vary)
+    # Revalidation never needs the derivative itself
+    if is_not_modified(request, headers['ETag'], source_stat):
+        return Response(status_code=304, headers=headers)
+    
+    path = derivative_path(img_path, key, fmt)
+    if not os.path.exists(path):
+        loop = asyncio.get_running_loop()
+        
+        async def derive():
+            return await loop.run_in_executor(derivative_executor, make_derivative, img_path, path, width, height, fmt)
+        
+        try:
+            await derivative_flight.run(path, derive)
+        except OSError as e:
+            print(f"❌ Image derivative failed for {img_path}: {e}")
+            raise HTTPException(status_code=500, detail={'error': str(e)})
+    derivative_stat = os.stat(path)
+    touch_access(path, derivative_stat)
+    return FileResponse(path, headers=headers, media_type=FORMATS[fmt][1], stat_result=derivative_stat)
 
 # Status and test endpoints
 @app.get("/api/status")
@@ -542,6 +1310,14 @@ async def test_agents():
             }
         )
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in the text exposition format"""
+    loop = asyncio.get_event_loop()
+    # Collectors read SQLite-backed stats, so render off the event loop
+    body = await loop.run_in_executor(None, render_metrics)
+    return Response(content=body, media_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Root path
 @app.get("/")
 async def root():
@@ -551,30 +1327,36 @@ async def root():
         "version": "1.0.0",
         "endpoints": [
             "/api/generate-model",
+            "/api/generate-model/upload",
+            "/api/jobs",
+            "/api/jobs/{job_id}",
+            "/api/uploads",
             "/api/generate-step-by-step",
+            "/api/generate-step-by-step/stream",
             "/api/generate-model-only",
+            "/api/tryon/batch",
             "/api/check-clothing",
+            "/api/check-clothing/upload",
             "/api/merge-clothing-only",
+            "/api/merge-clothing-only/upload",
             "/api/status",
-            "/api/test-agents"
+            "/api/test-agents",
+            "/metrics"
         ]
     }
 
 # General file service (placed last to avoid matching conflicts)
-@app.get("/{filename:path}")
-async def serve_static_files(filename: str):
+@app.api_route("/{filename:path}", methods=["GET", "HEAD"])
+async def serve_static_files(filename: str, request: Request):
     """Serve static files for accessing generated images"""
     # Skip known API paths and root path
     if filename == "" or filename.startswith("api/") or filename.startswith("docs") or filename.startswith("openapi.json"):
         raise HTTPException(status_code=404, detail={'error': 'Not found'})
     
-    try:
-        if os.path.exists(filename):
-            return FileResponse(filename, media_type='image/jpeg')
-        else:
-            raise HTTPException(status_code=404, detail={'error': 'File not found'})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail={'error': str(e)})
+    if filename.startswith(f"{IMAGE_FOLDER}/"):
+        filename = await fetch_image_async(filename) or filename
+        return image_file_response(request, filename, IMMUTABLE_CACHE_CONTROL)
+    return image_file_response(request, filename, REVALIDATE_CACHE_CONTROL)
 
 if __name__ == '__main__':
     import uvicorn
@@ -582,10 +1364,15 @@ if __name__ == '__main__':
     print("🚀 Starting virtual try-on system backend service with FastAPI...")
     print("📍 API URL: http://localhost:8000")
     print("🎨 Main endpoint: /api/generate-model")
+    print("📥 Async job endpoints: POST /api/jobs, GET /api/jobs/{job_id}")
     print("⚡ Step-by-step endpoint: /api/generate-step-by-step")
+    print("📡 Streaming progress (SSE): /api/generate-step-by-step/stream")
+    print("🧺 Batch try-on (SSE): /api/tryon/batch")
+    print("📤 Streaming multipart uploads: /api/generate-model/upload, /api/check-clothing/upload, /api/merge-clothing-only/upload")
     print("📷 Image access: /imgs/<filename> or /<image_path>")
     print("🔍 Test endpoint: /api/test-agents")
     print("📊 Status endpoint: /api/status")
+    print("📈 Prometheus metrics: /metrics")
     print("\n💡 Three-agent process:")
     print("   1. ModelDescriptionAgent - Generate model description")
     print("   2. ModelGenerationAgent - Generate model image")
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Cassette Proxy
+Records real OpenAI traffic into a cassette and replays it, for reproducible
+end-to-end runs without network access or API credit.
+
+    record   Forwards every request to the real API and appends the
+             request/response pair and its upstream time to the cassette
+    replay   Answers from the cassette, after the recorded time or at once
+
+Point the service (or benchmarks/replay_tryon.py) at the proxy with
+OPENAI_BASE_URL=http://localhost:8200/v1. It covers every agent and the
+clothing check, since they all go through that base URL.
+
+A cassette is a directory holding interactions.jsonl and images/, where
+every image (returned b64_json payloads) is stored once, named by its
+SHA-256. Requests are matched on method, path and body, with volatile
+parts normalized: generated file paths, multipart boundaries and file
+names, and embedded images (compared by hash). Identical requests replay
+their recordings in order.
+
+Usage:
+    python benchmarks/cassettes.py record cassettes/tryon --port 8200
+    python benchmarks/cassettes.py replay cassettes/tryon --port 8200 --timing zero
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# Paths of generated and uploaded files differ on every run
+_VOLATILE_PATH = re.compile(r'(?:[\w./-]*/)?(?:imgs|uploads)/[\w./-]+?\.(?:jpg|jpeg|png|webp)')
+_DATA_URL = re.compile(r'data:image/[\w.+-]+;base64,([A-Za-z0-9+/=]+)')
+_BOUNDARY = re.compile(r'boundary="?([^";]+)"?')
+# Response headers worth replaying; everything else is connection specific
+_REPLAY_HEADERS = ('content-type', 'retry-after', 'retry-after-ms')
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _normalize_text(text: str) -> str:
+    text = _DATA_URL.sub(lambda match: f"data:image;sha256={sha256(match.group(1).encode())}", text)
+    return _VOLATILE_PATH.sub('<file>', text)
+
+
+def _normalize_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _normalize_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize_json(item) for item in value]
+    if isinstance(value, str):
+        return _normalize_text(value)
+    return value
+
+
+def _normalize_multipart(body: bytes, content_type: str) -> List[Dict]:
+    """Multipart parts as (field name, content hash), ignoring the random boundary and file names"""
+    match = _BOUNDARY.search(content_type)
+    if not match:
+        return [{'sha256': sha256(body)}]
+    parts = []
+    for chunk in body.split(b'--' + match.group(1).encode()):
+        head, _, content = chunk.partition(b'\r\n\r\n')
+        name = re.search(rb'name="([^"]*)"', head)
+        if name is None:
+            continue
+        content = content[:-2] if content.endswith(b'\r\n') else content
+        if b'filename=' in head:
+            parts.append({'name': name.group(1).decode(), 'sha256': sha256(content)})
+        else:
+            parts.append({'name': name.group(1).decode(), 'value': _normalize_text(content.decode('utf-8', 'replace'))})
+    return sorted(parts, key=lambda part: (part['name'], json.dumps(part, sort_keys=True)))
+
+
+def request_key(method: str, path: str, content_type: str, body: bytes) -> Tuple[str, Any]:
+    """Match key of a request and the normalized body it was computed from"""
+    if 'multipart/form-data' in content_type:
+        normalized = _normalize_multipart(body, content_type)
+    elif body:
+        try:
+            normalized = _normalize_json(json.loads(body))
+        except ValueError:
+            normalized = {'sha256': sha256(body)}
+    else:
+        normalized = None
+    material = json.dumps({'method': method, 'path': path, 'body': normalized}, sort_keys=True, ensure_ascii=False)
+    return sha256(material.encode()), normalized
+
+
+class Cassette:
+    """Interactions file plus a content-addressed image folder"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.image_folder = os.path.join(folder, 'images')
+        self.path = os.path.join(folder, 'interactions.jsonl')
+        self._lock = threading.Lock()
+
+    def _store_images(self, value: Any) -> Any:
+        """Move b64_json payloads into image files, leaving {"$image": sha256} references"""
+        if isinstance(value, dict):
+            stored = {}
+            for key, item in value.items():
+                if key == 'b64_json' and isinstance(item, str):
+                    data = base64.b64decode(item)
+                    digest = sha256(data)
+                    image_path = os.path.join(self.image_folder, digest)
+                    if not os.path.exists(image_path):
+                        with open(image_path, 'wb') as f:
+                            f.write(data)
+                    stored[key] = {'$image': digest}
+                else:
+                    stored[key] = self._store_images(item)
+            return stored
+        if isinstance(value, list):
+            return [self._store_images(item) for item in value]
+        return value
+
+    def _load_images(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            if set(value) == {'$image'}:
+                with open(os.path.join(self.image_folder, value['$image']), 'rb') as f:
+                    return base64.b64encode(f.read()).decode('ascii')
+            return {key: self._load_images(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._load_images(item) for item in value]
+        return value
+
+    def append(self, interaction: Dict, response_body: bytes) -> None:
+        """Record one interaction; JSON response bodies have their images stored separately"""
+        try:
+            interaction['response'] = {'json': self._store_images(json.loads(response_body))}
+        except ValueError:
+            interaction['response'] = {'text': response_body.decode('utf-8', 'replace')}
+        with self._lock:
+            os.makedirs(self.image_folder, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(interaction, ensure_ascii=False) + '\n')
+
+    def load(self) -> Dict[str, List[Dict]]:
+        """Interactions by request key, in recorded order"""
+        interactions: Dict[str, List[Dict]] = defaultdict(list)
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    interactions[interaction['key']].append(interaction)
+        return interactions
+
+    def response_body(self, interaction: Dict) -> bytes:
+        response = interaction['response']
+        if 'json' in response:
+            return json.dumps(self._load_images(response['json'])).encode()
+        return response['text'].encode()
+
+
+def create_record_app(cassette: Cassette, upstream: str) -> FastAPI:
+    app = FastAPI(title="Cassette Recorder")
+    client = httpx.AsyncClient(base_url=upstream, timeout=httpx.Timeout(600, connect=10))
+    stats = {'recorded': 0}
+
+    @app.get("/cassette/stats")
+    async def cassette_stats():
+        return {'mode': 'record', 'cassette': cassette.folder, **stats}
+
+    @app.api_route("/v1/{path:path}", methods=["GET", "POST", "DELETE"])
+    async def record(path: str, request: Request):
+        body = await request.body()
+        content_type = request.headers.get('content-type', '')
+        key, normalized = request_key(request.method, f"/v1/{path}", content_type, body)
+        # Uncompressed, so recorded bodies are plain JSON
+        headers = {name: value for name, value in request.headers.items()
+                   if name not in ('host', 'content-length', 'accept-encoding')}
+        started = time.perf_counter()
+        response = await client.request(request.method, f"/v1/{path}", params=request.query_params,
+                                        content=body, headers=headers)
+        elapsed = time.perf_counter() - started
+        interaction = {
+            'key': key,
+            'method': request.method,
+            'path': f"/v1/{path}",
+            'request': normalized,
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in _REPLAY_HEADERS if name in response.headers},
+            'elapsed': round(elapsed, 4),
+            'recorded_at': time.time()
+        }
+        await asyncio.get_running_loop().run_in_executor(None, cassette.append, interaction, response.content)
+        stats['recorded'] += 1
+        print(f"📼 Recorded {request.method} /v1/{path} -> {response.status_code} ({elapsed:.2f}s)")
+        return Response(content=response.content, status_code=response.status_code,
+                        headers=interaction['headers'])
+
+    @app.on_event("shutdown")
+    async def close_client():
+        await client.aclose()
+
+    return app
+
+
+def create_replay_app(cassette: Cassette, timing: str, time_scale: float) -> FastAPI:
+    app = FastAPI(title="Cassette Player")
+    interactions = cassette.load()
+    positions: Dict[str, int] = defaultdict(int)
+    stats = {'replayed': 0, 'misses': 0, 'missed_requests': []}
+    print(f"📼 Loaded {sum(len(items) for items in interactions.values())} interactions from {cassette.path}")
+
+    @app.get("/cassette/stats")
+    async def cassette_stats():
+        return {'mode': 'replay', 'cassette': cassette.folder, 'timing': timing, **stats}
+
+    @app.api_route("/v1/{path:path}", methods=["GET", "POST", "DELETE"])
+    async def replay(path: str, request: Request):
+        body = await request.body()
+        key, normalized = request_key(request.method, f"/v1/{path}", request.headers.get('content-type', ''), body)
+        recorded = interactions.get(key)
+        if not recorded:
+            stats['misses'] += 1
+            stats['missed_requests'].append({'method': request.method, 'path': f"/v1/{path}", 'key': key})
+            print(f"⚠️ No recorded interaction for {request.method} /v1/{path} ({key[:12]})")
+            # Not retryable, so a miss fails the run instead of being retried
+            return JSONResponse(status_code=400, content={'error': {
+                'message': f"No recorded interaction for {request.method} /v1/{path}",
+                'type': 'cassette_miss', 'code': None
+            }})
+
+        # Identical requests get their recordings in order; the last one repeats
+        interaction = recorded[min(positions[key], len(recorded) - 1)]
+        positions[key] += 1
+        if timing == 'recorded':
+            await asyncio.sleep(interaction['elapsed'] * time_scale)
+        stats['replayed'] += 1
+        return Response(content=cassette.response_body(interaction), status_code=interaction['status'],
+                        headers=interaction['headers'])
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=('record', 'replay'))
+    parser.add_argument('cassette', help="Cassette directory")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8200)
+    parser.add_argument('--upstream', default='https://api.openai.com', help="API recorded from")
+    parser.add_argument('--timing', choices=('recorded', 'zero'), default='recorded',
+                        help="Replay after each interaction's recorded upstream time, or at once")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Scale recorded times when replaying")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    cassette = Cassette(args.cassette)
+    if args.mode == 'record':
+        os.makedirs(cassette.image_folder, exist_ok=True)
+        app = create_record_app(cassette, args.upstream)
+        print(f"📼 Recording {args.upstream} into {args.cassette} on http://{args.host}:{args.port}/v1")
+    else:
+        if not os.path.exists(cassette.path):
+            raise SystemExit(f"No cassette at {cassette.path}; record one first")
+        app = create_replay_app(cassette, args.timing, args.time_scale)
+        print(f"📼 Replaying {args.cassette} ({args.timing} timing) on http://{args.host}:{args.port}/v1")
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Ingest Micro-benchmark
+Compares the old upload path (decode, convert, re-encode, write, re-read for
+validation) with the zero-copy path (pass RGB JPEGs through, validate from
+memory) for 1-16 MB uploads
+
+Peak memory is read from /proc (Linux only) and reported as n/a elsewhere.
+
+Usage:
+    python benchmarks/ingest_benchmark.py [--repeat 5]
+"""
+
+import argparse
+import base64
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from upload_store import normalize_image, prepare_image_bytes
+
+SIZES_MB = (1, 2, 4, 8, 16)
+
+
+def make_jpeg(target_bytes: int) -> bytes:
+    """Encode a noise image (incompressible, like a detailed photo) of roughly the target size"""
+    # Noise at quality 95 costs a little over 1 byte per pixel
+    side = int((target_bytes / 1.1) ** 0.5)
+    pixels = random.Random(0).randbytes(side * side * 3)
+    output = BytesIO()
+    Image.frombytes('RGB', (side, side), pixels).save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+
+def old_path(payload: str, folder: str) -> str:
+    """process_image_data + check_single_cloth before the change"""
+    image_data = payload.split(',')[1] if payload.startswith('data:image') else payload
+    image = normalize_image(Image.open(BytesIO(base64.b64decode(image_data))))
+    filepath = os.path.join(folder, 'upload.jpg')
+    image.save(filepath, format="JPEG", quality=90)
+    with open(filepath, 'rb') as f:
+        return base64.b64encode(f.read()).decode('utf-8')
+
+
+def new_path(payload: str, folder: str) -> str:
+    """Inline check-clothing after the change: nothing is written to disk"""
+    image_data = payload.split(',')[1] if payload.startswith('data:image') else payload
+    jpeg_bytes = prepare_image_bytes(base64.b64decode(image_data))
+    return base64.b64encode(jpeg_bytes).decode('utf-8')
+
+
+PATHS = {'old': old_path, 'new': new_path}
+
+
+def _memory_kb(field: str) -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def _peak_rss_child(path_name: str, payload_file: str, queue) -> None:
+    with open(payload_file, 'r') as f:
+        payload = f.read()
+    with tempfile.TemporaryDirectory() as folder:
+        # Reset the high-water mark so only this run counts (Linux only)
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        before = _memory_kb('VmRSS')
+        PATHS[path_name](payload, folder)
+        peak = _memory_kb('VmHWM')
+    queue.put((peak - before) / 1024)
+
+
+def peak_rss_mb(path_name: str, payload_file: str) -> Optional[float]:
+    """Extra peak RSS of one run, measured in a fresh process, or None without /proc"""
+    if not os.path.exists('/proc/self/clear_refs'):
+        return None
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_peak_rss_child, args=(path_name, payload_file, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def format_mb(value: Optional[float]) -> str:
+    return 'n/a' if value is None else f"{value:.1f}"
+
+
+def median_seconds(path_name: str, payload: str, repeat: int) -> float:
+    timings = []
+    with tempfile.TemporaryDirectory() as folder:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            PATHS[path_name](payload, folder)
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image ingest path")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case (median is reported)")
+    args = parser.parse_args()
+
+    print(f"{'input':>8} | {'old ms':>8} | {'new ms':>8} | {'speedup':>7} | {'old peak MB':>11} | {'new peak MB':>11}")
+    print("-" * 70)
+    with tempfile.TemporaryDirectory() as folder:
+        for size_mb in SIZES_MB:
+            jpeg = make_jpeg(size_mb * 1024 * 1024)
+            payload = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode('utf-8')
+            payload_file = os.path.join(folder, f'payload_{size_mb}.txt')
+            with open(payload_file, 'w') as f:
+                f.write(payload)
+
+            old_s = median_seconds('old', payload, args.repeat)
+            new_s = median_seconds('new', payload, args.repeat)
+            old_mb = peak_rss_mb('old', payload_file)
+            new_mb = peak_rss_mb('new', payload_file)
+            print(f"{len(jpeg) / 1024 / 1024:>6.1f}MB | {old_s * 1000:>8.1f} | {new_s * 1000:>8.1f} | "
+                  f"{old_s / new_s:>6.1f}x | {format_mb(old_mb):>11} | {format_mb(new_mb):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Load Test
+Drives every api_server.py endpoint against the mock OpenAI server and reports
+throughput, p50/p95/p99 latency, errors, and the server's CPU time and peak
+memory, for each combination of uvicorn worker count and request executor
+size. No API credit is used.
+
+For every combination a fresh mock server and API server are started in a
+temporary working directory (cold caches), each scenario is run with the
+given concurrency, and both servers are stopped again.
+
+Usage:
+    python benchmarks/load_test.py --time-scale 0.05 --requests 40 --concurrency 8
+    python benchmarks/load_test.py --workers 1,2,4 --executor-sizes 4,16 --scenarios check-clothing,generate-model
+    python benchmarks/load_test.py --target http://localhost:8000   # an already running server
+
+Mock server options (--time-scale, --error-rate, --latency ...) are passed
+through to benchmarks/mock_openai.py. Resource usage is read from /proc
+(Linux only).
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from PIL import Image
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_SERVER = os.path.join(REPO_ROOT, 'benchmarks', 'mock_openai.py')
+
+MODEL_PARAMS = {
+    'gender': 'female',
+    'age': 25,
+    'nationality': 'Chinese',
+    'height': 170,
+    'weight': 60,
+    'actionDescription': '自然站立姿势',
+    'sceneDescription': '简约工作室背景'
+}
+
+
+# ---- Fixtures ----
+
+def make_garment(seed: int, size: int) -> bytes:
+    """A distinct garment-sized JPEG, so content-addressed caches do not collapse the load"""
+    rng = random.Random(seed)
+    image = Image.effect_noise((size, size), 40).convert('RGB')
+    tint = Image.new('RGB', (size, size), tuple(rng.randrange(256) for _ in range(3)))
+    output = BytesIO()
+    Image.blend(image, tint, 0.6).save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+class Fixtures:
+    """Inputs shared by the scenarios: garments, uploaded garment IDs and a model image"""
+
+    def __init__(self, garment_count: int, garment_size: int, bypass_model_cache: bool):
+        self.garments = [make_garment(seed, garment_size) for seed in range(garment_count)]
+        self.garments_b64 = [base64.b64encode(garment).decode('ascii') for garment in self.garments]
+        self.bypass_model_cache = bypass_model_cache
+        self.garment_ids: List[str] = []
+        self.model_image_path: Optional[str] = None
+        self.model_image_url: Optional[str] = None
+        self._next = 0
+
+    def next_index(self) -> int:
+        self._next += 1
+        return self._next % len(self.garments)
+
+    def model_params(self) -> Dict:
+        return {**MODEL_PARAMS, 'bypassModelCache': self.bypass_model_cache}
+
+    def model_fields(self) -> Dict[str, str]:
+        fields = {key: str(value) for key, value in MODEL_PARAMS.items()}
+        fields['bypassModelCache'] = 'true' if self.bypass_model_cache else 'false'
+        return fields
+
+    async def prepare(self, client: httpx.AsyncClient) -> None:
+        """Upload the garments once and generate the model image merge scenarios reuse"""
+        for garment in self.garments_b64:
+            response = await client.post('/api/uploads', json={'clothingImage': garment})
+            response.raise_for_status()
+            self.garment_ids.append(response.json()['garment_id'])
+        response = await client.post('/api/generate-model-only', json=MODEL_PARAMS)
+        response.raise_for_status()
+        model_image = response.json()['result']['model_image']
+        self.model_image_path = model_image['image_path']
+        self.model_image_url = model_image['image_url']
+
+
+# ---- Scenarios: one request (or request flow) each, returning whether it succeeded ----
+
+def _ok(response: httpx.Response) -> bool:
+    return response.status_code < 400 and response.json().get('success', True) is not False
+
+
+async def _read_sse(client: httpx.AsyncClient, path: str, body: Dict) -> bool:
+    async with client.stream('POST', path, json=body) as response:
+        if response.status_code >= 400:
+            return False
+        events = [line async for line in response.aiter_lines() if line.startswith('event: ')]
+    return events[-1:] == ['event: result']
+
+
+async def scenario_status(client, fixtures):
+    return _ok(await client.get('/api/status'))
+
+
+async def scenario_metrics(client, fixtures):
+    return (await client.get('/metrics')).status_code == 200
+
+
+async def scenario_image(client, fixtures):
+    response = await client.get(fixtures.model_image_url)
+    return response.status_code == 200
+
+
+async def scenario_image_derivative(client, fixtures):
+    response = await client.get(f"{fixtures.model_image_url}?w=384", headers={'Accept': 'image/webp,*/*'})
+    return response.status_code == 200
+
+
+async def scenario_uploads(client, fixtures):
+    garment = fixtures.garments_b64[fixtures.next_index()]
+    return _ok(await client.post('/api/uploads', json={'clothingImage': garment}))
+
+
+async def scenario_check_clothing(client, fixtures):
+    garment = fixtures.garments_b64[fixtures.next_index()]
+    return _ok(await client.post('/api/check-clothing', json={'clothingImage': garment}))
+
+
+async def scenario_check_clothing_upload(client, fixtures):
+    garment = fixtures.garments[fixtures.next_index()]
+    return _ok(await client.post('/api/check-clothing/upload', files={'clothing': ('garment.jpg', garment, 'image/jpeg')}))
+
+
+async def scenario_generate_model(client, fixtures):
+    body = {**fixtures.model_params(), 'clothingImage': fixtures.garments_b64[fixtures.next_index()]}
+    return _ok(await client.post('/api/generate-model', json=body))
+
+
+async def scenario_generate_model_upload(client, fixtures):
+    garment = fixtures.garments[fixtures.next_index()]
+    return _ok(await client.post('/api/generate-model/upload', data=fixtures.model_fields(),
+                                 files={'clothing': ('garment.jpg', garment, 'image/jpeg')}))
+
+
+async def scenario_generate_model_only(client, fixtures):
+    return _ok(await client.post('/api/generate-model-only', json=fixtures.model_params()))
+
+
+async def scenario_step_by_step(client, fixtures):
+    body = {**fixtures.model_params(), 'garmentId': fixtures.garment_ids[fixtures.next_index()]}
+    return _ok(await client.post('/api/generate-step-by-step', json=body))
+
+
+async def scenario_step_by_step_stream(client, fixtures):
+    body = {**fixtures.model_params(), 'garmentId': fixtures.garment_ids[fixtures.next_index()]}
+    return await _read_sse(client, '/api/generate-step-by-step/stream', body)
+
+
+async def scenario_merge(client, fixtures):
+    body = {'modelImagePath': fixtures.model_image_path, 'garmentId': fixtures.garment_ids[fixtures.next_index()]}
+    return _ok(await client.post('/api/merge-clothing-only', json=body))
+
+
+async def scenario_merge_upload(client, fixtures):
+    garment = fixtures.garments[fixtures.next_index()]
+    return _ok(await client.post('/api/merge-clothing-only/upload', data={'modelImagePath': fixtures.model_image_path},
+                                 files={'clothing': ('garment.jpg', garment, 'image/jpeg')}))
+
+
+async def scenario_jobs(client, fixtures):
+    """Submit a job and poll it to completion; the latency is the end-to-end job time"""
+    body = {**fixtures.model_params(), 'garmentId': fixtures.garment_ids[fixtures.next_index()]}
+    response = await client.post('/api/jobs', json=body)
+    if not _ok(response):
+        return False
+    job_id = response.json()['job_id']
+    while True:
+        await asyncio.sleep(0.2)
+        job = (await client.get(f"/api/jobs/{job_id}")).json()['job']
+        if job['status'] in ('completed', 'failed'):
+            return job['status'] == 'completed'
+
+
+def scenario_batch(batch_size: int) -> Callable:
+    async def run(client, fixtures):
+        start = fixtures.next_index()
+        garments = [{'garmentId': fixtures.garment_ids[(start + i) % len(fixtures.garment_ids)]}
+                    for i in range(batch_size)]
+        body = {**fixtures.model_params(), 'garments': garments, 'modelImagePath': fixtures.model_image_path}
+        return await _read_sse(client, '/api/tryon/batch', body)
+    return run
+
+
+def build_scenarios(batch_size: int) -> Dict[str, Callable[[httpx.AsyncClient, Fixtures], Awaitable[bool]]]:
+    return {
+        'status': scenario_status,
+        'metrics': scenario_metrics,
+        'image': scenario_image,
+        'image-derivative': scenario_image_derivative,
+        'uploads': scenario_uploads,
+        'check-clothing': scenario_check_clothing,
+        'check-clothing/upload': scenario_check_clothing_upload,
+        'generate-model': scenario_generate_model,
+        'generate-model/upload': scenario_generate_model_upload,
+        'generate-model-only': scenario_generate_model_only,
+        'generate-step-by-step': scenario_step_by_step,
+        'generate-step-by-step/stream': scenario_step_by_step_stream,
+        'merge-clothing-only': scenario_merge,
+        'merge-clothing-only/upload': scenario_merge_upload,
+        'jobs': scenario_jobs,
+        'tryon/batch': scenario_batch(batch_size)
+    }
+
+
+# ---- Resource usage of the server process tree (Linux /proc) ----
+
+def _process_tree(pid: int) -> List[int]:
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _cpu_seconds(pid: int) -> float:
+    with open(f'/proc/{pid}/stat') as f:
+        # Fields after the parenthesized command name; utime and stime are fields 14 and 15
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def _rss_mb(pid: int) -> float:
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class ResourceSampler:
+    """Samples CPU time and RSS of a process and its children in a background thread"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_mb = 0.0
+        self._cpu: Dict[int, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        total_rss = 0.0
+        for pid in _process_tree(self.pid):
+            try:
+                self._cpu[pid] = _cpu_seconds(pid)
+                total_rss += _rss_mb(pid)
+            except OSError:
+                continue
+        self.peak_rss_mb = max(self.peak_rss_mb, total_rss)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "ResourceSampler":
+        if self.pid is not None and os.path.exists('/proc'):
+            self._sample()
+            self._cpu_before = sum(self._cpu.values())
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+
+    @property
+    def cpu_seconds(self) -> Optional[float]:
+        if self._thread is None:
+            return None
+        return sum(self._cpu.values()) - self._cpu_before
+
+
+# ---- Running scenarios ----
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client: httpx.AsyncClient,
+                       scenario: Callable,
+                       fixtures: Fixtures,
+                       requests: int,
+                       concurrency: int,
+                       pid: Optional[int]) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                ok = await scenario(client, fixtures)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    with ResourceSampler(pid) as sampler:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+        'cpu_seconds': round(sampler.cpu_seconds, 2) if sampler.cpu_seconds is not None else None,
+        'peak_rss_mb': round(sampler.peak_rss_mb, 1) if sampler.cpu_seconds is not None else None
+    }
+
+
+async def run_suite(base_url: str, args: argparse.Namespace, pid: Optional[int]) -> Dict[str, Dict]:
+    scenarios = build_scenarios(args.batch_size)
+    names = list(scenarios) if args.scenarios == 'all' else args.scenarios.split(',')
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (available: {', '.join(scenarios)})")
+
+    fixtures = Fixtures(args.garments, args.garment_size, args.bypass_model_cache)
+    limits = httpx.Limits(max_connections=args.concurrency + 8, max_keepalive_connections=args.concurrency + 8)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        await fixtures.prepare(client)
+        results = {}
+        for name in names:
+            results[name] = await run_scenario(client, scenarios[name], fixtures, args.requests, args.concurrency, pid)
+            print_row(name, results[name])
+    return results
+
+
+def print_header() -> None:
+    print(f"{'scenario':<30} {'reqs':>5} {'errs':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'cpu s':>7} {'rss MB':>7}")
+    print('-' * 98)
+
+
+def print_row(name: str, result: Dict) -> None:
+    cpu = f"{result['cpu_seconds']:.2f}" if result['cpu_seconds'] is not None else 'n/a'
+    rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] is not None else 'n/a'
+    print(f"{name:<30} {result['requests']:>5} {result['errors']:>5} {result['throughput_rps']:>8.2f} "
+          f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {cpu:>7} {rss:>7}")
+
+
+# ---- Starting the mock and API servers ----
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before becoming ready: {url}")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {timeout}s: {url}")
+
+
+def stop(process: subprocess.Popen) -> None:
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def mock_arguments(args: argparse.Namespace) -> List[str]:
+    arguments = [
+        '--port', str(args.mock_port),
+        '--time-scale', str(args.time_scale),
+        '--error-rate', str(args.error_rate),
+        '--rate-limit-rate', str(args.rate_limit_rate),
+        '--image-size', args.image_size
+    ]
+    for latency in args.latency:
+        arguments += ['--latency', latency]
+    return arguments
+
+
+def run_combination(args: argparse.Namespace, workers: int, executor_size: int) -> Dict[str, Dict]:
+    """Start a fresh mock and API server, run every scenario, and stop both"""
+    workdir = tempfile.mkdtemp(prefix='tryon-load-')
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    env = {
+        **os.environ,
+        'PYTHONPATH': REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''),
+        'OPENAI_API_KEY': 'mock',
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{args.mock_port}/v1",
+        'OPENAI_AGENTS_DISABLE_TRACING': '1',
+        'OPENAI_RATE_LIMITS': args.rate_limits,
+        'REQUEST_EXECUTOR_WORKERS': str(executor_size),
+        'STORAGE_JANITOR_INTERVAL': '0'
+    }
+    mock = subprocess.Popen([sys.executable, MOCK_SERVER] + mock_arguments(args), stdout=log, stderr=subprocess.STDOUT)
+    api = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'api_server:app', '--host', '127.0.0.1', '--port', str(args.port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        wait_ready(f"http://127.0.0.1:{args.mock_port}/mock/stats", mock)
+        wait_ready(f"http://127.0.0.1:{args.port}/api/status", api)
+        return asyncio.run(run_suite(f"http://127.0.0.1:{args.port}", args, api.pid))
+    finally:
+        stop(api)
+        stop(mock)
+        log.close()
+        if args.keep_workdir:
+            print(f"📁 Server files and log kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', help="Benchmark an already running server at this URL instead of starting one")
+    parser.add_argument('--scenarios', default='all', help="Comma-separated scenarios, or all")
+    parser.add_argument('--requests', type=int, default=20, help="Requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight per scenario")
+    parser.add_argument('--workers', default='1', help="Comma-separated uvicorn worker counts to compare")
+    parser.add_argument('--executor-sizes', default='4', help="Comma-separated REQUEST_EXECUTOR_WORKERS values to compare")
+    parser.add_argument('--garments', type=int, default=16, help="Distinct garment images to cycle through")
+    parser.add_argument('--garment-size', type=int, default=1024, help="Garment image side in pixels")
+    parser.add_argument('--batch-size', type=int, default=4, help="Garments per tryon/batch request")
+    parser.add_argument('--bypass-model-cache', action='store_true',
+                        help="Generate a fresh model per request instead of reusing the cached one")
+    parser.add_argument('--rate-limits', default='',
+                        help="OPENAI_RATE_LIMITS for the API server (default: none, to measure server overhead)")
+    parser.add_argument('--timeout', type=float, default=600, help="Per-request timeout in seconds")
+    parser.add_argument('--port', type=int, default=8300, help="Port of the started API server")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    parser.add_argument('--keep-workdir', action='store_true', help="Keep each run's working directory and server log")
+    mock = parser.add_argument_group('mock server')
+    mock.add_argument('--mock-port', type=int, default=8100)
+    mock.add_argument('--time-scale', type=float, default=0.1, help="Scale the mock's upstream latencies")
+    mock.add_argument('--error-rate', type=float, default=0.0)
+    mock.add_argument('--rate-limit-rate', type=float, default=0.0)
+    mock.add_argument('--image-size', default='1024x1536')
+    mock.add_argument('--latency', action='append', default=[], metavar='ENDPOINT=SPEC')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = []
+    if args.target:
+        print(f"🎯 {args.target}: {args.requests} requests per scenario, concurrency {args.concurrency}")
+        print_header()
+        results.append({'target': args.target, 'scenarios': asyncio.run(run_suite(args.target, args, None))})
+    else:
+        for workers in (int(value) for value in args.workers.split(',')):
+            for executor_size in (int(value) for value in args.executor_sizes.split(',')):
+                print(f"\n🚀 workers={workers} executor={executor_size}: {args.requests} requests per scenario, "
+                      f"concurrency {args.concurrency}, mock time scale {args.time_scale}")
+                print_header()
+                scenarios = run_combination(args, workers, executor_size)
+                results.append({'workers': workers, 'executor_size': executor_size, 'scenarios': scenarios})
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'arguments': vars(args), 'runs': results}, f, indent=2)
+        print(f"\n📄 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Mock OpenAI Server
+Stands in for the OpenAI API in load tests, so the service can be benchmarked
+without API credit. Implements the endpoints the agents use:
+
+    POST /v1/chat/completions      clothing validation (answers "true"/"false")
+    POST /v1/responses             agents SDK: model description (structured
+                                   output), translation, merge orchestrator
+                                   (calls its image_merge tool once)
+    POST /v1/images/generations    model image
+    POST /v1/images/edits          try-on merge
+    GET  /v1/models                client warm-up
+
+Each endpoint sleeps for a latency drawn from its own distribution, fails
+with the configured error and 429 rates, and returns images of the
+configured size and format.
+
+Usage:
+    python benchmarks/mock_openai.py --port 8100 --time-scale 0.1
+    OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=mock python api_server.py
+
+Latency distributions (seconds, before --time-scale):
+    fixed:2  uniform:1,3  normal:MEAN,STD  lognormal:MEDIAN,SIGMA  exp:MEAN
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import re
+import time
+import uuid
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from PIL import Image
+
+# Realistic upstream latencies: GPT-4o turns take seconds, gpt-image-1 high quality up to a minute
+DEFAULT_LATENCIES = {
+    'chat': 'lognormal:1.5,0.35',
+    'responses': 'lognormal:2.0,0.35',
+    'images.generate': 'lognormal:30,0.25',
+    'images.edit': 'lognormal:40,0.25',
+    'models': 'fixed:0.05'
+}
+
+
+def parse_distribution(spec: str) -> Callable[[], float]:
+    """Turn "lognormal:2.0,0.35" style specs into a sampler of non-negative seconds"""
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    if kind == 'exp':
+        return lambda: random.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def make_image(size: str, image_format: str, noise: float) -> str:
+    """Render the base64 image every image endpoint returns"""
+    width, height = (int(value) for value in size.lower().split('x'))
+    gradient = Image.linear_gradient('L').resize((width, height))
+    grain = Image.effect_noise((width, height), noise) if noise > 0 else gradient
+    image = Image.merge('RGB', (gradient, grain, gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM)))
+    output = BytesIO()
+    if image_format == 'jpeg':
+        image.save(output, format='JPEG', quality=95)
+    else:
+        image.save(output, format='PNG')
+    return base64.b64encode(output.getvalue()).decode('ascii')
+
+
+def sample_from_schema(schema: Dict, defs: Optional[Dict] = None) -> Any:
+    """Build a value satisfying a JSON schema, for structured outputs"""
+    defs = defs if defs is not None else schema.get('$defs', {})
+    if '$ref' in schema:
+        return sample_from_schema(defs[schema['$ref'].split('/')[-1]], defs)
+    if 'anyOf' in schema:
+        return sample_from_schema(schema['anyOf'][0], defs)
+    schema_type = schema.get('type', 'string')
+    if isinstance(schema_type, list):
+        schema_type = schema_type[0]
+    if 'enum' in schema:
+        return schema['enum'][0]
+    if schema_type == 'object':
+        return {name: sample_from_schema(prop, defs) for name, prop in schema.get('properties', {}).items()}
+    if schema_type == 'array':
+        return [sample_from_schema(schema.get('items', {}), defs)]
+    if schema_type in ('integer', 'number'):
+        return 0
+    if schema_type == 'boolean':
+        return True
+    return ("A confident 25-year-old model wearing a plain light gray fitted t-shirt and basic jeans, "
+            "standing naturally in a professional white studio with no props.")
+
+
+class MockUpstream:
+    """Latency, error injection and canned payloads shared by all endpoints"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.time_scale = args.time_scale
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.retry_after = args.retry_after
+        self.valid_rate = args.valid_rate
+        latencies = dict(DEFAULT_LATENCIES)
+        for item in args.latency:
+            endpoint, _, spec = item.partition('=')
+            if endpoint not in latencies:
+                raise ValueError(f"Unknown endpoint {endpoint}, expected one of {sorted(latencies)}")
+            latencies[endpoint] = spec
+        self.latencies = {endpoint: parse_distribution(spec) for endpoint, spec in latencies.items()}
+        self.latency_specs = latencies
+        self.image_b64 = make_image(args.image_size, args.image_format, args.image_noise)
+        self.calls: Dict[str, Dict[str, int]] = {}
+        print(f"🖼️ Mock images: {args.image_size} {args.image_format}, "
+              f"{len(self.image_b64) * 3 // 4 // 1024}KB each")
+
+    def _count(self, endpoint: str, outcome: str) -> None:
+        counts = self.calls.setdefault(endpoint, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+    async def handle(self, endpoint: str, build: Callable[[], Dict]) -> JSONResponse:
+        """Wait for the endpoint's latency, then answer with an injected error or build()"""
+        await asyncio.sleep(self.latencies[endpoint]() * self.time_scale)
+        draw = random.random()
+        if draw < self.rate_limit_rate:
+            self._count(endpoint, '429')
+            return JSONResponse(
+                status_code=429,
+                headers={'retry-after': str(self.retry_after)},
+                content={'error': {'message': 'Rate limit reached (mock)', 'type': 'requests', 'code': 'rate_limit_exceeded'}}
+            )
+        if draw < self.rate_limit_rate + self.error_rate:
+            self._count(endpoint, '500')
+            return JSONResponse(
+                status_code=500,
+                content={'error': {'message': 'Internal server error (mock)', 'type': 'server_error', 'code': None}}
+            )
+        self._count(endpoint, '200')
+        return JSONResponse(content=build())
+
+    def image_result(self) -> Dict:
+        return {
+            'created': int(time.time()),
+            'data': [{'b64_json': self.image_b64}],
+            'usage': {'input_tokens': 50, 'output_tokens': 6240, 'total_tokens': 6290,
+                      'input_tokens_details': {'text_tokens': 50, 'image_tokens': 0}}
+        }
+
+
+def _usage(prompt_tokens: int = 200, completion_tokens: int = 60) -> Dict:
+    return {
+        'input_tokens': prompt_tokens,
+        'input_tokens_details': {'cached_tokens': 0},
+        'output_tokens': completion_tokens,
+        'output_tokens_details': {'reasoning_tokens': 0},
+        'total_tokens': prompt_tokens + completion_tokens
+    }
+
+
+def _input_text(items: Any) -> str:
+    """Concatenate the text of a Responses API input (a string or a list of items)"""
+    if isinstance(items, str):
+        return items
+    parts = []
+    for item in items or []:
+        content = item.get('content') if isinstance(item, dict) else None
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get('text', '') for part in content if isinstance(part, dict))
+    return '\n'.join(parts)
+
+
+def responses_output(body: Dict) -> List[Dict]:
+    """Output items of a Responses API call: a tool call for the orchestrator, text otherwise"""
+    items = body.get('input')
+    tool_names = {tool.get('name') for tool in body.get('tools') or []}
+    tool_outputs = [item for item in items if isinstance(item, dict) and item.get('type') == 'function_call_output'] \
+        if isinstance(items, list) else []
+
+    if 'image_merge' in tool_names and not tool_outputs:
+        text = _input_text(items)
+        model_path = re.search(r'Model image path:\s*(\S+)', text)
+        clothing_path = re.search(r'Clothing image path:\s*(\S+)', text)
+        arguments = {
+            'img1': model_path.group(1) if model_path else '',
+            'img2': clothing_path.group(1) if clothing_path else '',
+            'prompt': 'This is a full body fashion photograph of a model wearing the uploaded clothing.'
+        }
+        return [{
+            'type': 'function_call',
+            'id': f"fc_{uuid.uuid4().hex}",
+            'call_id': f"call_{uuid.uuid4().hex}",
+            'name': 'image_merge',
+            'arguments': json.dumps(arguments),
+            'status': 'completed'
+        }]
+
+    text_format = (body.get('text') or {}).get('format') or {}
+    if tool_outputs:
+        text = str(tool_outputs[-1].get('output', ''))
+    elif text_format.get('type') == 'json_schema':
+        text = json.dumps(sample_from_schema(text_format.get('schema', {})))
+    else:
+        # Translation: English is what every caller wants back
+        text = "The model stands naturally in a minimalist studio."
+    return [{
+        'type': 'message',
+        'id': f"msg_{uuid.uuid4().hex}",
+        'status': 'completed',
+        'role': 'assistant',
+        'content': [{'type': 'output_text', 'text': text, 'annotations': []}]
+    }]
+
+
+def create_app(upstream: MockUpstream) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI API")
+
+    @app.get("/v1/models")
+    async def list_models():
+        return await upstream.handle('models', lambda: {
+            'object': 'list',
+            'data': [{'id': model, 'object': 'model', 'created': 0, 'owned_by': 'mock'}
+                     for model in ('gpt-4o', 'gpt-image-1')]
+        })
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+
+        def build():
+            answer = 'true' if random.random() < upstream.valid_rate else 'false'
+            return {
+                'id': f"chatcmpl-{uuid.uuid4().hex}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'gpt-4o'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': answer, 'refusal': None},
+                    'logprobs': None,
+                    'finish_reason': 'stop'
+                }],
+                'usage': {'prompt_tokens': 300, 'completion_tokens': 1, 'total_tokens': 301}
+            }
+        return await upstream.handle('chat', build)
+
+    @app.post("/v1/responses")
+    async def responses(request: Request):
+        body = await request.json()
+
+        def build():
+            return {
+                'id': f"resp_{uuid.uuid4().hex}",
+                'object': 'response',
+                'created_at': int(time.time()),
+                'model': body.get('model', 'gpt-4o'),
+                'status': 'completed',
+                'output': responses_output(body),
+                'parallel_tool_calls': True,
+                'tool_choice': body.get('tool_choice', 'auto'),
+                'tools': body.get('tools') or [],
+                'text': body.get('text') or {'format': {'type': 'text'}},
+                'instructions': body.get('instructions'),
+                'metadata': {},
+                'temperature': 1.0,
+                'top_p': 1.0,
+                'error': None,
+                'incomplete_details': None,
+                'usage': _usage()
+            }
+        return await upstream.handle('responses', build)
+
+    @app.post("/v1/images/generations")
+    async def images_generate(request: Request):
+        await request.body()
+        return await upstream.handle('images.generate', upstream.image_result)
+
+    @app.post("/v1/images/edits")
+    async def images_edit(request: Request):
+        # Read the whole multipart body, like the real endpoint has to
+        await request.body()
+        return await upstream.handle('images.edit', upstream.image_result)
+
+    @app.get("/mock/stats")
+    async def stats():
+        """Calls per endpoint and outcome, and the active latency specs"""
+        return {'calls': upstream.calls, 'latencies': upstream.latency_specs, 'time_scale': upstream.time_scale}
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', action='append', default=[], metavar='ENDPOINT=SPEC',
+                        help=f"Override a latency distribution, endpoints: {', '.join(DEFAULT_LATENCIES)}")
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help='Multiply every sampled latency, e.g. 0.1 for quick runs')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of calls answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--valid-rate', type=float, default=1.0,
+                        help='Fraction of clothing validations answered "true"')
+    parser.add_argument('--image-size', default='1024x1536', help='Size of returned images')
+    parser.add_argument('--image-format', choices=('png', 'jpeg'), default='png')
+    parser.add_argument('--image-noise', type=float, default=24.0,
+                        help='Grain added to returned images; more grain, larger (less compressible) payloads')
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    upstream = MockUpstream(args)
+    print(f"🧪 Mock OpenAI API on http://{args.host}:{args.port}/v1 (time scale {args.time_scale})")
+    uvicorn.run(create_app(upstream), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Replay Try-On
+Runs the complete try-on pipeline (clothing check, model description, model
+generation, merge) end to end against a recorded cassette, and reports how
+much of each run is the service's own overhead rather than upstream time.
+Replays need no network access or API key, so the same run can gate CI.
+
+    record   Run once against the real API through the cassette recorder
+    replay   Run against the cassette, with zero or recorded upstream latency
+
+Every iteration goes through the full pipeline: the description and clothing
+check caches are disabled and the model cache is bypassed. Overhead is the
+wall time minus the time spent in upstream calls, and is compared against a
+baseline file; the run exits with status 1 on a regression or when a request
+has no recording.
+
+Usage:
+    # CI: replay the committed cassette against its baseline
+    python benchmarks/replay_tryon.py replay --cassette benchmarks/cassettes/tryon --baseline benchmarks/cassettes/tryon-baseline.json
+    # Re-record, then refresh the baseline
+    OPENAI_API_KEY=sk-... python benchmarks/replay_tryon.py record --cassette benchmarks/cassettes/tryon --warmup 0 --iterations 1
+    python benchmarks/replay_tryon.py replay --cassette benchmarks/cassettes/tryon --save-baseline benchmarks/cassettes/tryon-baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from load_test import stop, wait_ready
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASSETTE_PROXY = os.path.join(REPO_ROOT, 'benchmarks', 'cassettes.py')
+
+# Seeded translations, so no translation call depends on what earlier iterations memoized
+MODEL_SPECS = {
+    'gender': 'female',
+    'age': 25,
+    'nationality': 'Chinese',
+    'height': 170,
+    'weight': 60,
+    'action_description': '自然站立姿势',
+    'scene_description': '简约工作室背景',
+    'bypass_model_cache': True
+}
+
+# Caches that would let later iterations skip upstream calls, and on-disk state from earlier runs
+PIPELINE_ENV = {
+    'DESCRIPTION_CACHE_SIZE': '0',
+    'DESCRIPTION_CACHE_DB_PATH': '',
+    'CLOTH_CHECK_CACHE_SIZE': '0',
+    'CLOTH_CHECK_CACHE_DB_PATH': '',
+    'TRANSLATION_MEMO_DB_PATH': '',
+    'OPENAI_AGENTS_DISABLE_TRACING': '1',
+    'OPENAI_RATE_LIMITS': ''
+}
+
+
+def _totals(snapshot: Dict) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for labels, (_, seconds) in snapshot.items():
+        totals[labels[0]] = totals.get(labels[0], 0.0) + seconds
+    return totals
+
+
+def _diff(after: Dict[str, float], before: Dict[str, float]) -> Dict[str, float]:
+    return {name: seconds - before.get(name, 0.0) for name, seconds in after.items()
+            if seconds - before.get(name, 0.0) > 0}
+
+
+async def run_iteration(garment_path: str) -> Dict:
+    """One clothing check plus complete try-on, with wall, upstream and per-stage seconds"""
+    from function_agents import check_cloth_validity, generate_complete_tryon_async
+    from function_agents.metrics import STAGE_SECONDS, UPSTREAM_SECONDS
+
+    loop = asyncio.get_running_loop()
+    stages_before = _totals(STAGE_SECONDS.snapshot())
+    upstream_before = UPSTREAM_SECONDS.snapshot()
+    started = time.perf_counter()
+
+    validity = await loop.run_in_executor(None, check_cloth_validity, garment_path)
+    if not validity.get('valid'):
+        raise RuntimeError(f"Clothing check rejected the garment: {validity}")
+    result_path = await generate_complete_tryon_async(garment_path, MODEL_SPECS)
+
+    wall = time.perf_counter() - started
+    upstream_after = UPSTREAM_SECONDS.snapshot()
+    upstream_calls = sum(count - upstream_before.get(labels, (0, 0.0))[0]
+                         for labels, (count, _) in upstream_after.items())
+    upstream = sum(seconds - upstream_before.get(labels, (0, 0.0))[1]
+                   for labels, (_, seconds) in upstream_after.items())
+    return {
+        'wall': wall,
+        'upstream': upstream,
+        'overhead': wall - upstream,
+        'upstream_calls': upstream_calls,
+        'stages': _diff(_totals(STAGE_SECONDS.snapshot()), stages_before),
+        'result_path': result_path
+    }
+
+
+def summarize(iterations: List[Dict]) -> Dict:
+    """Medians over the measured iterations"""
+    stage_names = sorted({name for iteration in iterations for name in iteration['stages']})
+    return {
+        'iterations': len(iterations),
+        'wall': statistics.median(iteration['wall'] for iteration in iterations),
+        'upstream': statistics.median(iteration['upstream'] for iteration in iterations),
+        'overhead': statistics.median(iteration['overhead'] for iteration in iterations),
+        'upstream_calls': statistics.median(iteration['upstream_calls'] for iteration in iterations),
+        'stages': {name: statistics.median(iteration['stages'].get(name, 0.0) for iteration in iterations)
+                   for name in stage_names}
+    }
+
+
+def compare(summary: Dict, baseline: Dict, tolerance: float, min_delta: float) -> List[str]:
+    """Regressions against a baseline summary: overhead and every stage it recorded"""
+    checks = [('overhead', summary['overhead'], baseline['overhead'])]
+    checks += [(f"stage {name}", summary['stages'].get(name, 0.0), seconds)
+               for name, seconds in baseline.get('stages', {}).items()]
+    regressions = []
+    for name, current, previous in checks:
+        if current > previous * (1 + tolerance) and current - previous > min_delta:
+            regressions.append(f"{name}: {previous * 1000:.1f}ms -> {current * 1000:.1f}ms "
+                               f"(+{(current / previous - 1) * 100 if previous else float('inf'):.0f}%)")
+    if summary['upstream_calls'] != baseline.get('upstream_calls', summary['upstream_calls']):
+        regressions.append(f"upstream calls: {baseline['upstream_calls']:g} -> {summary['upstream_calls']:g}")
+    return regressions
+
+
+def print_summary(summary: Dict) -> None:
+    print(f"\n📊 Median of {summary['iterations']} iterations")
+    print(f"   wall       {summary['wall'] * 1000:9.1f}ms")
+    print(f"   upstream   {summary['upstream'] * 1000:9.1f}ms ({summary['upstream_calls']:g} calls)")
+    print(f"   overhead   {summary['overhead'] * 1000:9.1f}ms")
+    for name, seconds in summary['stages'].items():
+        print(f"   stage {name:<28} {seconds * 1000:9.1f}ms")
+
+
+async def run_iterations(args: argparse.Namespace, garment_path: str) -> List[Dict]:
+    iterations = []
+    for index in range(args.warmup + args.iterations):
+        iteration = await run_iteration(garment_path)
+        label = 'warmup' if index < args.warmup else f"run {index - args.warmup + 1}"
+        print(f"⏱️ {label}: wall {iteration['wall'] * 1000:.1f}ms, upstream {iteration['upstream'] * 1000:.1f}ms, "
+              f"overhead {iteration['overhead'] * 1000:.1f}ms")
+        if index >= args.warmup:
+            iterations.append(iteration)
+    return iterations
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=('record', 'replay'))
+    parser.add_argument('--cassette', required=True, help="Cassette directory")
+    parser.add_argument('--garment', default=os.path.join(REPO_ROOT, 'imgs', 'examples', 'cloth1.jpg'))
+    parser.add_argument('--iterations', type=int, default=5, help="Measured iterations")
+    parser.add_argument('--warmup', type=int, default=1, help="Unmeasured iterations run first")
+    parser.add_argument('--timing', choices=('recorded', 'zero'), default='zero',
+                        help="Replay with each call's recorded upstream time, or at once (default)")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Scale recorded times when replaying")
+    parser.add_argument('--upstream', default='https://api.openai.com', help="API to record from")
+    parser.add_argument('--port', type=int, default=8200, help="Port of the cassette proxy")
+    parser.add_argument('--baseline', help="Fail if overhead or a stage regressed against this summary file")
+    parser.add_argument('--save-baseline', help="Write this run's summary as a baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown")
+    parser.add_argument('--min-delta', type=float, default=0.025,
+                        help="Ignore slowdowns smaller than this many seconds (timer noise)")
+    parser.add_argument('--keep-workdir', action='store_true', help="Keep generated images and the proxy log")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    garment_path = os.path.abspath(args.garment)
+    cassette = os.path.abspath(args.cassette)
+    if args.mode == 'record' and not os.getenv('OPENAI_API_KEY'):
+        raise SystemExit("Recording needs OPENAI_API_KEY; it is passed through to the real API")
+
+    proxy_arguments = [sys.executable, CASSETTE_PROXY, args.mode, cassette, '--port', str(args.port)]
+    if args.mode == 'record':
+        proxy_arguments += ['--upstream', args.upstream]
+    else:
+        proxy_arguments += ['--timing', args.timing, '--time-scale', str(args.time_scale)]
+
+    # Settings are read at import time, so they are set before function_agents is imported
+    os.environ.update(PIPELINE_ENV)
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault('OPENAI_API_KEY', 'replay')
+    sys.path.insert(0, REPO_ROOT)
+
+    workdir = tempfile.mkdtemp(prefix='tryon-replay-')
+    log = open(os.path.join(workdir, 'cassette.log'), 'w')
+    proxy = subprocess.Popen(proxy_arguments, stdout=log, stderr=subprocess.STDOUT)
+    original_cwd = os.getcwd()
+    os.chdir(workdir)
+    iterations, error = [], None
+    try:
+        wait_ready(f"http://127.0.0.1:{args.port}/cassette/stats", proxy)
+        print(f"📼 {args.mode.capitalize()}ing {cassette} ({args.warmup} warmup + {args.iterations} iterations)")
+        try:
+            iterations = asyncio.run(run_iterations(args, garment_path))
+        except Exception as e:
+            # Reported below, together with any requests the cassette could not answer
+            error = e
+        proxy_stats = httpx.get(f"http://127.0.0.1:{args.port}/cassette/stats", timeout=10).json()
+    finally:
+        stop(proxy)
+        log.close()
+        os.chdir(original_cwd)
+        if args.keep_workdir:
+            print(f"📁 Generated images and proxy log kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    failures = []
+    if proxy_stats.get('misses'):
+        failures.append(f"{proxy_stats['misses']} requests had no recording: {proxy_stats['missed_requests']}")
+    if error is not None:
+        failures.append(f"Try-on run failed: {error}")
+    else:
+        summary = summarize(iterations)
+        print_summary(summary)
+        if args.save_baseline:
+            with open(args.save_baseline, 'w') as f:
+                json.dump(summary, f, indent=2)
+            print(f"📄 Baseline written to {args.save_baseline}")
+        if args.baseline:
+            with open(args.baseline) as f:
+                failures += compare(summary, json.load(f), args.tolerance, args.min_delta)
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("✅ No regressions" if args.baseline else "✅ Done")
+
+if __name__ == "__main__":
+    main()
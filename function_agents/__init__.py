@@ -22,44 +22,106 @@ result = generate_complete_tryon(
         "scene_description": "简洁的工作室背景"
     }
 )
+
+Async callers (e.g. FastAPI endpoints) can await generate_complete_tryon_async
+with the same arguments instead of blocking a worker thread.
+
+To dress one model in many garments, prepare the model once with
+prepare_model_image_async and iterate merge_batch_async over the garments.
 """
 
-from typing import Dict, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import asyncio
+import inspect
 import os
 
 # Import all agents
-from .model_description_agent import create_model_description_agent, generate_model_description
-from .model_generation_agent import create_model_generation_agent, generate_model_from_prompt
-from .image_merge_agent import merge_model_with_clothing
-from .check_single_cloth import check_cloth_validity, check_single_cloth
+from .model_description_agent import (
+    create_model_description_agent,
+    generate_model_description,
+    generate_model_description_async,
+    get_description_cache
+)
+from .model_generation_agent import (
+    create_model_generation_agent,
+    generate_model_from_prompt,
+    generate_model_from_prompt_async,
+    GenerationResult
+)
+from .model_cache import get_model_image_cache, lookup_model_image, store_model_image
+from .image_merge_agent import merge_model_with_clothing, merge_model_with_clothing_async
+from .check_single_cloth import check_cloth_validity, check_cloth_validity_bytes, check_single_cloth
+from .cloth_check_cache import get_cloth_check_cache
+from .translation_memo import get_translation_memo
+from .clients import (
+    get_openai_client,
+    run_sync,
+    warm_up_clients,
+    warm_up_async_clients,
+    close_clients,
+    aclose_async_clients
+)
+from .scheduler import get_upstream_scheduler, request_priority, set_request_priority
+from .single_flight import get_single_flight_stats
+from .storage import get_storage_manager
+from .artifact_store import get_artifact_store
+from .metrics import REGISTRY, render_metrics
+from .tracing import current_span, get_span_exporter, span, traced
+
+# Called with each stage name; may return an awaitable, which is awaited before the stage runs
+ProgressCallback = Callable[[str], Any]
+
+
+async def report_progress(progress_callback: Optional[ProgressCallback], stage: str) -> None:
+    """Call progress_callback with a stage name, awaiting its result if it returns one"""
+    if progress_callback is None:
+        return
+    result = progress_callback(stage)
+    if inspect.isawaitable(result):
+        await result
 
 
 def generate_complete_tryon(clothing_image_path: str,
                           model_specs: Dict,
-                          output_path: Optional[str] = None) -> str:
+                          output_path: Optional[str] = None,
+                          progress_callback: Optional[ProgressCallback] = None) -> str:
     """
     Complete virtual try-on workflow integrating all three agents
     
     Args:
         clothing_image_path: Path to clothing image
-        model_specs: Model specification parameters
+        model_specs: Model specification parameters; set "bypass_model_cache"
+            to force a freshly generated base model
         output_path: Output path for final image
+        progress_callback: Called with the stage name ("description",
+            "model_generation", "merge") as each stage starts; an awaitable
+            it returns is awaited
         
     Returns:
         Path to the generated try-on image
     """
+    return run_sync(generate_complete_tryon_async(
+        clothing_image_path,
+        model_specs,
+        output_path=output_path,
+        progress_callback=progress_callback
+    ))
+
+
+@traced('generate_complete_tryon')
+async def generate_complete_tryon_async(clothing_image_path: str,
+                                        model_specs: Dict,
+                                        output_path: Optional[str] = None,
+                                        progress_callback: Optional[ProgressCallback] = None) -> str:
+    """
+    Async version of generate_complete_tryon, awaiting each agent directly
+    
+    Takes the same arguments; progress_callback must not block, so blocking
+    work (e.g. a database write) is returned as an awaitable instead.
+    """
     print("🚀 Starting complete virtual try-on workflow...")
     
     try:
-        # Separate parameters: basic model info and camera/action/scene parameters
-        basic_model_specs = {
-            'gender': model_specs.get('gender', 'female'),
-            'age': model_specs.get('age', 25),
-            'nationality': model_specs.get('nationality', 'Chinese'),
-            'height': model_specs.get('height', 170),
-            'weight': model_specs.get('weight', 60)
-        }
-        
         # Extract camera and description parameters
         camera_settings = model_specs.get('camera', {})
         shot_type = camera_settings.get('shot_type', 'full_body')
@@ -67,26 +129,21 @@ def generate_complete_tryon(clothing_image_path: str,
         pose_description = model_specs.get('action_description', '')
         scene_description = model_specs.get('scene_description', '')
         
-        # Step 1: Generate model description
-        print("📝 Step 1: Generating model description...")
-        description = generate_model_description(basic_model_specs)
-        print("✅ Description completed")
-        
-        # Step 2: Generate model image
-        print("🎨 Step 2: Generating model image...")
-        model_result = generate_model_from_prompt(description)
-        print(f"✅ Model image completed: {model_result.image_path}")
+        # Steps 1-2: model description and model image (or a cached model image)
+        model_image_path, _ = await prepare_model_image_async(model_specs, progress_callback)
         
         # Step 3: Merge images
         print("👕 Step 3: Merging model with clothing...")
-        merge_result = merge_model_with_clothing(
-            model_result.image_path,
-            clothing_image_path,
-            shot_type=shot_type,
-            angle=angle,
-            pose_description=pose_description,
-            scene_description=scene_description
-        )
+        await report_progress(progress_callback, "merge")
+        with span('tryon.merge'):
+            merge_result = await merge_model_with_clothing_async(
+                model_image_path,
+                clothing_image_path,
+                shot_type=shot_type,
+                angle=angle,
+                pose_description=pose_description,
+                scene_description=scene_description
+            )
         print(f"✅ Merge completed: {merge_result}")
         
         print("🎉 Workflow finished!")
@@ -97,28 +154,223 @@ def generate_complete_tryon(clothing_image_path: str,
         raise e
 
 
+@traced('prepare_model_image')
+async def prepare_model_image_async(model_specs: Dict,
+                                    progress_callback: Optional[ProgressCallback] = None) -> Tuple[str, bool]:
+    """
+    Get the base model image for these specs, generating it only on a cache miss
+    
+    Args:
+        model_specs: Model specification parameters (camera, pose and scene are ignored)
+        progress_callback: Called with "description" and "model_generation" as
+            those stages start, like in generate_complete_tryon_async; not
+            called on a cache hit
+        
+    Returns:
+        (model_image_path, cached)
+    """
+    loop = asyncio.get_running_loop()
+    
+    # Only the basic model info affects the model image
+    basic_model_specs = {
+        'gender': model_specs.get('gender', 'female'),
+        'age': model_specs.get('age', 25),
+        'nationality': model_specs.get('nationality', 'Chinese'),
+        'height': model_specs.get('height', 170),
+        'weight': model_specs.get('weight', 60)
+    }
+    
+    cached_model_path = await loop.run_in_executor(
+        None,
+        lookup_model_image,
+        basic_model_specs,
+        model_specs.get('bypass_model_cache', False)
+    )
+    current_span().set_attribute('model_cache.hit', bool(cached_model_path))
+    if cached_model_path:
+        # Steps 1-2 skipped: reuse a base model generated for the same specs
+        print(f"♻️ Reusing cached model image: {cached_model_path}")
+        return cached_model_path, True
+    
+    # Step 1: Generate model description
+    print("📝 Step 1: Generating model description...")
+    await report_progress(progress_callback, "description")
+    with span('tryon.description'):
+        description = await generate_model_description_async(basic_model_specs)
+    print("✅ Description completed")
+    
+    # Step 2: Generate model image
+    print("🎨 Step 2: Generating model image...")
+    await report_progress(progress_callback, "model_generation")
+    with span('tryon.model_generation'):
+        model_result = await generate_model_from_prompt_async(description)
+        await loop.run_in_executor(None, store_model_image, basic_model_specs, model_result.image_path)
+    print(f"✅ Model image completed: {model_result.image_path}")
+    return model_result.image_path, False
+
+
+async def merge_batch_async(model_image_path: str,
+                            clothing_image_paths: List[str],
+                            model_specs: Dict,
+                            concurrency: int = 4,
+                            priority: str = 'bulk') -> AsyncIterator[Tuple[int, Optional[str], Optional[Exception]]]:
+    """
+    Dress one model image in many garments, yielding results as they complete
+    
+    Only the merge stage runs per garment, with at most `concurrency` merges in
+    flight. A failed garment does not stop the batch.
+    
+    Args:
+        model_image_path: Path to the shared model image
+        clothing_image_paths: Paths to the clothing images
+        model_specs: Model specification parameters (camera, pose and scene are used)
+        concurrency: Maximum concurrent merges for this batch
+        priority: Upstream priority class of the merges, bulk by default so
+            interactive requests are served first
+        
+    Yields:
+        (index, result_path, error) in completion order; exactly one of
+        result_path and error is set
+    """
+    camera_settings = model_specs.get('camera', {})
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def merge_one(index: int, clothing_image_path: str):
+        # Each merge runs in its own task, so this only affects the batch
+        set_request_priority(priority)
+        async with semaphore:
+            try:
+                result_path = await merge_model_with_clothing_async(
+                    model_image_path,
+                    clothing_image_path,
+                    shot_type=camera_settings.get('shot_type', 'full_body'),
+                    angle=camera_settings.get('angle', 'front'),
+                    pose_description=model_specs.get('action_description', ''),
+                    scene_description=model_specs.get('scene_description', '')
+                )
+                return index, result_path, None
+            except Exception as e:
+                return index, None, e
+    
+    tasks = [asyncio.ensure_future(merge_one(i, path)) for i, path in enumerate(clothing_image_paths)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The consumer went away (e.g. client disconnected): stop pending merges
+        for task in tasks:
+            task.cancel()
+
+
 def get_agents_status() -> Dict:
     """Get status of all agents"""
     try:
         return {
-            "model_description_agent": {"status": "ready"},
+            "model_description_agent": {"status": "ready", "cache": get_description_cache().get_stats()},
             "model_generation_agent": {"status": "ready"},
             "image_merge_agent": {"status": "ready"},
-            "integrated_workflow": {"status": "ready"}
+            "integrated_workflow": {"status": "ready"},
+            "cloth_check_cache": get_cloth_check_cache().get_stats(),
+            "model_image_cache": get_model_image_cache().get_stats(),
+            "translation_memo": get_translation_memo().get_stats(),
+            "upstream_scheduler": get_upstream_scheduler().get_stats(),
+            "single_flight": get_single_flight_stats(),
+            "storage": get_storage_manager().get_stats(),
+            "artifact_store": get_artifact_store().get_stats(),
+            "tracing": get_span_exporter().get_stats()
         }
     except Exception as e:
         return {"status": "error", "message": f"Failed: {e}"}
 
 
+def collect_agent_metrics() -> List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]:
+    """Turn cache, scheduler, single-flight and storage stats into metric families"""
+    caches = {
+        "description": get_description_cache().get_stats(),
+        "cloth_check": get_cloth_check_cache().get_stats(),
+        "model_image": get_model_image_cache().get_stats(),
+        "translation_memo": get_translation_memo().get_stats()
+    }
+    description = caches["description"]
+    cloth_check = caches["cloth_check"]
+    hits = {
+        "description": description["hits"] + description["disk_hits"],
+        "cloth_check": cloth_check["exact_hits"] + cloth_check["perceptual_hits"],
+        "model_image": caches["model_image"]["hits"],
+        "translation_memo": caches["translation_memo"]["hits"]
+    }
+    scheduler = get_upstream_scheduler().get_stats()
+    flights = get_single_flight_stats()
+    storage = get_storage_manager().get_stats()
+    artifacts = get_artifact_store().get_stats()
+
+    return [
+        ("tryon_cache_hits_total", "counter", "Cache lookups answered from the cache",
+         [({"cache": name}, value) for name, value in hits.items()]),
+        ("tryon_cache_misses_total", "counter", "Cache lookups that missed",
+         [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        ("tryon_cache_hit_ratio", "gauge", "Fraction of cache lookups that hit since start",
+         [({"cache": name}, stats["hit_ratio"]) for name, stats in caches.items()]),
+        ("tryon_cache_entries", "gauge", "Entries held by each cache",
+         [({"cache": name}, stats["entries"]) for name, stats in caches.items()]),
+        ("tryon_single_flight_calls_total", "counter", "Single-flight calls that did the work (leader) or shared a result (follower)",
+         [({"group": name, "role": role}, stats[f"{role}s"])
+          for name, stats in flights.items() for role in ("leader", "follower")]),
+        ("tryon_upstream_retries_total", "counter", "Upstream call retries",
+         [({"model": model}, stats["retries"]) for model, stats in scheduler.items()]),
+        ("tryon_upstream_rate_limited_total", "counter", "Upstream calls answered with 429",
+         [({"model": model}, stats["rate_limited"]) for model, stats in scheduler.items()]),
+        ("tryon_upstream_failures_total", "counter", "Upstream calls that failed after all retries",
+         [({"model": model}, stats["failures"]) for model, stats in scheduler.items()]),
+        ("tryon_upstream_waiting", "gauge", "Calls waiting for an upstream concurrency slot",
+         [({"model": model}, stats["waiting"]) for model, stats in scheduler.items()]),
+        ("tryon_storage_bytes", "gauge", "Bytes held by each storage area as of the last janitor pass",
+         [({"area": name}, area["bytes"]) for name, area in storage["areas"].items() if "bytes" in area]),
+        ("tryon_storage_files", "gauge", "Files held by each storage area as of the last janitor pass",
+         [({"area": name}, area["files"]) for name, area in storage["areas"].items() if "files" in area]),
+        ("tryon_storage_reclaimed_bytes_total", "counter", "Bytes deleted by the storage janitor",
+         [({"reason": reason}, value) for reason, value in storage["reclaimed_bytes"].items()]),
+        ("tryon_storage_reclaimed_files_total", "counter", "Files deleted by the storage janitor",
+         [({"reason": reason}, value) for reason, value in storage["reclaimed_files"].items()]),
+        ("tryon_artifact_transfers_total", "counter", "Shared artifact store uploads, downloads and misses",
+         [({"operation": operation}, artifacts[operation])
+          for operation in ("uploads", "downloads", "misses") if operation in artifacts])
+    ]
+
+
+REGISTRY.add_collector(collect_agent_metrics)
+
+
 # Export main functions
 __all__ = [
     'generate_complete_tryon',
+    'generate_complete_tryon_async',
+    'prepare_model_image_async',
+    'merge_batch_async',
     'get_agents_status',
+    'render_metrics',
     'create_model_description_agent',
     'create_model_generation_agent',
     'generate_model_description',
+    'generate_model_description_async',
     'generate_model_from_prompt',
+    'generate_model_from_prompt_async',
+    'lookup_model_image',
+    'store_model_image',
     'merge_model_with_clothing',
+    'merge_model_with_clothing_async',
     'check_cloth_validity',
-    'check_single_cloth'
+    'check_cloth_validity_bytes',
+    'check_single_cloth',
+    'get_translation_memo',
+    'get_storage_manager',
+    'get_artifact_store',
+    'get_openai_client',
+    'get_upstream_scheduler',
+    'request_priority',
+    'set_request_priority',
+    'warm_up_clients',
+    'warm_up_async_clients',
+    'close_clients',
+    'aclose_async_clients'
 ] 
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Artifact Store - generated images and garments shared between API nodes
+
+Images are always written to the local disk first, since the agents and
+images.edit work on local files. With the S3 backend every artifact is
+also uploaded to an S3-compatible bucket (AWS S3, MinIO, R2, ...), so any
+node can serve it, by redirecting clients to a presigned URL, or fetch it
+back into its local cache when a request references an image made on
+another node. The local backend keeps the single-node behaviour.
+
+Keys are flat ("imgs/<name>", "garments/<id>.jpg"): sharding only matters
+for local directories.
+"""
+
+import asyncio
+import mimetypes
+import os
+import threading
+import uuid
+from typing import Dict, Optional
+
+from .storage import IMAGE_FOLDER, resolve_image_path, shard_path
+
+ARTIFACT_STORAGE = os.getenv('ARTIFACT_STORAGE', 'local').lower()  # "local" or "s3"
+S3_BUCKET = os.getenv('S3_BUCKET', '')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None  # e.g. http://minio:9000, empty for AWS
+# Host clients use for presigned URLs, if different from the one nodes use (e.g. internal MinIO)
+S3_PUBLIC_ENDPOINT_URL = os.getenv('S3_PUBLIC_ENDPOINT_URL') or None
+S3_REGION = os.getenv('S3_REGION', 'us-east-1')
+S3_PREFIX = os.getenv('S3_PREFIX', '')
+S3_PRESIGN_SECONDS = int(os.getenv('S3_PRESIGN_SECONDS', 3600))
+S3_MAX_CONNECTIONS = int(os.getenv('S3_MAX_CONNECTIONS', 50))
+# Redirect image requests to the bucket instead of serving the bytes from the API node
+ARTIFACT_REDIRECT = os.getenv('ARTIFACT_REDIRECT', 'true').lower() == 'true'
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class ArtifactStore:
+    """Local filesystem backend: the files on this node's disk are the artifacts"""
+
+    remote = False
+
+    def upload(self, local_path: str, key: str) -> None:
+        """Make a local file available to every node under key"""
+
+    def download(self, key: str, local_path: str) -> bool:
+        """Copy an artifact into local_path, returning False if it does not exist"""
+        return os.path.exists(local_path)
+
+    def url(self, key: str) -> Optional[str]:
+        """Get a URL clients can fetch the artifact from directly, or None to serve it locally"""
+        return None
+
+    def delete(self, key: str) -> None:
+        """Delete an artifact"""
+
+    def get_stats(self) -> Dict:
+        return {"backend": "local"}
+
+
+class S3ArtifactStore(ArtifactStore):
+    """S3-compatible backend; needs the optional boto3 package"""
+
+    remote = True
+
+    def __init__(self,
+                 bucket: str = S3_BUCKET,
+                 endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+                 public_endpoint_url: Optional[str] = S3_PUBLIC_ENDPOINT_URL,
+                 region: str = S3_REGION,
+                 prefix: str = S3_PREFIX,
+                 presign_seconds: int = S3_PRESIGN_SECONDS):
+        try:
+            import boto3
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("ARTIFACT_STORAGE=s3 needs the boto3 package (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("ARTIFACT_STORAGE=s3 needs S3_BUCKET")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_seconds = presign_seconds
+        self._client_error = ClientError
+        config = Config(
+            # Path-style addressing works with MinIO and other stand-ins without wildcard DNS
+            s3={'addressing_style': 'path' if endpoint_url else 'auto'},
+            max_pool_connections=S3_MAX_CONNECTIONS,
+            retries={'max_attempts': 5, 'mode': 'standard'}
+        )
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region, config=config)
+        if public_endpoint_url:
+            self.presign_client = boto3.client('s3', endpoint_url=public_endpoint_url,
+                                               region_name=region, config=config)
+        else:
+            self.presign_client = self.client
+        self.uploads = 0
+        self.downloads = 0
+        self.misses = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def upload(self, local_path: str, key: str) -> None:
+        self.client.upload_file(local_path, self.bucket, self._key(key), ExtraArgs={
+            'ContentType': mimetypes.guess_type(local_path)[0] or 'application/octet-stream',
+            'CacheControl': IMMUTABLE_CACHE_CONTROL
+        })
+        self.uploads += 1
+
+    def download(self, key: str, local_path: str) -> bool:
+        os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+        # Write to a temporary name first so concurrent requests never read a partial file
+        tmp_path = f"{local_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            self.client.download_file(self.bucket, self._key(key), tmp_path)
+            os.replace(tmp_path, local_path)
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                self.misses += 1
+                return False
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.downloads += 1
+        return True
+
+    def url(self, key: str) -> Optional[str]:
+        return self.presign_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self._key(key)},
+            ExpiresIn=self.presign_seconds
+        )
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def get_stats(self) -> Dict:
+        return {
+            "backend": "s3",
+            "bucket": self.bucket,
+            "prefix": self.prefix,
+            "uploads": self.uploads,
+            "downloads": self.downloads,
+            "misses": self.misses
+        }
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Get the configured artifact store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if ARTIFACT_STORAGE == 's3':
+                    _store = S3ArtifactStore()
+                    print(f"🪣 Artifacts shared via S3 bucket {_store.bucket}")
+                elif ARTIFACT_STORAGE == 'local':
+                    _store = ArtifactStore()
+                else:
+                    raise ValueError(f"Unknown ARTIFACT_STORAGE: {ARTIFACT_STORAGE}")
+    return _store
+
+
+def image_key(image_path: str) -> str:
+    """Artifact key of a generated image, from its path or file name"""
+    return f"{IMAGE_FOLDER}/{os.path.basename(image_path)}"
+
+
+def garment_key(garment_id: str) -> str:
+    """Artifact key of a stored garment"""
+    return f"garments/{garment_id}.jpg"
+
+
+def publish_image(image_path: str) -> None:
+    """Share a newly generated image with the other nodes"""
+    store = get_artifact_store()
+    if store.remote:
+        store.upload(image_path, image_key(image_path))
+
+
+async def publish_image_async(image_path: str) -> None:
+    """Async version of publish_image; the upload runs in a worker thread"""
+    if get_artifact_store().remote:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, publish_image, image_path)
+
+
+def fetch_image(image_path: str) -> Optional[str]:
+    """
+    Get a local path of a generated image, downloading it if it was made on another node
+
+    Args:
+        image_path: Path as returned by the API (flat or sharded) or bare file name
+
+    Returns:
+        Local file path, or None if the image does not exist anywhere
+    """
+    if os.path.isfile(image_path):
+        return image_path
+    filename = os.path.basename(image_path)
+    local_path = resolve_image_path(filename)
+    if local_path is not None:
+        return local_path
+
+    store = get_artifact_store()
+    if not store.remote:
+        return None
+    local_path = shard_path(IMAGE_FOLDER, filename)
+    if store.download(image_key(filename), local_path):
+        print(f"🪣 Fetched {filename} from shared storage")
+        return local_path
+    return None
+
+
+async def fetch_image_async(image_path: str) -> Optional[str]:
+    """Async version of fetch_image; downloads run in a worker thread"""
+    if os.path.isfile(image_path):
+        return image_path
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, fetch_image, image_path)
+
+
+__all__ = [
+    "ARTIFACT_REDIRECT",
+    "ArtifactStore",
+    "S3ArtifactStore",
+    "fetch_image",
+    "fetch_image_async",
+    "garment_key",
+    "get_artifact_store",
+    "image_key",
+    "publish_image",
+    "publish_image_async"
+]
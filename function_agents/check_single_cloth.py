@@ -1,7 +1,9 @@
 import base64
-from openai import OpenAI
-
-client = OpenAI()
+from .clients import get_openai_client
+from .metrics import observe_stage
+from .scheduler import call_upstream_sync
+from .cloth_check_cache import compute_image_hashes_from_bytes, get_cloth_check_cache
+from .upstream_images import VALIDATION_IMAGE_DETAIL, downscale_image_bytes
 
 # Function to encode the image
 def encode_image(image_path):
@@ -9,6 +11,62 @@ def encode_image(image_path):
         return base64.b64encode(image_file.read()).decode("utf-8")
 
 
+def _ask_single_cloth(image_path):
+    """
+    调用GPT-4o判断图片是否为单件上衣，出错时抛出异常
+    """
+    with open(image_path, "rb") as image_file:
+        return _ask_single_cloth_bytes(image_file.read())
+
+
+@observe_stage('validation')
+def _ask_single_cloth_bytes(image_bytes, content_hash=None):
+    """
+    同 _ask_single_cloth，直接使用内存中的JPEG数据
+    
+    content_hash: 图片数据的SHA-256（已算过时传入），缩小后的图片按它缓存
+    """
+    # 低细节模式下GPT-4o只看512px，先缩小再编码，减少上传量和token
+    image_bytes = downscale_image_bytes(image_bytes, 'validation', content_hash)
+    
+    # Getting the Base64 string
+    base64_image = base64.b64encode(image_bytes).decode("utf-8")
+
+    response = call_upstream_sync('chat', 'gpt-4o', lambda: get_openai_client().chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    { 
+                        "type": "text", 
+                        "text": """
+                        Determine whether this image can be used to generate a virtual try-on image with a single top clothing item (such as a shirt, blouse, or jacket). Allow combinations that visually function as one top (e.g., a shirt with an inner layer), as long as they appear as a cohesive unit.
+
+                        Answer with `true` if the clothing in the image can reasonably be treated as one top item for try-on purposes, even if it includes inner layers or accessories. Answer `false` only if the image clearly includes multiple unrelated tops (e.g., jacket + different shirt + cardigan shown distinctly).
+
+                        Return only "true" or "false" without any explanation.
+                        """ 
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}",
+                            "detail": VALIDATION_IMAGE_DETAIL
+                        },
+                    },
+                ],
+            }
+        ],
+    ))
+
+    content = response.choices[0].message.content
+    if content is None:
+        return False
+    result = content.strip().lower()
+    return result == "true"
+
+
 def check_single_cloth(image_path):
     """
     检查图片是否包含单件上衣，适合虚拟试衣
@@ -20,59 +78,63 @@ def check_single_cloth(image_path):
         bool: True如果图片满足要求，False如果不满足
     """
     try:
-        # Getting the Base64 string
-        base64_image = encode_image(image_path)
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        { 
-                            "type": "text", 
-                            "text": """
-                            Determine whether this image can be used to generate a virtual try-on image with a single top clothing item (such as a shirt, blouse, or jacket). Allow combinations that visually function as one top (e.g., a shirt with an inner layer), as long as they appear as a cohesive unit.
-
-                            Answer with `true` if the clothing in the image can reasonably be treated as one top item for try-on purposes, even if it includes inner layers or accessories. Answer `false` only if the image clearly includes multiple unrelated tops (e.g., jacket + different shirt + cardigan shown distinctly).
-
-                            Return only "true" or "false" without any explanation.
-                            """ 
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            },
-                        },
-                    ],
-                }
-            ],
-        )
-
-        content = response.choices[0].message.content
-        if content is None:
-            return False
-        result = content.strip().lower()
-        return result == "true"
-        
+        return _ask_single_cloth(image_path)
     except Exception as e:
         print(f"检查衣服图片时出错: {e}")
         return False
 
 
-def check_cloth_validity(image_path):
+def check_single_cloth_cached(image_path):
     """
-    衣服有效性检查函数，与现有后端API兼容
+    带缓存的单件上衣检查：相同或近似（感知哈希）的图片直接返回缓存结果
     
     Args:
         image_path: 图片文件路径
         
     Returns:
-        dict: 包含检查结果的字典
+        bool: True如果图片满足要求，False如果不满足
     """
+    with open(image_path, "rb") as image_file:
+        return check_single_cloth_bytes_cached(image_file.read())
+
+
+def check_single_cloth_bytes_cached(image_bytes):
+    """
+    同 check_single_cloth_cached，直接检查内存中的JPEG数据
+    
+    Args:
+        image_bytes: JPEG图片数据
+        
+    Returns:
+        bool: True如果图片满足要求，False如果不满足
+    """
+    cache = get_cloth_check_cache()
+    hashes = None
+    try:
+        hashes = compute_image_hashes_from_bytes(image_bytes)
+    except Exception as e:
+        print(f"计算图片哈希失败，跳过缓存: {e}")
+    
+    if hashes is not None:
+        cached = cache.lookup(hashes)
+        if cached is not None:
+            return cached
+    
     try:
-        is_valid = check_single_cloth(image_path)
+        is_valid = _ask_single_cloth_bytes(image_bytes, hashes[0] if hashes else None)
+    except Exception as e:
+        # 出错的结果不缓存
+        print(f"检查衣服图片时出错: {e}")
+        return False
+    
+    if hashes is not None:
+        cache.store(hashes, is_valid)
+    return is_valid
+
+
+def _validity_result(check, image):
+    try:
+        is_valid = check(image)
         
         return {
             "valid": is_valid,
@@ -86,6 +148,32 @@ def check_cloth_validity(image_path):
         }
 
 
+def check_cloth_validity(image_path):
+    """
+    衣服有效性检查函数，与现有后端API兼容
+    
+    Args:
+        image_path: 图片文件路径
+        
+    Returns:
+        dict: 包含检查结果的字典
+    """
+    return _validity_result(check_single_cloth_cached, image_path)
+
+
+def check_cloth_validity_bytes(image_bytes):
+    """
+    衣服有效性检查函数（内存版本），无需先把图片写入磁盘
+    
+    Args:
+        image_bytes: JPEG图片数据
+        
+    Returns:
+        dict: 包含检查结果的字典
+    """
+    return _validity_result(check_single_cloth_bytes_cached, image_bytes)
+
+
 # 保留原有的测试功能
 if __name__ == "__main__":
     # 测试用的默认路径
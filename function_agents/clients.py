@@ -0,0 +1,247 @@
+"""
+Shared HTTP clients for all agents
+
+Every agent used to build its own OpenAI client (or a fresh one per request),
+paying DNS, TCP and TLS setup on every stage. This module keeps one
+long-lived, connection-pooled client per process that all agents share.
+
+Async clients are bound to an event loop, so they are kept per loop: the
+API server's loop gets one long-lived client, while the sync wrappers get a
+short-lived one for their private loop.
+
+Clients never retry on their own; rate limiting and retries are handled by
+the upstream scheduler (see scheduler.py). For agents, each model turn goes
+through the scheduler on its own, so a failed turn of a multi-turn agent is
+retried without re-running the tool calls of earlier turns.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import Any, Awaitable, Dict, Optional
+
+import httpx
+import requests
+from agents import Model, ModelProvider, OpenAIProvider, RunConfig
+from openai import AsyncOpenAI, OpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+from requests.adapters import HTTPAdapter
+
+from .scheduler import call_upstream
+from .tracing import client_event_hooks
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 100))
+OPENAI_MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', 20))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 120))  # seconds
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 10))
+# gpt-image-1 high quality generations regularly take over a minute
+OPENAI_READ_TIMEOUT = float(os.getenv('OPENAI_READ_TIMEOUT', 300))
+OPENAI_HTTP2 = os.getenv('OPENAI_HTTP2', 'true').lower() == 'true'
+
+_lock = threading.Lock()
+_openai_client: Optional[OpenAI] = None
+_http_session: Optional[requests.Session] = None
+# Per event loop: async client
+_loop_states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (pip install httpx[http2])"""
+    if not OPENAI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _client_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        OPENAI_READ_TIMEOUT,
+        connect=OPENAI_CONNECT_TIMEOUT,
+        write=OPENAI_READ_TIMEOUT,
+        pool=OPENAI_CONNECT_TIMEOUT
+    )
+
+
+def _client_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+    )
+
+
+def get_openai_client() -> OpenAI:
+    """Get the shared, connection-pooled OpenAI client"""
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                http_client = DefaultHttpxClient(
+                    limits=_client_limits(),
+                    timeout=_client_timeout(),
+                    http2=_http2_available(),
+                    # Every upstream HTTP request gets a client span
+                    event_hooks=client_event_hooks(is_async=False)
+                )
+                _openai_client = OpenAI(http_client=http_client, timeout=_client_timeout(), max_retries=0)
+    return _openai_client
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Get the connection-pooled AsyncOpenAI client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    state = _loop_state(loop)
+    if 'client' not in state:
+        http_client = DefaultAsyncHttpxClient(
+            limits=_client_limits(),
+            timeout=_client_timeout(),
+            http2=_http2_available(),
+            event_hooks=client_event_hooks(is_async=True)
+        )
+        state['client'] = AsyncOpenAI(http_client=http_client, timeout=_client_timeout(), max_retries=0)
+    return state['client']
+
+
+class ScheduledModel(Model):
+    """Agent model whose turns wait for a scheduler slot and token and are retried by the scheduler"""
+
+    def __init__(self, model: Model, model_name: str):
+        self.model = model
+        self.model_name = model_name
+
+    async def get_response(self, *args, **kwargs):
+        return await call_upstream('chat', self.model_name, lambda: self.model.get_response(*args, **kwargs))
+
+    def stream_response(self, *args, **kwargs):
+        # Not scheduled: a partially consumed stream cannot be retried
+        return self.model.stream_response(*args, **kwargs)
+
+    def get_retry_advice(self, request):
+        return self.model.get_retry_advice(request)
+
+    async def _cleanup_on_run_end(self, owner: object) -> None:
+        await self.model._cleanup_on_run_end(owner)
+
+    async def close(self) -> None:
+        await self.model.close()
+
+
+class ScheduledModelProvider(ModelProvider):
+    """Wraps a provider's models in ScheduledModel"""
+
+    def __init__(self, provider: ModelProvider):
+        self.provider = provider
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        model = self.provider.get_model(model_name)
+        return ScheduledModel(model, model_name or getattr(model, 'model', None) or 'default')
+
+    async def aclose(self) -> None:
+        await self.provider.aclose()
+
+
+def agent_run_config() -> RunConfig:
+    """RunConfig that makes Runner.run use the pooled async client, with every model turn scheduled"""
+    return RunConfig(model_provider=ScheduledModelProvider(OpenAIProvider(openai_client=get_async_openai_client())))
+
+
+def _loop_state(loop: asyncio.AbstractEventLoop) -> Dict[str, Any]:
+    with _lock:
+        if loop not in _loop_states:
+            _loop_states[loop] = {}
+        return _loop_states[loop]
+
+
+async def aclose_async_clients() -> None:
+    """Close the async client of the running event loop"""
+    state = _loop_states.pop(asyncio.get_running_loop(), None)
+    if state and 'client' in state:
+        await state['client'].close()
+
+
+def run_sync(coro: Awaitable) -> Any:
+    """Run an async agent call from synchronous code on a private event loop"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        try:
+            loop.run_until_complete(aclose_async_clients())
+        finally:
+            loop.close()
+
+
+def get_http_session() -> requests.Session:
+    """Get the shared requests session used to download generated images"""
+    global _http_session
+    if _http_session is None:
+        with _lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=OPENAI_MAX_KEEPALIVE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+
+def warm_up_clients() -> Dict:
+    """
+    Open pooled connections ahead of the first request
+
+    Listing models is free and forces DNS resolution, TCP and TLS setup,
+    so the first try-on does not pay for them.
+    """
+    try:
+        get_openai_client().models.list()
+        get_http_session()
+        print(f"🔥 OpenAI client warmed up (http2={_http2_available()})")
+        return {"status": "ready", "http2": _http2_available()}
+    except Exception as e:
+        print(f"⚠️ OpenAI client warm-up failed: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+async def warm_up_async_clients() -> Dict:
+    """
+    Like warm_up_clients, for the running event loop's AsyncOpenAI client
+
+    Agents and image calls on the API server's loop use this client, so it is
+    the one whose connections the first try-on would otherwise set up.
+    """
+    try:
+        await get_async_openai_client().models.list()
+        print("🔥 Async OpenAI client warmed up")
+        return {"status": "ready", "http2": _http2_available()}
+    except Exception as e:
+        print(f"⚠️ Async OpenAI client warm-up failed: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+def close_clients() -> None:
+    """Close pooled connections"""
+    global _openai_client, _http_session
+    with _lock:
+        if _openai_client is not None:
+            _openai_client.close()
+            _openai_client = None
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+
+
+__all__ = [
+    "get_openai_client",
+    "get_async_openai_client",
+    "agent_run_config",
+    "aclose_async_clients",
+    "run_sync",
+    "get_http_session",
+    "warm_up_clients",
+    "warm_up_async_clients",
+    "close_clients"
+]
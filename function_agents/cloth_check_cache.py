@@ -0,0 +1,246 @@
+"""
+Clothing Check Cache - reuse validation verdicts for known garments
+
+Verdicts from check_single_cloth are keyed on the SHA-256 of the image bytes
+(exact matches) plus 64-bit average and difference hashes, so re-encoded or
+slightly resized copies of a garment hit the cache as well.
+
+Near-duplicates are found with multi-index hashing: the dHash is split into
+max_distance + 1 bands, and any hash within max_distance bits of another
+equals it exactly in at least one band (pigeonhole), so only entries
+sharing a band value are compared instead of every cached entry.
+"""
+
+import hashlib
+import os
+from io import BytesIO
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from PIL import Image
+
+CLOTH_CHECK_CACHE_SIZE = int(os.getenv('CLOTH_CHECK_CACHE_SIZE', 10000))
+# Maximum Hamming distance (out of 64 bits) for a near-duplicate match, -1 disables perceptual matching
+CLOTH_CHECK_HASH_DISTANCE = int(os.getenv('CLOTH_CHECK_HASH_DISTANCE', 4))
+# Optional on-disk tier, empty to disable
+CLOTH_CHECK_CACHE_DB_PATH = os.getenv('CLOTH_CHECK_CACHE_DB_PATH', 'cloth_check_cache.db')
+
+
+def average_hash(image: Image.Image, hash_size: int = 8) -> int:
+    """64-bit aHash: each bit says whether a pixel is brighter than the mean"""
+    pixels = list(image.convert('L').resize((hash_size, hash_size), Image.LANCZOS).getdata())
+    mean = sum(pixels) / len(pixels)
+    value = 0
+    for pixel in pixels:
+        value = (value << 1) | (1 if pixel > mean else 0)
+    return value
+
+
+def difference_hash(image: Image.Image, hash_size: int = 8) -> int:
+    """64-bit dHash: each bit says whether a pixel is brighter than its right neighbour"""
+    width = hash_size + 1
+    pixels = list(image.convert('L').resize((width, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * width + col]
+            right = pixels[row * width + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def _band_ranges(max_distance: int, bits: int = 64) -> List[Tuple[int, int]]:
+    """(shift, mask) of the max_distance + 1 bands a hash is split into for multi-index lookup"""
+    if max_distance < 0 or max_distance + 1 > bits // 2:
+        # Disabled, or bands under 2 bits, which would match nearly everything anyway
+        return []
+    count = max_distance + 1
+    bounds = [bits * band // count for band in range(count + 1)]
+    return [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+
+
+def compute_image_hashes(image_path: str) -> Tuple[str, int, int]:
+    """Compute (sha256, aHash, dHash) for an image file"""
+    with open(image_path, 'rb') as f:
+        return compute_image_hashes_from_bytes(f.read())
+
+
+def compute_image_hashes_from_bytes(image_bytes: bytes) -> Tuple[str, int, int]:
+    """Compute (sha256, aHash, dHash) for encoded image bytes"""
+    sha256 = hashlib.sha256(image_bytes).hexdigest()
+    with Image.open(BytesIO(image_bytes)) as image:
+        # Let the JPEG decoder downscale while decoding, the hashes only need a few pixels
+        image.draft('L', (64, 64))
+        return sha256, average_hash(image), difference_hash(image)
+
+
+class ClothCheckCache:
+    """LRU cache of clothing verdicts with exact and perceptual-hash lookup"""
+
+    def __init__(self,
+                 max_entries: int = CLOTH_CHECK_CACHE_SIZE,
+                 max_distance: int = CLOTH_CHECK_HASH_DISTANCE,
+                 db_path: Optional[str] = CLOTH_CHECK_CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.db_path = db_path or None
+        self.exact_hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        # sha256 -> (ahash, dhash, is_valid)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Per dHash band: band value -> sha256s; none when there are too few bits per band to index
+        self._bands = _band_ranges(max_distance)
+        self._band_index: List[Dict[int, Set[str]]] = [{} for _ in self._bands]
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.db_path:
+            return
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cloth_checks (sha256 TEXT PRIMARY KEY, "
+                "ahash TEXT NOT NULL, dhash TEXT NOT NULL, is_valid INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.commit()
+            rows = conn.execute(
+                "SELECT sha256, ahash, dhash, is_valid FROM cloth_checks ORDER BY created_at DESC LIMIT ?",
+                (self.max_entries,)
+            ).fetchall()
+        finally:
+            conn.close()
+        for sha256, ahash, dhash, is_valid in reversed(rows):
+            self._insert(sha256, (int(ahash, 16), int(dhash, 16), bool(is_valid)))
+
+    def _insert(self, sha256: str, entry: tuple) -> None:
+        """Add or replace an entry as most recently used, evicting the oldest beyond max_entries"""
+        previous = self._entries.pop(sha256, None)
+        if previous is not None:
+            self._unindex(sha256, previous[1])
+        self._entries[sha256] = entry
+        self._index(sha256, entry[1])
+        while len(self._entries) > self.max_entries:
+            evicted, (_, evicted_dhash, _) = self._entries.popitem(last=False)
+            self._unindex(evicted, evicted_dhash)
+
+    def _index(self, sha256: str, dhash: int) -> None:
+        for index, (shift, mask) in zip(self._band_index, self._bands):
+            index.setdefault((dhash >> shift) & mask, set()).add(sha256)
+
+    def _unindex(self, sha256: str, dhash: int) -> None:
+        for index, (shift, mask) in zip(self._band_index, self._bands):
+            band = (dhash >> shift) & mask
+            keys = index.get(band)
+            if keys is not None:
+                keys.discard(sha256)
+                if not keys:
+                    del index[band]
+
+    def _candidates(self, dhash: int) -> Iterable[str]:
+        """Entries that may be within max_distance of dhash"""
+        if not self._bands:
+            return list(self._entries)
+        candidates: Set[str] = set()
+        for index, (shift, mask) in zip(self._band_index, self._bands):
+            candidates.update(index.get((dhash >> shift) & mask, ()))
+        return candidates
+
+    def lookup(self, hashes: Tuple[str, int, int]) -> Optional[bool]:
+        """Get the cached verdict for an image, or None on a miss"""
+        sha256, ahash, dhash = hashes
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                entry = self._entries.get(sha256)
+                if entry is not None:
+                    self._entries.move_to_end(sha256)
+                    self.exact_hits += 1
+                    return entry[2]
+
+                if self.max_distance >= 0:
+                    best_key, best_distance = None, None
+                    for key in self._candidates(dhash):
+                        cached_ahash, cached_dhash, _ = self._entries[key]
+                        distance = hamming_distance(dhash, cached_dhash)
+                        if (distance <= self.max_distance
+                                and hamming_distance(ahash, cached_ahash) <= self.max_distance
+                                and (best_distance is None or distance < best_distance)):
+                            best_key, best_distance = key, distance
+                    if best_key is not None:
+                        self._entries.move_to_end(best_key)
+                        self.perceptual_hits += 1
+                        return self._entries[best_key][2]
+
+                self.misses += 1
+                return None
+            finally:
+                self.lookup_seconds += time.perf_counter() - started
+
+    def store(self, hashes: Tuple[str, int, int], is_valid: bool) -> None:
+        """Remember the verdict for an image"""
+        sha256, ahash, dhash = hashes
+        with self._lock:
+            self._insert(sha256, (ahash, dhash, is_valid))
+
+        if not self.db_path:
+            return
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cloth_checks (sha256, ahash, dhash, is_valid, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (sha256, f"{ahash:016x}", f"{dhash:016x}", int(is_valid), time.time())
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Clothing check cache write failed: {e}")
+
+    def get_stats(self) -> Dict:
+        """Get hit rate and lookup latency"""
+        hits = self.exact_hits + self.perceptual_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_hash_distance": self.max_distance,
+            "exact_hits": self.exact_hits,
+            "perceptual_hits": self.perceptual_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "avg_lookup_us": round(self.lookup_seconds / lookups * 1e6, 2) if lookups else 0.0
+        }
+
+
+_cache: Optional[ClothCheckCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cloth_check_cache() -> ClothCheckCache:
+    """Get the shared clothing check cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ClothCheckCache()
+    return _cache
+
+
+__all__ = [
+    "ClothCheckCache",
+    "compute_image_hashes",
+    "compute_image_hashes_from_bytes",
+    "get_cloth_check_cache"
+]
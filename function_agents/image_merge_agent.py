@@ -1,61 +1,89 @@
 import base64
+import hashlib
 import os
-import uuid
 import asyncio
-from openai import OpenAI
 from PIL import Image
 from io import BytesIO
-from typing import Optional
+from typing import List, Optional, Tuple
 from agents import Agent, Runner, function_tool
+from .clients import agent_run_config, get_async_openai_client, run_sync
+from .artifact_store import fetch_image_async, publish_image_async
+from .metrics import observe_stage
+from .scheduler import call_upstream
+from .single_flight import SingleFlight
+from .storage import new_image_path
+from .translation_memo import contains_chinese, get_translation_memo_async, normalize_source
+from .upstream_images import get_upstream_image
 
-# Initialize OpenAI client
-client = OpenAI()
+# Build the merge prompt locally and only call the LLM to translate Chinese text
+MERGE_FAST_MODE = os.getenv('MERGE_FAST_MODE', 'true').lower() == 'true'
 
-@function_tool
-def image_merge(img1: str, img2: str, prompt: str) -> str:
-    """
-    Merge two images using OpenAI's image edit API
-    """
+# Concurrent merges of the same clothing onto the same model with the same settings share one result
+_merge_flight = SingleFlight('merge')
+
+def _read_image_files(*paths: str) -> List[Tuple[str, bytes, str]]:
+    """Read images as (filename, bytes, mime type) uploads for images.edit, downscaled to what gpt-image-1 uses"""
+    files = []
+    for path in paths:
+        image_bytes, mime_type = get_upstream_image(path, 'edit')
+        files.append((os.path.basename(path), image_bytes, mime_type))
+    return files
+
+@observe_stage('result_encode')
+def _save_merged_image(image_base64: str, output_path: str) -> None:
+    """Decode the edited image and save it as JPEG"""
+    image_bytes = base64.b64decode(image_base64)
+    
+    image = Image.open(BytesIO(image_bytes))
+    
+    # Handle RGBA format conversion only
+    if image.mode == 'RGBA':
+        image = image.convert('RGB')
+    
+    image.save(output_path, format="JPEG", quality=90, optimize=True, progressive=True)
+
+async def _edit_images(img1: str, img2: str, prompt: str) -> str:
+    """Call images.edit with the model and clothing images and save the result"""
     try:
         print(f"📝 Generated prompt: {prompt}")
         
+        # The model image may have been generated on another node
+        img1 = await fetch_image_async(img1) or img1
         if not os.path.exists(img1) or not os.path.exists(img2):
             raise FileNotFoundError("One or both image paths do not exist")
 
-        with open(img1, "rb") as img1_file, open(img2, "rb") as img2_file:
-            result_edit = client.images.edit(
+        # File reads and JPEG encoding run in worker threads to keep the event loop free
+        loop = asyncio.get_running_loop()
+        images = await loop.run_in_executor(None, _read_image_files, img1, img2)
+        
+        with observe_stage('images_edit'):
+            result_edit = await call_upstream('images', 'gpt-image-1', lambda: get_async_openai_client().images.edit(
                 model="gpt-image-1",
-                image=[img1_file, img2_file], 
+                image=images, 
                 prompt=prompt,
                 size="1024x1536",
                 quality="high"
-            )
+            ))
+
+        output_path = new_image_path('tryon')
 
-            # Use consistent 8-character UUID naming, same as model image naming convention
-            unique_id = uuid.uuid4().hex[:8]
-            output_filename = f"tryon_{unique_id}.jpg"
-            output_dir = "imgs"
-            os.makedirs(output_dir, exist_ok=True)
-            output_path = os.path.join(output_dir, output_filename)
-
-            if result_edit.data and result_edit.data[0].b64_json:
-                image_base64 = result_edit.data[0].b64_json
-                image_bytes = base64.b64decode(image_base64)
-                
-                image = Image.open(BytesIO(image_bytes))
-                
-                # Handle RGBA format conversion only
-                if image.mode == 'RGBA':
-                    image = image.convert('RGB')
-                
-                image.save(output_path, format="JPEG", quality=90, optimize=True)
-                return output_path
-            else:
-                raise ValueError("No image data received from API")
+        if result_edit.data and result_edit.data[0].b64_json:
+            await loop.run_in_executor(None, _save_merged_image, result_edit.data[0].b64_json, output_path)
+            await publish_image_async(output_path)
+            return output_path
+        else:
+            raise ValueError("No image data received from API")
 
     except Exception as e:
         raise ValueError(f"Image merge failed: {str(e)}")
 
+@function_tool
+async def image_merge(img1: str, img2: str, prompt: str) -> str:
+    """
+    Merge two images using OpenAI's image edit API
+    """
+    return await _edit_images(img1, img2, prompt)
+
 # Translation agent
 english_translate_agent = Agent(
     name="Fashion English Translator",
@@ -121,13 +149,134 @@ Example prompt:
     model="gpt-4o"
 )
 
+# Fast mode: deterministic prompt builder
+_SHOT_TYPES = {
+    "full_body": "full body",
+    "全身": "full body",
+    "half_body": "half body",
+    "半身": "half body",
+}
+
+_ANGLES = {
+    "front": "The model is positioned facing the camera.",
+    "正面": "The model is positioned facing the camera.",
+    "side": "The model is positioned at a side-facing angle.",
+    "侧面": "The model is positioned at a side-facing angle.",
+}
+
+DEFAULT_POSE_SENTENCE = "The model stands naturally with a relaxed, confident posture."
+
+# Translations that are already sentences about the model or background are used as they are
+_POSE_SUBJECTS = ("the model", "model ", "she ", "he ", "they ")
+_SCENE_SUBJECTS = ("the background", "background ", "the setting", "the scene")
+
+def _as_sentence(text: str) -> str:
+    text = text.strip().rstrip("。.")
+    return f"{text[0].upper()}{text[1:]}." if text else ""
+
+def _as_phrase(text: str) -> str:
+    """A translated fragment as a phrase to insert mid-sentence: no closing punctuation or leading capital"""
+    text = (text or "").strip().rstrip("。.!！ ")
+    if len(text) > 1 and text[0].isupper() and not text[1].isupper():
+        text = text[0].lower() + text[1:]
+    return text
+
+def _with_article(phrase: str) -> str:
+    if phrase.lower().startswith(("a ", "an ", "the ")):
+        return phrase
+    return f"{'an' if phrase[0].lower() in 'aeiou' else 'a'} {phrase}"
+
+def _pose_sentence(pose_description: str) -> str:
+    """Sentence 3 of the merge prompt, e.g. "Natural standing pose" -> "The model is in a natural standing pose." """
+    phrase = _as_phrase(pose_description)
+    if not phrase:
+        return DEFAULT_POSE_SENTENCE
+    if phrase.lower().startswith(_POSE_SUBJECTS):
+        return _as_sentence(phrase)
+    if phrase.lower().endswith(("pose", "posture", "stance")):
+        return f"The model is in {_with_article(phrase)}."
+    if phrase.split()[0].lower().endswith("ing"):
+        # "Walking toward the viewer" -> "The model is walking toward the viewer."
+        return f"The model is {phrase}."
+    return f"The model is in {_with_article(phrase)} pose."
+
+def _scene_sentence(scene_description: str) -> str:
+    """Sentence 4 of the merge prompt, e.g. "Simple studio background" -> "The background is a simple studio." """
+    phrase = _as_phrase(scene_description)
+    if not phrase:
+        return ""
+    if phrase.lower().startswith(_SCENE_SUBJECTS):
+        return _as_sentence(phrase)
+    for suffix in (" background", " backdrop"):
+        if phrase.lower().endswith(suffix) and len(phrase) > len(suffix):
+            phrase = phrase[:-len(suffix)]
+    return f"The background is {_with_article(phrase)}."
+
+async def translate_to_english_async(text: str) -> str:
+    """
+    Translate Chinese text to English
+    
+    Text without Chinese characters is returned unchanged, and known texts come
+    from the translation memo; only new Chinese text reaches the translator agent.
+    """
+    if not contains_chinese(text):
+        return text
+    
+    memo = await get_translation_memo_async()
+    translation = memo.get(text)
+    if translation is not None:
+        return translation
+    
+    result = await Runner.run(english_translate_agent, text, run_config=agent_run_config())
+    translation = str(result.final_output).strip()
+    await memo.set_async(text, translation)
+    return translation
+
+def build_merge_prompt(shot_type: str,
+                       angle: str,
+                       pose_description: str = "",
+                       scene_description: str = "") -> str:
+    """
+    Build the 3-4 sentence merge prompt with the same structure the orchestrator agent produces
+    
+    Pose and scene descriptions must already be in English; fragments such as
+    "Natural standing pose" are put into full sentences about the model and
+    the background, like the agent's example prompt.
+    """
+    shot = _SHOT_TYPES.get((shot_type or "").strip(), "full body")
+    sentences = [
+        f"This is a {shot} fashion photograph of a model wearing the uploaded clothing.",
+        _ANGLES.get((angle or "").strip(), _ANGLES["front"]),
+        _pose_sentence(pose_description),
+    ]
+    scene = _scene_sentence(scene_description)
+    if scene:
+        sentences.append(scene)
+    return " ".join(sentences)
+
+async def _merge_fast(model_image_path: str,
+                      clothing_image_path: str,
+                      shot_type: str,
+                      angle: str,
+                      pose_description: str,
+                      scene_description: str) -> str:
+    """Merge without the orchestrator agent: translate if needed, build the prompt, edit"""
+    with observe_stage('merge_prompt'):
+        pose_english, scene_english = await asyncio.gather(
+            translate_to_english_async(pose_description or ""),
+            translate_to_english_async(scene_description or "")
+        )
+        prompt = build_merge_prompt(shot_type, angle, pose_english, scene_english)
+    return await _edit_images(model_image_path, clothing_image_path, prompt)
+
 # Main interface function
 def merge_model_with_clothing(model_image_path: str,
                                clothing_image_path: str,
                                shot_type: str = "full_body",
                                angle: str = "front",
                                pose_description: str = "natural standing pose",
-                               scene_description: str = "minimalist studio background") -> str:
+                               scene_description: str = "minimalist studio background",
+                               fast_mode: Optional[bool] = None) -> str:
     """
     Merge model with clothing using AI image editing
     
@@ -138,6 +287,31 @@ def merge_model_with_clothing(model_image_path: str,
         angle: Camera angle ("front" or "side")
         pose_description: Pose description (optional, supports Chinese)
         scene_description: Scene description (optional, supports Chinese)
+        fast_mode: Build the prompt locally instead of through the orchestrator
+            agent; defaults to MERGE_FAST_MODE
+    
+    Returns:
+        str: Path to generated image
+    """
+    return run_sync(merge_model_with_clothing_async(
+        model_image_path,
+        clothing_image_path,
+        shot_type=shot_type,
+        angle=angle,
+        pose_description=pose_description,
+        scene_description=scene_description,
+        fast_mode=fast_mode
+    ))
+
+async def merge_model_with_clothing_async(model_image_path: str,
+                                          clothing_image_path: str,
+                                          shot_type: str = "full_body",
+                                          angle: str = "front",
+                                          pose_description: str = "natural standing pose",
+                                          scene_description: str = "minimalist studio background",
+                                          fast_mode: Optional[bool] = None) -> str:
+    """
+    Async version of merge_model_with_clothing that awaits the agent run directly
     
     Returns:
         str: Path to generated image
@@ -149,7 +323,65 @@ def merge_model_with_clothing(model_image_path: str,
     print(f"💃 Pose: {pose_description}")
     print(f"🏠 Scene: {scene_description}")
 
+    if fast_mode is None:
+        fast_mode = MERGE_FAST_MODE
+
+    # Uploaded copies of the same garment land in different temp files, so key on the content
+    loop = asyncio.get_running_loop()
     try:
+        clothing_key = await loop.run_in_executor(None, _file_sha256, clothing_image_path)
+    except OSError:
+        clothing_key = clothing_image_path
+    key = (
+        model_image_path,
+        clothing_key,
+        _SHOT_TYPES.get(shot_type, shot_type),
+        _ANGLES.get(angle, angle),
+        normalize_source(pose_description),
+        normalize_source(scene_description),
+        fast_mode
+    )
+    return await _merge_flight.run(key, lambda: _merge(
+        model_image_path,
+        clothing_image_path,
+        shot_type,
+        angle,
+        pose_description,
+        scene_description,
+        fast_mode
+    ))
+
+def _file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+async def _merge(model_image_path: str,
+                 clothing_image_path: str,
+                 shot_type: str,
+                 angle: str,
+                 pose_description: str,
+                 scene_description: str,
+                 fast_mode: bool) -> str:
+    try:
+        if fast_mode:
+            final_path = await _merge_fast(
+                model_image_path,
+                clothing_image_path,
+                shot_type,
+                angle,
+                pose_description,
+                scene_description
+            )
+            print(f"✅ Virtual try-on completed: {final_path}")
+            return final_path
+
+        # Translate through the memo first so the orchestrator rarely needs its translate tool
+        with observe_stage('merge_prompt'):
+            pose_description, scene_description = await asyncio.gather(
+                translate_to_english_async(pose_description or ""),
+                translate_to_english_async(scene_description or "")
+            )
+
         input_text = f"""
 Process virtual try-on task with these parameters:
 - Model image path: {model_image_path}
@@ -162,16 +394,12 @@ Process virtual try-on task with these parameters:
 Please generate a 4-sentence fashion photography prompt. Translate Chinese descriptions to English if needed.
 """
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(Runner.run(agent, input_text))
-            final_path = result.final_output
-            
-            print(f"✅ Virtual try-on completed: {final_path}")
-            
-        finally:
-            loop.close()
+        # Not retried as a whole: each model turn is scheduled on its own, and the
+        # image_merge tool's images.edit call is scheduled separately
+        result = await Runner.run(agent, input_text, run_config=agent_run_config())
+        final_path = result.final_output
+        
+        print(f"✅ Virtual try-on completed: {final_path}")
 
         return final_path
 
@@ -179,4 +407,9 @@ Please generate a 4-sentence fashion photography prompt. Translate Chinese descr
         print(f"❌ Virtual try-on failed: {str(e)}")
         raise
 
-__all__ = ["merge_model_with_clothing"]
+__all__ = [
+    "merge_model_with_clothing",
+    "merge_model_with_clothing_async",
+    "build_merge_prompt",
+    "contains_chinese"
+]
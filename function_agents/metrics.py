@@ -0,0 +1,285 @@
+"""
+Metrics - Prometheus counters, gauges and histograms
+
+A small, dependency-free implementation of the Prometheus text exposition
+format. Instruments are updated from any thread; collectors are callbacks
+that turn existing get_stats() results into samples at scrape time, so the
+caches and schedulers keep a single source of truth.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .tracing import span
+
+# Stage latencies range from microseconds (cache hits) to minutes (image generation)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+# (name, type, help, [(labels, value)]) as produced by collectors
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down per label set"""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets per label set"""
+
+    type = 'histogram'
+
+    def __init__(self,
+                 name: str,
+                 help_text: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (last is +Inf)], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the with-block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict[LabelValues, Tuple[int, float]]:
+        """Get (count, sum) per label set, e.g. to diff around a benchmark run"""
+        with self._lock:
+            return {key: (sum(counts), total[0]) for key, (counts, total) in self._values.items()}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Instruments and scrape-time collectors rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Add a callback returning (name, type, help, samples) families at scrape time"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+                continue
+            for name, metric_type, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    """Create and register a counter"""
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+    """Create and register a gauge"""
+    return REGISTRY.register(Gauge(name, help_text, labelnames))
+
+
+def histogram(name: str,
+              help_text: str,
+              labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Create and register a histogram"""
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+STAGE_SECONDS = histogram(
+    'tryon_stage_duration_seconds',
+    'Duration of pipeline stages (description, model_generation, merge_prompt, images_edit, validation, image codec work)',
+    ('stage',)
+)
+UPSTREAM_REQUESTS = counter(
+    'tryon_upstream_requests_total',
+    'Upstream API call attempts by outcome (HTTP status code, timeout, connection_error or error)',
+    ('upstream', 'model', 'status')
+)
+UPSTREAM_SECONDS = histogram(
+    'tryon_upstream_request_duration_seconds',
+    'Duration of upstream API call attempts',
+    ('upstream', 'model')
+)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """Time a pipeline stage in the stage histogram and as a trace span: `with observe_stage('images_edit'): ...`"""
+    with span(stage), STAGE_SECONDS.time(stage=stage):
+        yield
+
+
+def upstream_status(error: Optional[Exception]) -> str:
+    """Status label of an upstream call attempt"""
+    if error is None:
+        return '200'
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return str(status_code)
+    name = error.__class__.__name__
+    if name == 'APITimeoutError':
+        return 'timeout'
+    if name == 'APIConnectionError':
+        return 'connection_error'
+    return 'error'
+
+
+def render_metrics() -> str:
+    """Render all registered metrics in the Prometheus text format"""
+    return REGISTRY.render()
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "REGISTRY",
+    "counter",
+    "gauge",
+    "histogram",
+    "observe_stage",
+    "render_metrics",
+    "upstream_status"
+]
@@ -0,0 +1,209 @@
+"""
+Model Image Cache - reuse generated base model images
+
+The base model image only depends on gender, age, nationality, height and
+weight, so identical (or, with bucketing, similar) specs can share images
+generated for earlier requests. Entries are tracked in SQLite and evicted
+least-recently-used first once the cached files exceed the disk budget.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from .storage import touch_access
+
+MODEL_CACHE_ENABLED = os.getenv('MODEL_CACHE_ENABLED', 'true').lower() == 'true'
+MODEL_CACHE_DB_PATH = os.getenv('MODEL_CACHE_DB_PATH', 'model_cache.db')
+MODEL_CACHE_MAX_BYTES = int(os.getenv('MODEL_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # 2GB
+# Distinct images kept per key; requests rotate through them once all exist
+MODEL_CACHE_VARIANTS = int(os.getenv('MODEL_CACHE_VARIANTS', 1))
+# Bucket sizes for numeric specs, 0 disables bucketing
+MODEL_CACHE_AGE_BUCKET = int(os.getenv('MODEL_CACHE_AGE_BUCKET', 0))
+MODEL_CACHE_HEIGHT_BUCKET = int(os.getenv('MODEL_CACHE_HEIGHT_BUCKET', 0))
+MODEL_CACHE_WEIGHT_BUCKET = int(os.getenv('MODEL_CACHE_WEIGHT_BUCKET', 0))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS model_images (
+    image_path TEXT PRIMARY KEY,
+    cache_key TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_model_images_key ON model_images (cache_key);
+CREATE INDEX IF NOT EXISTS idx_model_images_access ON model_images (last_access);
+"""
+
+
+def _bucket(value: int, size: int) -> int:
+    return (value // size) * size if size > 0 else value
+
+
+class ModelImageCache:
+    """Persistent LRU cache of base model images keyed by normalized model specs"""
+
+    def __init__(self,
+                 db_path: str = MODEL_CACHE_DB_PATH,
+                 max_bytes: int = MODEL_CACHE_MAX_BYTES,
+                 variants: int = MODEL_CACHE_VARIANTS,
+                 age_bucket: int = MODEL_CACHE_AGE_BUCKET,
+                 height_bucket: int = MODEL_CACHE_HEIGHT_BUCKET,
+                 weight_bucket: int = MODEL_CACHE_WEIGHT_BUCKET):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.variants = max(1, variants)
+        self.age_bucket = age_bucket
+        self.height_bucket = height_bucket
+        self.weight_bucket = weight_bucket
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def make_key(self, model_specs: Dict) -> str:
+        """
+        Build the cache key from the basic model specs
+
+        Camera, pose and scene settings are ignored: they only affect the merge stage.
+        """
+        gender = str(model_specs.get('gender', 'female')).strip().lower()
+        nationality = str(model_specs.get('nationality', 'Chinese')).strip().lower()
+        age = _bucket(int(model_specs.get('age', 25)), self.age_bucket)
+        height = _bucket(int(model_specs.get('height', 170)), self.height_bucket)
+        weight = _bucket(int(model_specs.get('weight', 60)), self.weight_bucket)
+        return f"{gender}|{nationality}|{age}|{height}|{weight}"
+
+    def get(self, model_specs: Dict) -> Optional[str]:
+        """
+        Get a cached model image path, or None if a new image should be generated
+
+        While a key has fewer images than the configured number of variants every
+        lookup is a miss, so that the variants get filled in.
+        """
+        key = self.make_key(model_specs)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT image_path FROM model_images WHERE cache_key = ? ORDER BY last_access",
+                (key,)
+            ).fetchall()
+            # Drop entries whose files were removed behind our back
+            live = []
+            for row in rows:
+                if os.path.exists(row['image_path']):
+                    live.append(row['image_path'])
+                else:
+                    conn.execute("DELETE FROM model_images WHERE image_path = ?", (row['image_path'],))
+
+            if len(live) < self.variants:
+                self.misses += 1
+                return None
+
+            # Least recently used variant first, so requests rotate through variants
+            image_path = live[0]
+            conn.execute(
+                "UPDATE model_images SET last_access = ? WHERE image_path = ?",
+                (now, image_path)
+            )
+        touch_access(image_path)
+        self.hits += 1
+        return image_path
+
+    def put(self, model_specs: Dict, image_path: str) -> None:
+        """Register a newly generated model image and evict old entries over the disk budget"""
+        if not os.path.exists(image_path):
+            return
+        key = self.make_key(model_specs)
+        now = time.time()
+        size_bytes = os.path.getsize(image_path)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO model_images "
+                "(image_path, cache_key, size_bytes, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (image_path, key, size_bytes, now, now)
+            )
+            self._evict(conn, keep=image_path)
+
+    def _evict(self, conn: sqlite3.Connection, keep: str) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM model_images").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in conn.execute(
+            "SELECT image_path, size_bytes FROM model_images WHERE image_path != ? ORDER BY last_access",
+            (keep,)
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            if os.path.exists(row['image_path']):
+                os.remove(row['image_path'])
+            conn.execute("DELETE FROM model_images WHERE image_path = ?", (row['image_path'],))
+            total -= row['size_bytes']
+            print(f"🧹 Evicted cached model image: {row['image_path']}")
+
+    def get_stats(self) -> Dict:
+        """Get cache size and hit/miss counters"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS size_bytes FROM model_images"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": MODEL_CACHE_ENABLED,
+            "entries": row['entries'],
+            "size_bytes": row['size_bytes'],
+            "max_bytes": self.max_bytes,
+            "variants": self.variants,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+_cache: Optional[ModelImageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_model_image_cache() -> ModelImageCache:
+    """Get the shared model image cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ModelImageCache()
+    return _cache
+
+
+def lookup_model_image(model_specs: Dict, bypass_cache: bool = False) -> Optional[str]:
+    """Look up a cached model image for these specs, honouring the enable and bypass flags"""
+    if bypass_cache or not MODEL_CACHE_ENABLED:
+        return None
+    return get_model_image_cache().get(model_specs)
+
+
+def store_model_image(model_specs: Dict, image_path: str) -> None:
+    """Add a freshly generated model image to the cache"""
+    if MODEL_CACHE_ENABLED:
+        get_model_image_cache().put(model_specs, image_path)
+
+
+__all__ = [
+    "ModelImageCache",
+    "get_model_image_cache",
+    "lookup_model_image",
+    "store_model_image"
+]
@@ -1,9 +1,23 @@
+import asyncio
 import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, Optional, List, Union
 from pydantic import BaseModel, Field
 from agents import Agent, Runner
-import asyncio
 from string import Template
+from .clients import agent_run_config, run_sync
+from .metrics import observe_stage
+from .single_flight import SingleFlight
+
+# Description cache settings
+DESCRIPTION_CACHE_SIZE = int(os.getenv('DESCRIPTION_CACHE_SIZE', 512))
+DESCRIPTION_CACHE_TTL = int(os.getenv('DESCRIPTION_CACHE_TTL', 7 * 24 * 3600))  # seconds
+# Optional on-disk tier shared across processes and restarts, empty to disable
+DESCRIPTION_CACHE_DB_PATH = os.getenv('DESCRIPTION_CACHE_DB_PATH', 'description_cache.db')
 
 TEMPLATE = Template("""
 Model Specifications:
@@ -18,9 +32,159 @@ class ModelDescription(BaseModel):
     """Model description data structure focusing on basic model characteristics"""
     prompt: str = Field(..., description="Main prompt text for GPT-image-1")
 
+class DescriptionCache:
+    """Bounded in-memory LRU with TTL and an optional SQLite tier, keyed by the rendered TEMPLATE text"""
+    
+    def __init__(self,
+                 max_entries: int = DESCRIPTION_CACHE_SIZE,
+                 ttl_seconds: int = DESCRIPTION_CACHE_TTL,
+                 db_path: Optional[str] = DESCRIPTION_CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path or None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (description, created_at)
+        self._lock = threading.Lock()
+        
+        if self.db_path:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS descriptions "
+                    "(input_text TEXT PRIMARY KEY, description TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                conn.commit()
+            finally:
+                conn.close()
+    
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+    
+    def get(self, input_text: str) -> Optional[str]:
+        """Get a cached description, or None if missing or expired"""
+        cached = self._memory_get(input_text)
+        if cached is not None:
+            return cached
+        return self._disk_lookup(input_text)
+    
+    async def get_async(self, input_text: str) -> Optional[str]:
+        """Like get, with the SQLite tier read in the default executor instead of on the event loop"""
+        cached = self._memory_get(input_text)
+        if cached is not None or not self.db_path:
+            return cached if cached is not None else self._disk_lookup(input_text)
+        return await asyncio.get_running_loop().run_in_executor(None, self._disk_lookup, input_text)
+    
+    def set(self, input_text: str, description: str) -> None:
+        """Store a generated description in both tiers"""
+        entry = (description, time.time())
+        with self._lock:
+            self._remember(input_text, entry)
+        self._disk_set(input_text, entry)
+    
+    async def set_async(self, input_text: str, description: str) -> None:
+        """Like set, with the SQLite tier written in the default executor"""
+        entry = (description, time.time())
+        with self._lock:
+            self._remember(input_text, entry)
+        if self.db_path:
+            await asyncio.get_running_loop().run_in_executor(None, self._disk_set, input_text, entry)
+    
+    def _memory_get(self, input_text: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(input_text)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._entries.move_to_end(input_text)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[input_text]
+        return None
+    
+    def _disk_lookup(self, input_text: str) -> Optional[str]:
+        """Second tier of get: read SQLite and promote a fresh entry into memory"""
+        entry = self._disk_get(input_text)
+        with self._lock:
+            if entry is not None and not self._expired(entry[1]):
+                self._remember(input_text, entry)
+                self.disk_hits += 1
+                return entry[0]
+            self.misses += 1
+        return None
+    
+    def _remember(self, input_text: str, entry: tuple) -> None:
+        self._entries[input_text] = entry
+        self._entries.move_to_end(input_text)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _disk_get(self, input_text: str) -> Optional[tuple]:
+        if not self.db_path:
+            return None
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                row = conn.execute(
+                    "SELECT description, created_at FROM descriptions WHERE input_text = ?",
+                    (input_text,)
+                ).fetchone()
+            finally:
+                conn.close()
+            return tuple(row) if row else None
+        except sqlite3.Error as e:
+            print(f"⚠️ Description cache read failed: {e}")
+            return None
+    
+    def _disk_set(self, input_text: str, entry: tuple) -> None:
+        if not self.db_path:
+            return
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO descriptions (input_text, description, created_at) VALUES (?, ?, ?)",
+                    (input_text, entry[0], entry[1])
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Description cache write failed: {e}")
+    
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_tier": bool(self.db_path),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
+
+_description_cache: Optional[DescriptionCache] = None
+_description_cache_lock = threading.Lock()
+
+def get_description_cache() -> DescriptionCache:
+    """Get the shared description cache"""
+    global _description_cache
+    if _description_cache is None:
+        with _description_cache_lock:
+            if _description_cache is None:
+                _description_cache = DescriptionCache()
+    return _description_cache
+
+# Concurrent requests for the same rendered specs share one LLM call
+_description_flight = SingleFlight('description')
+
 class ModelDescriptionAgent:
-    def __init__(self):
+    def __init__(self, cache: Optional[DescriptionCache] = None):
         """Initialize GPT-4o based model description generator"""
+        self.cache = cache if cache is not None else get_description_cache()
         self.agent = Agent(
             name="Model Description Generator",
             instructions="""
@@ -62,24 +226,35 @@ Example output:
         Returns:
             Optimized model description text (basic model characteristics only)
         """
+        return run_sync(self.generate_description_async(model_specs))
+    
+    async def generate_description_async(self, model_specs: Dict) -> str:
+        """Async version of generate_description for callers already running an event loop"""
         try:
             # Build input prompt
             input_prompt = self._build_input_prompt(model_specs)
             
-            # Try to use async in a new event loop
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                result = loop.run_until_complete(Runner.run(self.agent, input_prompt))
-                description_data = result.final_output_as(ModelDescription)
-                return description_data.prompt
-            finally:
-                loop.close()
+            # Identical specs render identical input, so skip the LLM round trip
+            cached = await self.cache.get_async(input_prompt)
+            if cached is not None:
+                print("♻️ Using cached model description")
+                return cached
+            
+            return await _description_flight.run(input_prompt, lambda: self._describe(input_prompt))
                 
         except Exception as e:
             print(f"⚠️ GPT-4o generation failed, using fallback template: {e}")
             return self._fallback_generation(model_specs)
     
+    async def _describe(self, input_prompt: str) -> str:
+        """Ask the LLM for a description and cache it"""
+        with observe_stage('description'):
+            # Scheduled (rate limited and retried) per model turn through agent_run_config
+            result = await Runner.run(self.agent, input_prompt, run_config=agent_run_config())
+        description_data = result.final_output_as(ModelDescription)
+        await self.cache.set_async(input_prompt, description_data.prompt)
+        return description_data.prompt
+    
     def _build_input_prompt(self, model_specs: Dict) -> str:
         # Build template parameters - only basic model information
         template_params = {
@@ -127,6 +302,15 @@ def create_model_description_agent() -> ModelDescriptionAgent:
     """Create model description generator instance"""
     return ModelDescriptionAgent()
 
+_shared_agent: Optional[ModelDescriptionAgent] = None
+
+def get_model_description_agent() -> ModelDescriptionAgent:
+    """Get the shared generator instance, created on first use"""
+    global _shared_agent
+    if _shared_agent is None:
+        _shared_agent = create_model_description_agent()
+    return _shared_agent
+
 # Simple interface
 def generate_model_description(model_specs: Dict) -> str:
     """
@@ -138,5 +322,18 @@ def generate_model_description(model_specs: Dict) -> str:
     Returns:
         Generated model description text (basic model characteristics only)
     """
-    agent = create_model_description_agent()
-    return agent.generate_description(model_specs)
\ No newline at end of file
+    agent = get_model_description_agent()
+    return agent.generate_description(model_specs)
+
+async def generate_model_description_async(model_specs: Dict) -> str:
+    """
+    Generate model description without blocking the event loop
+    
+    Args:
+        model_specs: Model specification parameters (gender, age, nationality, height, weight)
+        
+    Returns:
+        Generated model description text (basic model characteristics only)
+    """
+    agent = get_model_description_agent()
+    return await agent.generate_description_async(model_specs)
@@ -1,11 +1,19 @@
+import asyncio
 import base64
 import os
-from openai import OpenAI
 from PIL import Image
 from io import BytesIO
-import uuid
 from typing import Optional, Dict
 from pydantic import BaseModel, Field
+from .clients import get_openai_client, get_async_openai_client, get_http_session
+from .scheduler import call_upstream, call_upstream_sync
+from .artifact_store import publish_image, publish_image_async
+from .metrics import observe_stage
+from .single_flight import SingleFlight
+from .storage import IMAGE_FOLDER, new_image_path
+
+# Concurrent requests with the same prompt share one generated image
+_model_image_flight = SingleFlight('model_image')
 
 class GenerationResult(BaseModel):
     """Model generation result"""
@@ -13,11 +21,11 @@ class GenerationResult(BaseModel):
 
 class ModelGenerationAgent:
     def __init__(self):
-        """Initialize model generation agent with OpenAI client"""
-        self.client = OpenAI()
+        """Initialize model generation agent with the shared OpenAI client"""
+        self.client = get_openai_client()
         
         # Ensure output directory exists
-        os.makedirs('imgs', exist_ok=True)
+        os.makedirs(IMAGE_FOLDER, exist_ok=True)
     
     def generate_model_image(self, 
                            prompt: str, 
@@ -37,25 +45,20 @@ class ModelGenerationAgent:
             print(f"🎨 Generating model image with prompt...")
             
             # Generate image using OpenAI API
-            result = self.client.images.generate(
-                model="gpt-image-1",
-                prompt=prompt,
-                size="1024x1536",
-                quality="high"
-            )
+            with observe_stage('model_generation'):
+                result = call_upstream_sync('images', 'gpt-image-1', lambda: self.client.images.generate(
+                    model="gpt-image-1",
+                    prompt=prompt,
+                    size="1024x1536",
+                    quality="high"
+                ))
             
             # Set output path
-            if output_path is None:
-                model_filename = f"model_{uuid.uuid4().hex[:8]}.jpg"
-                output_path = os.path.join('imgs', model_filename)
+            output_path = self._resolve_output_path(output_path)
             
             # Save image
-            if result.data and result.data[0].url:
-                self._download_and_save_image(result.data[0].url, output_path)
-            elif result.data and result.data[0].b64_json:
-                self._save_image_from_base64(result.data[0].b64_json, output_path)
-            else:
-                raise ValueError("Failed to generate model image - no data received")
+            self._save_result(result, output_path)
+            publish_image(output_path)
             
             print(f"✅ Model image saved: {output_path}")
             
@@ -65,12 +68,64 @@ class ModelGenerationAgent:
             print(f"❌ Model generation failed: {e}")
             raise e
     
+    async def generate_model_image_async(self, 
+                                         prompt: str, 
+                                         output_path: Optional[str] = None) -> GenerationResult:
+        """
+        Async version of generate_model_image; image decoding and saving run in a worker thread
+        
+        Without an explicit output path, concurrent calls with the same prompt
+        are coalesced into one generation.
+        """
+        if output_path is None:
+            return await _model_image_flight.run(prompt, lambda: self._generate_image_async(prompt, None))
+        return await self._generate_image_async(prompt, output_path)
+    
+    async def _generate_image_async(self, prompt: str, output_path: Optional[str]) -> GenerationResult:
+        try:
+            print(f"🎨 Generating model image with prompt...")
+            
+            with observe_stage('model_generation'):
+                result = await call_upstream('images', 'gpt-image-1', lambda: get_async_openai_client().images.generate(
+                    model="gpt-image-1",
+                    prompt=prompt,
+                    size="1024x1536",
+                    quality="high"
+                ))
+            
+            output_path = self._resolve_output_path(output_path)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._save_result, result, output_path)
+            await publish_image_async(output_path)
+            
+            print(f"✅ Model image saved: {output_path}")
+            
+            return GenerationResult(image_path=output_path)
+                
+        except Exception as e:
+            print(f"❌ Model generation failed: {e}")
+            raise e
+    
+    @staticmethod
+    def _resolve_output_path(output_path: Optional[str]) -> str:
+        if output_path is None:
+            output_path = new_image_path('model')
+        return output_path
+    
+    @observe_stage('result_encode')
+    def _save_result(self, result, output_path: str) -> None:
+        """Save the image returned by images.generate"""
+        if result.data and result.data[0].url:
+            self._download_and_save_image(result.data[0].url, output_path)
+        elif result.data and result.data[0].b64_json:
+            self._save_image_from_base64(result.data[0].b64_json, output_path)
+        else:
+            raise ValueError("Failed to generate model image - no data received")
+    
     def _download_and_save_image(self, image_url: str, output_path: str) -> None:
         """Download and save image from URL"""
-        import requests
-        
         try:
-            response = requests.get(image_url)
+            response = get_http_session().get(image_url, timeout=(10, 120))
             response.raise_for_status()
             
             image = Image.open(BytesIO(response.content))
@@ -84,7 +139,7 @@ class ModelGenerationAgent:
                 image = image.convert('RGB')
             
             # Save image with high quality
-            image.save(output_path, format="JPEG", quality=95)
+            image.save(output_path, format="JPEG", quality=95, progressive=True)
             
         except Exception as e:
             raise ValueError(f"Failed to download and save image: {e}")
@@ -105,7 +160,7 @@ class ModelGenerationAgent:
                 image = image.convert('RGB')
             
             # Save image with high quality
-            image.save(output_path, format="JPEG", quality=95)
+            image.save(output_path, format="JPEG", quality=95, progressive=True)
             
         except Exception as e:
             raise ValueError(f"Failed to save image from base64: {e}")
@@ -146,3 +201,19 @@ def generate_model_from_prompt(prompt: str,
     agent = create_model_generation_agent()
     return agent.generate_model_image(prompt, output_path)
 
+async def generate_model_from_prompt_async(prompt: str, 
+                                           output_path: Optional[str] = None) -> GenerationResult:
+    """
+    Generate model image from optimized prompt without blocking the event loop
+    
+    Args:
+        prompt: Pre-optimized prompt string from ModelDescriptionAgent
+        output_path: Output path, auto-generated if None
+        
+    Returns:
+        GenerationResult with image path
+    """
+    agent = create_model_generation_agent()
+    return await agent.generate_model_image_async(prompt, output_path)
+
+
@@ -0,0 +1,387 @@
+"""
+Upstream Scheduler - every OpenAI call goes through here
+
+Calls are admitted per upstream model by a token bucket (requests per minute)
+and a concurrency limit, in priority order: interactive requests are served
+before bulk catalog work. Rate limits (429), timeouts and 5xx errors are retried
+with exponential backoff and full jitter; a Retry-After header from the server
+takes precedence (capped at OPENAI_BACKOFF_MAX) and pauses the whole model,
+not just the failing call.
+
+The OpenAI clients are created with max_retries=0 so that retrying only
+happens here.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+import openai
+
+from .metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS, upstream_status
+from .tracing import span
+
+T = TypeVar('T')
+
+# Concurrent in-flight calls per upstream within one event loop
+UPSTREAM_CONCURRENCY = {
+    'chat': int(os.getenv('OPENAI_CHAT_CONCURRENCY', 64)),
+    'images': int(os.getenv('OPENAI_IMAGE_CONCURRENCY', 16)),
+}
+# Requests per minute per model, e.g. "gpt-4o=500,gpt-image-1=50"; unlisted models are not rate limited
+OPENAI_RATE_LIMITS = os.getenv('OPENAI_RATE_LIMITS', 'gpt-4o=500,gpt-image-1=50')
+OPENAI_MAX_ATTEMPTS = int(os.getenv('OPENAI_MAX_ATTEMPTS', 5))
+OPENAI_BACKOFF_BASE = float(os.getenv('OPENAI_BACKOFF_BASE', 1.0))  # seconds
+OPENAI_BACKOFF_MAX = float(os.getenv('OPENAI_BACKOFF_MAX', 60.0))  # seconds
+
+# Lower value is served first
+PRIORITIES = {'interactive': 0, 'bulk': 1}
+
+_priority: contextvars.ContextVar = contextvars.ContextVar('upstream_priority', default='interactive')
+
+
+def set_request_priority(priority: str) -> None:
+    """Set the priority class ("interactive" or "bulk") for upstream calls made from the current context"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    _priority.set(priority)
+
+
+@contextmanager
+def request_priority(priority: str) -> Iterator[None]:
+    """Temporarily run upstream calls with the given priority class"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _parse_rate_limits(spec: str) -> Dict[str, float]:
+    limits = {}
+    for item in spec.split(','):
+        if '=' in item:
+            model, rpm = item.split('=', 1)
+            limits[model.strip()] = float(rpm)
+    return limits
+
+
+class TokenBucket:
+    """Thread-safe token bucket, shared by every event loop and thread of the process"""
+
+    def __init__(self, requests_per_minute: Optional[float]):
+        # Unlimited when no rate is configured
+        self.rate = requests_per_minute / 60 if requests_per_minute else None
+        # Allow bursts of up to ten seconds worth of requests
+        self.capacity = max(1.0, self.rate * 10) if self.rate else 1.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_take(self) -> float:
+        """Take a token if one is available; otherwise return the seconds until one will be"""
+        with self._lock:
+            now = time.monotonic()
+            if self.paused_until > now:
+                return self.paused_until - now
+            if self.rate is None:
+                return 0.0
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for a while (the server asked us to back off)"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0.0)
+
+
+class _Gate:
+    """Admits waiting calls of one event loop in priority order, within the concurrency limit and rate"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, bucket: TokenBucket, limit: int):
+        self.loop = loop
+        self.bucket = bucket
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self, priority: str) -> None:
+        future = self.loop.create_future()
+        heapq.heappush(self._waiters, (PRIORITIES[priority], next(self._seq), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled: hand the slot on
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters and self.in_flight < self.limit:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)  # cancelled while waiting
+                continue
+            wait = self.bucket.try_take()
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = self.loop.call_later(wait, self._dispatch)
+                return
+            _, _, future = heapq.heappop(self._waiters)
+            self.in_flight += 1
+            future.set_result(None)
+
+
+class _ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+
+class UpstreamScheduler:
+    """Rate limiting, prioritisation and retries for all upstream calls"""
+
+    def __init__(self,
+                 rate_limits: Optional[Dict[str, float]] = None,
+                 max_attempts: int = OPENAI_MAX_ATTEMPTS,
+                 backoff_base: float = OPENAI_BACKOFF_BASE,
+                 backoff_max: float = OPENAI_BACKOFF_MAX):
+        self.rate_limits = _parse_rate_limits(OPENAI_RATE_LIMITS) if rate_limits is None else rate_limits
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._stats: Dict[str, _ModelStats] = {}
+        # Per event loop: (upstream, model) -> gate
+        self._gates: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, _Gate]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _bucket(self, model: str) -> TokenBucket:
+        with self._lock:
+            if model not in self._buckets:
+                self._buckets[model] = TokenBucket(self.rate_limits.get(model))
+                self._stats[model] = _ModelStats()
+            return self._buckets[model]
+
+    def _gate(self, upstream: str, model: str) -> _Gate:
+        loop = asyncio.get_running_loop()
+        bucket = self._bucket(model)
+        with self._lock:
+            gates = self._gates.setdefault(loop, {})
+            key = (upstream, model)
+            if key not in gates:
+                gates[key] = _Gate(loop, bucket, UPSTREAM_CONCURRENCY.get(upstream, 16))
+            return gates[key]
+
+    def retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after this error, or None if it should not be retried"""
+        if isinstance(error, openai.APIConnectionError):  # includes timeouts
+            retry_after = None
+        elif isinstance(error, openai.APIStatusError) and (
+                error.status_code in (408, 409, 429) or error.status_code >= 500):
+            retry_after = _retry_after(error.response.headers)
+        else:
+            return None
+
+        if retry_after is not None:
+            # Capped, so a huge or far-future Retry-After cannot stall a request or outlive a job lease
+            return min(retry_after, self.backoff_max)
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def _record_attempt(upstream: str, model: str, started: float, error: Optional[Exception]) -> None:
+        """Export the duration and outcome of one attempt"""
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream=upstream, model=model)
+        UPSTREAM_REQUESTS.inc(upstream=upstream, model=model, status=upstream_status(error))
+
+    def _record_failure(self, model: str, error: Exception, attempt: int) -> Optional[float]:
+        """Update stats for a failed attempt and return the retry delay, or None to give up"""
+        stats = self._stats[model]
+        rate_limited = isinstance(error, openai.RateLimitError)
+        delay = self.retry_delay(error, attempt)
+        with self._lock:
+            if rate_limited:
+                stats.rate_limited += 1
+            if delay is None or attempt >= self.max_attempts:
+                stats.failures += 1
+                return None
+            stats.retries += 1
+        if rate_limited:
+            self._buckets[model].pause(delay)
+        print(f"⏳ {model} call failed ({error.__class__.__name__}), retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s")
+        return delay
+
+    async def call(self,
+                   upstream: str,
+                   model: str,
+                   make_call: Callable[[], Awaitable[T]],
+                   gated: bool = True) -> T:
+        """
+        Run an async upstream call with rate limiting, priority and retries
+
+        Args:
+            upstream: Concurrency class, "chat" or "images"
+            model: Upstream model name, selects the token bucket
+            make_call: Creates a fresh awaitable for each attempt
+            gated: Wait for a slot and a token first; calls that make further
+                gated calls themselves should not hold a slot
+
+        Returns:
+            Result of the call
+        """
+        priority = _priority.get()
+        self._bucket(model)
+        attempt = 0
+        while True:
+            attempt += 1
+            gate = self._gate(upstream, model) if gated else None
+            if gate:
+                await gate.acquire(priority)
+            started = time.perf_counter()
+            try:
+                with self._lock:
+                    self._stats[model].calls += 1
+                with span(f"upstream.{upstream}", **{'upstream.model': model, 'upstream.attempt': attempt}):
+                    result = await make_call()
+                self._record_attempt(upstream, model, started, None)
+                return result
+            except Exception as e:
+                self._record_attempt(upstream, model, started, e)
+                delay = self._record_failure(model, e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                if gate:
+                    gate.release()
+            await asyncio.sleep(delay)
+
+    def call_sync(self, upstream: str, model: str, make_call: Callable[[], T]) -> T:
+        """Blocking version of call for code running in worker threads (rate limit and retries only)"""
+        bucket = self._bucket(model)
+        attempt = 0
+        while True:
+            attempt += 1
+            wait = bucket.try_take()
+            while wait > 0:
+                time.sleep(wait)
+                wait = bucket.try_take()
+            started = time.perf_counter()
+            try:
+                with self._lock:
+                    self._stats[model].calls += 1
+                with span(f"upstream.{upstream}", **{'upstream.model': model, 'upstream.attempt': attempt}):
+                    result = make_call()
+                self._record_attempt(upstream, model, started, None)
+                return result
+            except Exception as e:
+                self._record_attempt(upstream, model, started, e)
+                delay = self._record_failure(model, e, attempt)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    def get_stats(self) -> Dict:
+        """Get per-model call, retry and queue counters"""
+        with self._lock:
+            waiting: Dict[str, int] = {}
+            for gates in list(self._gates.values()):
+                for (_, model), gate in gates.items():
+                    waiting[model] = waiting.get(model, 0) + gate.waiting
+            return {
+                model: {
+                    "rate_limit_rpm": self.rate_limits.get(model),
+                    "calls": stats.calls,
+                    "retries": stats.retries,
+                    "rate_limited": stats.rate_limited,
+                    "failures": stats.failures,
+                    "waiting": waiting.get(model, 0)
+                }
+                for model, stats in self._stats.items()
+            }
+
+
+def _retry_after(headers: Any) -> Optional[float]:
+    """Parse retry-after-ms / retry-after (seconds or HTTP date) response headers"""
+    try:
+        if headers.get('retry-after-ms'):
+            return max(0.0, float(headers['retry-after-ms']) / 1000)
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_scheduler: Optional[UpstreamScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_upstream_scheduler() -> UpstreamScheduler:
+    """Get the shared upstream scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = UpstreamScheduler()
+    return _scheduler
+
+
+async def call_upstream(upstream: str,
+                        model: str,
+                        make_call: Callable[[], Awaitable[T]],
+                        gated: bool = True) -> T:
+    """Run an async upstream call through the shared scheduler"""
+    return await get_upstream_scheduler().call(upstream, model, make_call, gated=gated)
+
+
+def call_upstream_sync(upstream: str, model: str, make_call: Callable[[], T]) -> T:
+    """Run a blocking upstream call through the shared scheduler"""
+    return get_upstream_scheduler().call_sync(upstream, model, make_call)
+
+
+__all__ = [
+    "UpstreamScheduler",
+    "TokenBucket",
+    "call_upstream",
+    "call_upstream_sync",
+    "get_upstream_scheduler",
+    "request_priority",
+    "set_request_priority"
+]
@@ -0,0 +1,79 @@
+"""
+Single-flight coalescing of identical in-flight calls
+
+When identical requests arrive while the first one is still running, they
+await the same task instead of starting their own upstream work. Keys are
+only remembered while the call is in flight; finished results are the
+caches' job.
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, TypeVar
+
+T = TypeVar('T')
+
+_registry: List["SingleFlight"] = []
+_registry_lock = threading.Lock()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key within one event loop"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.leaders = 0
+        self.followers = 0
+        # Per event loop: key -> running task
+        self._calls: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Task]]" = weakref.WeakKeyDictionary()
+        with _registry_lock:
+            _registry.append(self)
+
+    async def run(self, key: Hashable, make_call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run make_call(), or join an identical call that is already running
+
+        The work runs in its own task, so a caller that gives up (e.g. its
+        client disconnected) does not cancel it for the others.
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        task = calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = loop.create_task(make_call())
+            calls[key] = task
+
+            def forget(finished: asyncio.Task):
+                if calls.get(key) is finished:
+                    del calls[key]
+                # Mark the exception as retrieved even if every caller went away
+                if not finished.cancelled():
+                    finished.exception()
+
+            task.add_done_callback(forget)
+        else:
+            self.followers += 1
+            print(f"🔗 Joining in-flight {self.name} call")
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get leader (did the work) and follower (shared a result) counts"""
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "in_flight": sum(len(calls) for calls in list(self._calls.values()))
+        }
+
+
+def get_single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    """Get stats of every single-flight group"""
+    with _registry_lock:
+        return {flight.name: flight.get_stats() for flight in _registry}
+
+
+__all__ = [
+    "SingleFlight",
+    "get_single_flight_stats"
+]
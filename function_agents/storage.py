@@ -0,0 +1,304 @@
+"""
+Storage - on-disk layout and lifecycle of images
+
+Generated images, derivatives and stored garments live in hash-sharded
+directories, so no single directory grows to millions of entries. A janitor
+pass evicts files past their area's TTL and, least recently accessed first,
+files over its size quota, and sweeps temporary uploads left behind by
+failed requests.
+
+Last access is the file's atime, set explicitly by touch_access() when a
+file is used, so it works on noatime/relatime mounts and never changes the
+mtime that ETags are built from.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Pattern, Set, Tuple
+
+IMAGE_FOLDER = 'imgs'
+# Images shipped with the repository (README demo results); never evicted
+EXAMPLE_IMAGE_FOLDER = os.path.join(IMAGE_FOLDER, 'examples')
+UPLOAD_FOLDER = 'uploads'
+GARMENT_FOLDER = os.path.join(UPLOAD_FOLDER, 'garments')
+IMAGE_DERIVATIVE_FOLDER = os.getenv('IMAGE_DERIVATIVE_FOLDER', os.path.join(IMAGE_FOLDER, 'derivatives'))
+UPSTREAM_DERIVATIVE_FOLDER = os.getenv('UPSTREAM_DERIVATIVE_FOLDER', os.path.join(UPLOAD_FOLDER, 'derivatives'))
+
+# Levels of 256 shard directories below each storage folder
+STORAGE_SHARD_LEVELS = int(os.getenv('STORAGE_SHARD_LEVELS', 1))
+# Files younger than this are never evicted, so running pipelines keep their inputs
+STORAGE_MIN_AGE = int(os.getenv('STORAGE_MIN_AGE', 3600))
+# Temporary uploads older than this that no request or job holds are deleted
+STORAGE_ORPHAN_AGE = int(os.getenv('STORAGE_ORPHAN_AGE', 24 * 3600))
+STORAGE_JANITOR_INTERVAL = int(os.getenv('STORAGE_JANITOR_INTERVAL', 600))  # seconds, 0 disables
+# An area over its quota is trimmed down to this fraction of it, so eviction does not run on every pass
+STORAGE_LOW_WATERMARK = float(os.getenv('STORAGE_LOW_WATERMARK', 0.9))
+# Access times are only rewritten when older than this, so hot files cost no writes
+ACCESS_TOUCH_INTERVAL = 3600
+
+# Suffixes of temporary upload files: normalized uploads, streamed spools and partial writes
+_TEMP_UPLOAD_SUFFIXES = ('.jpg', '.upload', '.tmp')
+
+# Names given by new_image_path, e.g. tryon_1a2b3c4d.jpg; only these are evicted from the images area
+GENERATED_IMAGE_PATTERN = re.compile(r'^[a-z]+_[0-9a-f]{8}\.jpg$')
+
+GB = 1024 * 1024 * 1024
+
+
+def shard_path(folder: str, filename: str) -> str:
+    """Get the sharded path of a file name within a storage folder"""
+    digest = hashlib.md5(filename.encode()).hexdigest()
+    shards = [digest[2 * level:2 * level + 2] for level in range(STORAGE_SHARD_LEVELS)]
+    return os.path.join(folder, *shards, filename)
+
+
+def new_image_path(prefix: str) -> str:
+    """Allocate a unique path for a new generated image, creating its shard directory"""
+    # Use consistent 8-character UUID naming, same as model image naming convention
+    path = shard_path(IMAGE_FOLDER, f"{prefix}_{uuid.uuid4().hex[:8]}.jpg")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def resolve_image_path(filename: str) -> Optional[str]:
+    """Find a generated image by file name, in its shard or the legacy flat layout"""
+    for path in (shard_path(IMAGE_FOLDER, filename), os.path.join(IMAGE_FOLDER, filename)):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def touch_access(path: str, stat_result: Optional[os.stat_result] = None) -> None:
+    """Record that a file was used, for least-recently-used eviction"""
+    try:
+        if stat_result is None:
+            stat_result = os.stat(path)
+        now_ns = time.time_ns()
+        if now_ns / 1e9 - stat_result.st_atime > ACCESS_TOUCH_INTERVAL:
+            os.utime(path, ns=(now_ns, stat_result.st_mtime_ns))
+    except OSError:
+        pass
+
+
+class StorageArea:
+    """A folder whose files are evicted by age and total size"""
+
+    def __init__(self,
+                 name: str,
+                 folder: str,
+                 ttl_seconds: int,
+                 max_bytes: int,
+                 file_pattern: Optional[Pattern] = None,
+                 exclude: Iterable[str] = ()):
+        """
+        Args:
+            file_pattern: Only files whose name matches are counted and evicted
+            exclude: Subfolders that are left alone entirely
+        """
+        self.name = name
+        self.folder = folder
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.file_pattern = file_pattern
+        self.exclude = list(exclude)
+
+    @classmethod
+    def from_env(cls, name: str, folder: str, ttl_seconds: int, max_bytes: int, **options) -> "StorageArea":
+        """Build an area whose limits can be overridden by STORAGE_<NAME>_TTL and STORAGE_<NAME>_MAX_BYTES"""
+        prefix = f"STORAGE_{name.upper()}"
+        return cls(
+            name,
+            folder,
+            int(os.getenv(f"{prefix}_TTL", ttl_seconds)),
+            int(os.getenv(f"{prefix}_MAX_BYTES", max_bytes)),
+            **options
+        )
+
+
+def _scan(folder: str, exclude: Set[str], file_pattern: Optional[Pattern] = None) -> List[Tuple[float, int, str]]:
+    """List (last access, size, path) of the files below a folder, skipping excluded subfolders"""
+    files = []
+    for root, dirs, names in os.walk(folder):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) not in exclude]
+        for name in names:
+            if file_pattern is not None and not file_pattern.match(name):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                continue
+            files.append((max(stat_result.st_atime, stat_result.st_mtime), stat_result.st_size, path))
+    return files
+
+
+class StorageManager:
+    """Applies TTL and quota eviction to storage areas and sweeps orphaned uploads"""
+
+    def __init__(self,
+                 areas: Iterable[StorageArea],
+                 upload_folder: str = UPLOAD_FOLDER,
+                 orphan_age: int = STORAGE_ORPHAN_AGE,
+                 min_age: int = STORAGE_MIN_AGE):
+        self.areas = list(areas)
+        self.upload_folder = upload_folder
+        self.orphan_age = orphan_age
+        self.min_age = min_age
+        self.runs = 0
+        self.last_run_at: Optional[float] = None
+        self.last_run_seconds: Optional[float] = None
+        self.area_usage: Dict[str, Dict[str, int]] = {}
+        self.reclaimed_files = {'ttl': 0, 'quota': 0, 'orphan': 0}
+        self.reclaimed_bytes = {'ttl': 0, 'quota': 0, 'orphan': 0}
+        self._lock = threading.Lock()
+
+    def _remove(self, path: str, size: int, reason: str) -> bool:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        self.reclaimed_files[reason] += 1
+        self.reclaimed_bytes[reason] += size
+        return True
+
+    def _sweep_area(self, area: StorageArea, now: float) -> None:
+        # Areas nested in this one (e.g. imgs/derivatives in imgs) are swept on their own
+        area_root = os.path.abspath(area.folder)
+        exclude = {os.path.abspath(other.folder) for other in self.areas
+                   if os.path.abspath(other.folder).startswith(area_root + os.sep)}
+        exclude.update(os.path.abspath(folder) for folder in area.exclude)
+        files = _scan(area.folder, exclude, area.file_pattern)
+        evictable = []
+        count = total = 0
+        for last_access, size, path in files:
+            if area.ttl_seconds > 0 and now - last_access > max(area.ttl_seconds, self.min_age):
+                self._remove(path, size, 'ttl')
+                continue
+            count += 1
+            total += size
+            if now - last_access > self.min_age:
+                evictable.append((last_access, size, path))
+
+        if area.max_bytes > 0 and total > area.max_bytes:
+            target = area.max_bytes * STORAGE_LOW_WATERMARK
+            # Least recently accessed first
+            for last_access, size, path in sorted(evictable):
+                if total <= target:
+                    break
+                if self._remove(path, size, 'quota'):
+                    count -= 1
+                    total -= size
+            print(f"🧹 Storage area {area.name} trimmed to {total / (1024 * 1024):.1f}MB")
+
+        self.area_usage[area.name] = {'files': count, 'bytes': total}
+
+    def _sweep_orphans(self, now: float, in_use: Set[str]) -> None:
+        """Delete temporary uploads that outlived every request that could own them"""
+        try:
+            entries = list(os.scandir(self.upload_folder))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith(_TEMP_UPLOAD_SUFFIXES):
+                continue
+            if os.path.abspath(entry.path) in in_use:
+                continue
+            try:
+                stat_result = entry.stat()
+            except OSError:
+                continue
+            if now - stat_result.st_mtime > self.orphan_age:
+                if self._remove(entry.path, stat_result.st_size, 'orphan'):
+                    print(f"🧹 Removed orphaned upload: {entry.path}")
+
+    def sweep(self, in_use: Iterable[str] = ()) -> Dict[str, int]:
+        """
+        Run one janitor pass over every area and the upload folder
+
+        Args:
+            in_use: Temporary upload paths still owned by requests or queued jobs
+
+        Returns:
+            Files and bytes reclaimed by this pass
+        """
+        with self._lock:
+            started = time.time()
+            files_before = sum(self.reclaimed_files.values())
+            bytes_before = sum(self.reclaimed_bytes.values())
+            for area in self.areas:
+                self._sweep_area(area, started)
+            self._sweep_orphans(started, {os.path.abspath(path) for path in in_use})
+
+            self.runs += 1
+            self.last_run_at = started
+            self.last_run_seconds = round(time.time() - started, 3)
+            reclaimed = {
+                'files': sum(self.reclaimed_files.values()) - files_before,
+                'bytes': sum(self.reclaimed_bytes.values()) - bytes_before
+            }
+        if reclaimed['files']:
+            print(f"🧹 Storage janitor reclaimed {reclaimed['files']} files, {reclaimed['bytes'] // 1024}KB")
+        return reclaimed
+
+    def get_stats(self) -> Dict:
+        """Get usage per area (as of the last pass) and bytes reclaimed by reason"""
+        return {
+            "areas": {
+                area.name: {
+                    "folder": area.folder,
+                    "ttl_seconds": area.ttl_seconds,
+                    "max_bytes": area.max_bytes,
+                    **self.area_usage.get(area.name, {})
+                }
+                for area in self.areas
+            },
+            "reclaimed_files": dict(self.reclaimed_files),
+            "reclaimed_bytes": dict(self.reclaimed_bytes),
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_run_seconds": self.last_run_seconds
+        }
+
+
+_manager: Optional[StorageManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_storage_manager() -> StorageManager:
+    """Get the shared storage manager"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = StorageManager([
+                    # Only generated images; anything else under imgs/ (e.g. the examples) is not ours to evict
+                    StorageArea.from_env('images', IMAGE_FOLDER, 30 * 24 * 3600, 10 * GB,
+                                         file_pattern=GENERATED_IMAGE_PATTERN, exclude=[EXAMPLE_IMAGE_FOLDER]),
+                    StorageArea.from_env('image_derivatives', IMAGE_DERIVATIVE_FOLDER, 7 * 24 * 3600, 2 * GB),
+                    StorageArea.from_env('upstream_derivatives', UPSTREAM_DERIVATIVE_FOLDER, 7 * 24 * 3600, 1 * GB),
+                    StorageArea.from_env('garments', GARMENT_FOLDER, 30 * 24 * 3600, 5 * GB),
+                ])
+    return _manager
+
+
+__all__ = [
+    "IMAGE_FOLDER",
+    "EXAMPLE_IMAGE_FOLDER",
+    "GENERATED_IMAGE_PATTERN",
+    "UPLOAD_FOLDER",
+    "GARMENT_FOLDER",
+    "IMAGE_DERIVATIVE_FOLDER",
+    "UPSTREAM_DERIVATIVE_FOLDER",
+    "STORAGE_JANITOR_INTERVAL",
+    "StorageArea",
+    "StorageManager",
+    "get_storage_manager",
+    "new_image_path",
+    "resolve_image_path",
+    "shard_path",
+    "touch_access"
+]
@@ -0,0 +1,403 @@
+"""
+Tracing - per-request spans across the agent pipeline
+
+Spans follow the OpenTelemetry data model (W3C trace and span IDs, kinds,
+attributes, status) and are exported as OTLP/JSON, either posted to a
+collector (TRACE_EXPORTER=otlp) or appended to a file, one batch per line
+(TRACE_EXPORTER=file), which the collector's otlpjsonfile receiver can
+read back. The current span lives in a context variable, so it follows
+awaits and tasks; TracingThreadPoolExecutor carries it into worker threads.
+
+Every request gets a trace ID even when no exporter is configured, so the
+X-Trace-Id response header can always be matched against logs.
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import httpx
+
+T = TypeVar('T')
+
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'none').lower()  # "none", "file" or "otlp"
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318')
+OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'virtual-tryon')
+TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', 5))  # seconds
+TRACE_EXPORT_BATCH = int(os.getenv('TRACE_EXPORT_BATCH', 512))
+# Finished spans waiting for export; spans beyond this are dropped rather than buffered
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', 10000))
+
+_TRACEPARENT_PATTERN = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+# OTLP span kinds
+_KINDS = {'internal': 1, 'server': 2, 'client': 3}
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    def __init__(self,
+                 name: str,
+                 trace_id: str,
+                 parent_id: Optional[str] = None,
+                 kind: str = 'internal',
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException) -> None:
+        self.error = f"{error.__class__.__name__}: {error}"
+        self.attributes['exception.type'] = error.__class__.__name__
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent header value pointing at this span"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': _KINDS.get(self.kind, 1),
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or time.time_ns()),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Get (trace_id, parent span ID) from a W3C traceparent header, or None if invalid"""
+    match = _TRACEPARENT_PATTERN.match((header or '').strip().lower())
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return match.group(1), match.group(2)
+
+
+class SpanExporter:
+    """Buffers finished spans and exports them in batches from a background thread"""
+
+    def __init__(self, exporter: str = TRACE_EXPORTER):
+        self.exporter = exporter
+        self.exported = 0
+        self.dropped = 0
+        self.failed_batches = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._flush_lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        if exporter == 'otlp':
+            self._client = httpx.Client(timeout=10)
+        elif exporter not in ('none', 'file'):
+            raise ValueError(f"Unknown TRACE_EXPORTER: {exporter}")
+        if exporter != 'none':
+            threading.Thread(target=self._run, name='span-exporter', daemon=True).start()
+            print(f"🔭 Exporting traces to {TRACE_FILE if exporter == 'file' else OTEL_EXPORTER_OTLP_ENDPOINT}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter != 'none'
+
+    def export(self, span: Span) -> None:
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(TRACE_EXPORT_INTERVAL)
+            self.flush()
+
+    def flush(self) -> None:
+        """Export every buffered span now"""
+        with self._flush_lock:
+            while True:
+                batch: List[Span] = []
+                while len(batch) < TRACE_EXPORT_BATCH:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                try:
+                    self._write(batch)
+                    self.exported += len(batch)
+                except Exception as e:
+                    self.failed_batches += 1
+                    print(f"⚠️ Trace export failed ({len(batch)} spans dropped): {e}")
+
+    def _write(self, batch: List[Span]) -> None:
+        payload = {
+            'resourceSpans': [{
+                'resource': {'attributes': [_otlp_attribute('service.name', OTEL_SERVICE_NAME)]},
+                'scopeSpans': [{
+                    'scope': {'name': 'function_agents.tracing'},
+                    'spans': [span.to_otlp() for span in batch]
+                }]
+            }]
+        }
+        if self.exporter == 'file':
+            with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+        else:
+            response = self._client.post(f"{OTEL_EXPORTER_OTLP_ENDPOINT.rstrip('/')}/v1/traces", json=payload)
+            response.raise_for_status()
+
+    def get_stats(self) -> Dict:
+        return {
+            "exporter": self.exporter,
+            "exported_spans": self.exported,
+            "dropped_spans": self.dropped,
+            "failed_batches": self.failed_batches,
+            "queued_spans": self._queue.qsize()
+        }
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+_exporter: Optional[SpanExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_span_exporter() -> SpanExporter:
+    """Get the configured span exporter"""
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = SpanExporter()
+    return _exporter
+
+
+def current_span() -> Optional[Span]:
+    """Get the innermost open span of the current context"""
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    """Get the trace ID of the current context, or None outside any trace"""
+    active = _current_span.get()
+    return active.trace_id if active else None
+
+
+def start_span(name: str,
+               kind: str = 'internal',
+               remote_parent: Optional[Tuple[str, str]] = None,
+               **attributes: Any) -> Span:
+    """Create a child of the current span (or the root of a new trace) without making it current"""
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    elif remote_parent is not None:
+        trace_id, parent_id = remote_parent
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    return Span(name, trace_id, parent_id, kind, attributes)
+
+
+def end_span(finished: Span) -> None:
+    """Close a span and queue it for export"""
+    finished.end_ns = time.time_ns()
+    get_span_exporter().export(finished)
+
+
+@contextmanager
+def span(name: str,
+         kind: str = 'internal',
+         remote_parent: Optional[Tuple[str, str]] = None,
+         **attributes: Any) -> Iterator[Span]:
+    """
+    Open a span as a child of the current one (or a new trace) for the with-block
+
+    Args:
+        name: Operation name
+        kind: "internal", "server" (incoming request) or "client" (outgoing call)
+        remote_parent: (trace_id, span_id) of a caller's span, from its traceparent header
+        attributes: Span attributes
+    """
+    active = start_span(name, kind, remote_parent, **attributes)
+    token = _current_span.set(active)
+    try:
+        yield active
+    except BaseException as e:
+        active.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        end_span(active)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator running a sync or async function inside a span named after it"""
+    def decorate(func: Callable) -> Callable:
+        span_name = name or func.__name__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+async def in_span(name: str, awaitable: Awaitable[T], **attributes: Any) -> T:
+    """Await inside a span, e.g. for a stage handed to asyncio.ensure_future"""
+    with span(name, **attributes):
+        return await awaitable
+
+
+def flush_traces() -> None:
+    """Export buffered spans, e.g. before shutdown"""
+    get_span_exporter().flush()
+
+
+class TracingThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    Thread pool that runs tasks in the submitter's context, so their spans keep their parent
+
+    It also counts its own tasks, so queue depth and busy workers can be
+    reported without reading ThreadPoolExecutor internals.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, *args, **kwargs):
+        super().__init__(max_workers, *args, **kwargs)
+        # Same default as ThreadPoolExecutor
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.submitted = 0
+        self.started = 0
+        self.finished = 0
+        self.cancelled = 0
+        self._counts_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+
+        def run():
+            with self._counts_lock:
+                self.started += 1
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._counts_lock:
+                    self.finished += 1
+
+        future = super().submit(run)
+        with self._counts_lock:
+            self.submitted += 1
+        future.add_done_callback(self._count_cancelled)
+        return future
+
+    def _count_cancelled(self, future) -> None:
+        if future.cancelled():
+            with self._counts_lock:
+                self.cancelled += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get task counters plus the tasks waiting for a thread and the threads running one"""
+        with self._counts_lock:
+            return {
+                "max_workers": self.max_workers,
+                "submitted": self.submitted,
+                "finished": self.finished,
+                "cancelled": self.cancelled,
+                "queued": max(0, self.submitted - self.started - self.cancelled),
+                "running": self.started - self.finished
+            }
+
+
+def _start_client_span(request) -> None:
+    request.extensions['trace_span'] = start_span(
+        f"{request.method} {request.url.path}",
+        kind='client',
+        **{'http.request.method': request.method, 'server.address': request.url.host, 'url.path': request.url.path}
+    )
+
+
+def _end_client_span(response) -> None:
+    client_span = response.request.extensions.get('trace_span')
+    if client_span is not None:
+        client_span.set_attribute('http.response.status_code', response.status_code)
+        if response.status_code >= 400:
+            client_span.error = f"HTTP {response.status_code}"
+        end_span(client_span)
+
+
+async def _start_client_span_async(request) -> None:
+    _start_client_span(request)
+
+
+async def _end_client_span_async(response) -> None:
+    _end_client_span(response)
+
+
+def client_event_hooks(is_async: bool) -> Dict[str, List[Callable]]:
+    """
+    httpx event hooks recording a client span per upstream HTTP request
+
+    Hooks only see requests that got a response; timeouts and connection
+    errors show up on the enclosing upstream call span instead.
+    """
+    if is_async:
+        return {'request': [_start_client_span_async], 'response': [_end_client_span_async]}
+    return {'request': [_start_client_span], 'response': [_end_client_span]}
+
+
+__all__ = [
+    "Span",
+    "SpanExporter",
+    "TracingThreadPoolExecutor",
+    "client_event_hooks",
+    "current_span",
+    "current_trace_id",
+    "flush_traces",
+    "end_span",
+    "get_span_exporter",
+    "in_span",
+    "parse_traceparent",
+    "span",
+    "start_span",
+    "traced"
+]
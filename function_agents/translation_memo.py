@@ -0,0 +1,168 @@
+"""
+Translation Memo - remember pose and scene translations
+
+Pose and scene descriptions repeat constantly (the UI defaults alone cover
+most traffic), so translations are memoized on the normalized source text
+and persisted in SQLite. The memo is seeded with the built-in defaults.
+"""
+
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Optional
+
+TRANSLATION_MEMO_DB_PATH = os.getenv('TRANSLATION_MEMO_DB_PATH', 'translation_memo.db')
+TRANSLATION_MEMO_SIZE = int(os.getenv('TRANSLATION_MEMO_SIZE', 10000))
+
+_CHINESE_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+# Defaults hard-coded in the API and the frontend, plus the documented examples
+BUILTIN_TRANSLATIONS = {
+    "自然站立姿势": "Natural standing pose",
+    "简约工作室背景": "Minimalist studio background",
+    "自信的时尚姿势": "Confident fashion pose",
+    "简洁的工作室背景": "Clean studio background",
+}
+
+
+def contains_chinese(text: str) -> bool:
+    """Check whether text contains Chinese characters and needs translating"""
+    return bool(text) and bool(_CHINESE_PATTERN.search(text))
+
+
+def normalize_source(text: str) -> str:
+    """Normalize source text so trivially different inputs share one entry"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return re.sub(r'\s+', ' ', text).strip().rstrip('。.').lower()
+
+
+class TranslationMemo:
+    """In-memory translation memo backed by SQLite"""
+
+    def __init__(self,
+                 db_path: Optional[str] = TRANSLATION_MEMO_DB_PATH,
+                 max_entries: int = TRANSLATION_MEMO_SIZE):
+        self.db_path = db_path or None
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load()
+        self.seed(BUILTIN_TRANSLATIONS)
+
+    def _load(self) -> None:
+        if not self.db_path:
+            return
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations "
+                "(source TEXT PRIMARY KEY, translation TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.commit()
+            rows = conn.execute(
+                "SELECT source, translation FROM translations ORDER BY created_at DESC LIMIT ?",
+                (self.max_entries,)
+            ).fetchall()
+        finally:
+            conn.close()
+        # Oldest first, so eviction order matches insertion order
+        self._entries.update(dict(reversed(rows)))
+
+    def seed(self, translations: Dict[str, str]) -> None:
+        """Add known translations without overriding learned ones"""
+        with self._lock:
+            for source, translation in translations.items():
+                self._entries.setdefault(normalize_source(source), translation)
+
+    def get(self, text: str) -> Optional[str]:
+        """Get the memoized translation, or None on a miss"""
+        key = normalize_source(text)
+        with self._lock:
+            translation = self._entries.get(key)
+            if translation is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return translation
+
+    def set(self, text: str, translation: str) -> None:
+        """Memoize a translation"""
+        key = self._remember(text, translation)
+        self._persist(key, translation)
+
+    async def set_async(self, text: str, translation: str) -> None:
+        """Like set, with the SQLite write run in the default executor instead of on the event loop"""
+        key = self._remember(text, translation)
+        if self.db_path:
+            await asyncio.get_running_loop().run_in_executor(None, self._persist, key, translation)
+
+    def _remember(self, text: str, translation: str) -> str:
+        key = normalize_source(text)
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                # Drop the oldest entry (dicts keep insertion order)
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = translation
+        return key
+
+    def _persist(self, key: str, translation: str) -> None:
+        if not self.db_path:
+            return
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO translations (source, translation, created_at) VALUES (?, ?, ?)",
+                    (key, translation, time.time())
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Translation memo write failed: {e}")
+
+    def get_stats(self) -> Dict:
+        """Get memo size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+_memo: Optional[TranslationMemo] = None
+_memo_lock = threading.Lock()
+
+
+def get_translation_memo() -> TranslationMemo:
+    """Get the shared translation memo, loading and seeding it on first use"""
+    global _memo
+    if _memo is None:
+        with _memo_lock:
+            if _memo is None:
+                _memo = TranslationMemo()
+    return _memo
+
+
+async def get_translation_memo_async() -> TranslationMemo:
+    """Get the shared translation memo, loading it from SQLite in the default executor on first use"""
+    if _memo is not None:
+        return _memo
+    return await asyncio.get_running_loop().run_in_executor(None, get_translation_memo)
+
+
+__all__ = [
+    "TranslationMemo",
+    "contains_chinese",
+    "get_translation_memo",
+    "get_translation_memo_async",
+    "normalize_source"
+]
@@ -0,0 +1,134 @@
+"""
+Upstream Images - downscale images to what each upstream actually uses
+
+Phone photos are often 4000px or larger, but gpt-image-1 works at 1024x1536
+and low-detail GPT-4o vision at 512px. Sending more only costs upload time,
+latency and tokens. Images within the limits are sent as they are; larger
+ones are resized once and the derivative is kept on disk next to the uploads,
+named by the SHA-256 of the image content. Repeated uploads of the same
+garment reuse it whichever file or request they arrive in; for a stored
+garment uploaded as a JPEG that hash is its garment ID.
+"""
+
+import hashlib
+import mimetypes
+import os
+import uuid
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from .metrics import observe_stage
+from .storage import UPSTREAM_DERIVATIVE_FOLDER, shard_path, touch_access
+
+
+def _parse_size(value: str) -> Tuple[int, int]:
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+# Largest (width, height) each upstream uses; the box is rotated for landscape images
+UPSTREAM_IMAGE_SIZES: Dict[str, Tuple[int, int]] = {
+    'edit': _parse_size(os.getenv('UPSTREAM_EDIT_IMAGE_SIZE', '1024x1536')),
+    'validation': _parse_size(os.getenv('UPSTREAM_VALIDATION_IMAGE_SIZE', '512x512')),
+}
+# GPT-4o vision detail level for clothing validation ("low", "high" or "auto")
+VALIDATION_IMAGE_DETAIL = os.getenv('VALIDATION_IMAGE_DETAIL', 'low')
+UPSTREAM_IMAGE_QUALITY = int(os.getenv('UPSTREAM_IMAGE_QUALITY', 90))
+
+
+def _target_box(image_size: Tuple[int, int], profile: str) -> Tuple[int, int]:
+    width, height = UPSTREAM_IMAGE_SIZES[profile]
+    if (image_size[0] > image_size[1]) != (width > height):
+        width, height = height, width
+    return width, height
+
+
+def _fits(image_size: Tuple[int, int], box: Tuple[int, int]) -> bool:
+    return image_size[0] <= box[0] and image_size[1] <= box[1]
+
+
+def _resize(image: Image.Image, box: Tuple[int, int]) -> bytes:
+    # Let the JPEG decoder skip most of the pixels while decoding
+    image.draft('RGB', box)
+    if image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail(box, Image.LANCZOS)
+
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=UPSTREAM_IMAGE_QUALITY)
+    return output.getvalue()
+
+
+def _derivative_path(content_hash: str, profile: str) -> str:
+    return shard_path(UPSTREAM_DERIVATIVE_FOLDER, f"{content_hash}_{profile}.jpg")
+
+
+def _read_derivative(derivative_path: str) -> Optional[bytes]:
+    try:
+        with open(derivative_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    touch_access(derivative_path)
+    return data
+
+
+def _write_derivative(derivative_path: str, data: bytes) -> None:
+    # Write to a temporary name first so concurrent requests never read a partial file
+    os.makedirs(os.path.dirname(derivative_path), exist_ok=True)
+    tmp_path = f"{derivative_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, derivative_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def downscale_image_bytes(image_bytes: bytes, profile: str, content_hash: Optional[str] = None) -> bytes:
+    """
+    Fit encoded image bytes within the size used by an upstream, caching the derivative
+
+    Returns the input unchanged if it already fits, otherwise a JPEG.
+    content_hash is the SHA-256 hex digest of image_bytes; pass it when
+    already known to skip hashing.
+    """
+    content_hash = content_hash or hashlib.sha256(image_bytes).hexdigest()
+    derivative_path = _derivative_path(content_hash, profile)
+    derivative = _read_derivative(derivative_path)
+    if derivative is not None:
+        return derivative
+
+    image = Image.open(BytesIO(image_bytes))
+    box = _target_box(image.size, profile)
+    if _fits(image.size, box):
+        return image_bytes
+    derivative = _resize(image, box)
+    _write_derivative(derivative_path, derivative)
+    print(f"📐 Downscaled {content_hash[:12]} for {profile}: {len(derivative) // 1024}KB")
+    return derivative
+
+
+@observe_stage('upstream_image_prepare')
+def get_upstream_image(image_path: str, profile: str) -> Tuple[bytes, str]:
+    """Get (bytes, mime type) of an image file fitted to an upstream, like downscale_image_bytes"""
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+    data = downscale_image_bytes(image_bytes, profile)
+    if data is image_bytes:
+        return data, mimetypes.guess_type(image_path)[0] or "image/jpeg"
+    return data, "image/jpeg"
+
+
+__all__ = [
+    "VALIDATION_IMAGE_DETAIL",
+    "downscale_image_bytes",
+    "get_upstream_image"
+]
@@ -0,0 +1,75 @@
+"""
+HTTP request metrics
+
+A pure ASGI middleware that counts requests and request/response bytes and
+times each request, labelled by route template ("/api/jobs/{job_id}") rather
+than raw path, so the number of series stays bounded. Streaming responses
+are timed until their last chunk is sent.
+"""
+
+import time
+
+from function_agents.metrics import counter, histogram
+
+HTTP_REQUESTS = counter(
+    'tryon_http_requests_total',
+    'HTTP requests by method, route template and status code',
+    ('method', 'route', 'status')
+)
+HTTP_SECONDS = histogram(
+    'tryon_http_request_duration_seconds',
+    'HTTP request duration, until the last response byte is sent',
+    ('route',)
+)
+HTTP_REQUEST_BYTES = counter(
+    'tryon_http_request_bytes_total',
+    'HTTP request body bytes received',
+    ('route',)
+)
+HTTP_RESPONSE_BYTES = counter(
+    'tryon_http_response_bytes_total',
+    'HTTP response body bytes sent',
+    ('route',)
+)
+
+
+class HTTPMetricsMiddleware:
+    """Record per-route request counts, latency and body sizes"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        sizes = {'request': 0, 'response': 0}
+        status = {'code': 500}
+
+        async def counting_receive():
+            message = await receive()
+            if message['type'] == 'http.request':
+                sizes['request'] += len(message.get('body', b''))
+            return message
+
+        async def counting_send(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            elif message['type'] == 'http.response.body':
+                sizes['response'] += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            # The router stores the matched route in the scope
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            HTTP_REQUESTS.inc(method=scope['method'], route=route, status=str(status['code']))
+            HTTP_SECONDS.observe(time.perf_counter() - started, route=route)
+            HTTP_REQUEST_BYTES.inc(sizes['request'], route=route)
+            HTTP_RESPONSE_BYTES.inc(sizes['response'], route=route)
+
+
+__all__ = ["HTTPMetricsMiddleware"]
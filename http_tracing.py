@@ -0,0 +1,55 @@
+"""
+HTTP request tracing
+
+A pure ASGI middleware that opens a server span around every request, so
+everything the request does (agent stages, upstream calls, disk writes)
+lands in one trace. A W3C traceparent header from the caller is continued
+instead of starting a new trace. The trace ID is returned in the
+X-Trace-Id response header, and the span lasts until the last byte of a
+streaming response has been sent.
+"""
+
+from function_agents.tracing import parse_traceparent, span
+
+TRACE_ID_HEADER = b'x-trace-id'
+
+
+class TracingMiddleware:
+    """Run each HTTP request in its own server span"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or [])
+        remote_parent = parse_traceparent(headers.get(b'traceparent', b'').decode('latin-1'))
+        attributes = {'http.request.method': scope['method'], 'url.path': scope['path']}
+
+        with span(f"{scope['method']} {scope['path']}", kind='server', remote_parent=remote_parent,
+                  **attributes) as server_span:
+            async def send_with_trace_id(message):
+                if message['type'] == 'http.response.start':
+                    server_span.set_attribute('http.response.status_code', message['status'])
+                    if message['status'] >= 500:
+                        server_span.error = f"HTTP {message['status']}"
+                    message['headers'] = list(message.get('headers', [])) + [
+                        (TRACE_ID_HEADER, server_span.trace_id.encode()),
+                        (b'traceparent', server_span.traceparent.encode())
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                # Name the span after the route template once the router has matched it
+                route = getattr(scope.get('route'), 'path', None)
+                if route:
+                    server_span.name = f"{scope['method']} {route}"
+                    server_span.set_attribute('http.route', route)
+
+
+__all__ = ["TracingMiddleware"]
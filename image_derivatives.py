@@ -0,0 +1,156 @@
+"""
+Derivatives of generated images
+
+Resized and re-encoded variants (thumbnails, WebP/AVIF, progressive JPEG)
+of the images in imgs/, made on first request and cached on disk. Requested
+sizes are snapped to a fixed set of widths/heights so a client cannot fill
+the cache with one derivative per pixel.
+"""
+
+import hashlib
+import os
+import uuid
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, features
+
+from function_agents.metrics import observe_stage
+from function_agents.storage import IMAGE_DERIVATIVE_FOLDER, shard_path
+from upload_store import normalize_image
+
+
+def _parse_sizes(value: str) -> Tuple[int, ...]:
+    return tuple(sorted(int(size) for size in value.split(',') if size.strip()))
+
+
+# Allowed widths/heights; requested sizes are rounded up to the next one
+DERIVATIVE_SIZES = _parse_sizes(os.getenv('IMAGE_DERIVATIVE_SIZES', '128,256,384,512,768,1024,1536'))
+DERIVATIVE_QUALITY = {
+    'avif': int(os.getenv('IMAGE_DERIVATIVE_AVIF_QUALITY', 60)),
+    'webp': int(os.getenv('IMAGE_DERIVATIVE_WEBP_QUALITY', 80)),
+    'jpeg': int(os.getenv('IMAGE_DERIVATIVE_JPEG_QUALITY', 85)),
+}
+
+
+def _avif_supported() -> bool:
+    try:
+        return bool(features.check_module('avif'))
+    except ValueError:  # Pillow < 11.2 has no built-in AVIF codec
+        try:
+            import pillow_avif  # noqa: F401 registers the AVIF plugin
+        except ImportError:
+            return False
+        return True
+
+
+# format -> (Pillow format, mime type, file extension), in order of preference
+FORMATS: Dict[str, Tuple[str, str, str]] = {}
+if _avif_supported():
+    FORMATS['avif'] = ('AVIF', 'image/avif', '.avif')
+if features.check_module('webp'):
+    FORMATS['webp'] = ('WEBP', 'image/webp', '.webp')
+FORMATS['jpeg'] = ('JPEG', 'image/jpeg', '.jpg')
+
+
+def choose_format(accept: Optional[str]) -> str:
+    """
+    Pick the most compact format the client lists in its Accept header
+
+    Only explicit image/avif and image/webp entries count, since */* is sent
+    by clients that cannot decode either.
+    """
+    accepted = set()
+    for media_range in (accept or '').lower().split(','):
+        media_type, _, params = media_range.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(media_type.strip())
+
+    for name, (_, mime_type, _) in FORMATS.items():
+        if name == 'jpeg' or mime_type in accepted:
+            return name
+    return 'jpeg'
+
+
+def snap_size(value: Optional[int]) -> Optional[int]:
+    """Round a requested width/height up to the next allowed size"""
+    if value is None:
+        return None
+    if value <= 0:
+        raise ValueError("Width and height must be positive")
+    for size in DERIVATIVE_SIZES:
+        if size >= value:
+            return size
+    return DERIVATIVE_SIZES[-1]
+
+
+def derivative_key(source_stat: os.stat_result, width: Optional[int], height: Optional[int], fmt: str) -> str:
+    """Name of a variant, used in its ETag and file name"""
+    return f"{source_stat.st_size:x}-{source_stat.st_mtime_ns:x}-{width or 0}x{height or 0}-{fmt}"
+
+
+def derivative_path(source_path: str, key: str, fmt: str) -> str:
+    """Where the derivative of a source image is cached"""
+    digest = hashlib.sha256(f"{os.path.abspath(source_path)}:{key}".encode()).hexdigest()
+    return shard_path(IMAGE_DERIVATIVE_FOLDER, f"{digest}{FORMATS[fmt][2]}")
+
+
+@observe_stage('derivative_encode')
+def make_derivative(source_path: str,
+                    target_path: str,
+                    width: Optional[int],
+                    height: Optional[int],
+                    fmt: str) -> str:
+    """
+    Resize and encode a source image into target_path (CPU-bound, run in a worker)
+
+    Images are only ever shrunk. Returns target_path.
+    """
+    if os.path.exists(target_path):
+        return target_path
+
+    with Image.open(source_path) as image:
+        box = (width or image.width, height or image.height)
+        # Let the JPEG decoder skip most of the pixels while decoding
+        image.draft('RGB', box)
+        image = normalize_image(image)
+        image.thumbnail(box, Image.LANCZOS)
+        size = image.size
+
+        pillow_format = FORMATS[fmt][0]
+        options = {'quality': DERIVATIVE_QUALITY[fmt]}
+        if fmt == 'jpeg':
+            options.update(progressive=True, optimize=True)
+        elif fmt == 'webp':
+            options.update(method=4)
+
+        # Write to a temporary name first so concurrent requests never read a partial file
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f"{target_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            image.save(tmp_path, format=pillow_format, **options)
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    print(f"🖼️ Derivative {os.path.basename(source_path)} -> {size[0]}x{size[1]} {fmt}: "
+          f"{os.path.getsize(target_path) // 1024}KB")
+    return target_path
+
+
+__all__ = [
+    "FORMATS",
+    "choose_format",
+    "derivative_key",
+    "derivative_path",
+    "make_derivative",
+    "snap_size"
+]
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Bulk Catalog Ingestion
+Validates every garment image in a directory and dresses one model in each
+
+Progress is appended to a JSONL manifest (one line per finished item), so an
+interrupted run can simply be started again: items the manifest already lists
+as completed (or rejected by validation) are skipped.
+
+Usage:
+    python ingest_catalog.py catalog/ --concurrency 8 --gender female --age 25
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from function_agents import (
+    check_cloth_validity,
+    merge_model_with_clothing_async,
+    prepare_model_image_async,
+    close_clients
+)
+from upload_store import UploadStore
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+DEFAULT_MANIFEST = 'manifest.jsonl'
+
+# Garments are stored content-addressed, shared with the API's /api/uploads
+upload_store = UploadStore()
+
+
+def find_images(input_dir: str) -> List[str]:
+    """Find garment images below a directory, in a stable order"""
+    images = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.join(root, name))
+    return sorted(images)
+
+
+def load_manifest(manifest_path: str) -> Dict[str, dict]:
+    """
+    Load the latest manifest record per input file
+
+    A truncated last line (the process died while writing it) is ignored.
+    """
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record['input']] = record
+    return records
+
+
+class ManifestWriter:
+    """Appends one JSON line per finished item and syncs it to disk"""
+
+    def __init__(self, manifest_path: str):
+        self.file = open(manifest_path, 'a', encoding='utf-8')
+
+    def write(self, record: dict) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def is_done(record: Optional[dict], garment_id: str, recheck_rejected: bool) -> bool:
+    """Whether a previous run already finished this exact image"""
+    if record is None or record.get('garment_id') != garment_id:
+        return False
+    if record['status'] == 'completed':
+        return True
+    return record['status'] == 'rejected' and not recheck_rejected
+
+
+async def process_item(image_path: str,
+                       input_dir: str,
+                       garment_id: str,
+                       model_image_path: str,
+                       model_specs: dict,
+                       skip_validation: bool) -> dict:
+    """Validate one garment and merge it onto the model, returning its manifest record"""
+    loop = asyncio.get_running_loop()
+    garment_path = upload_store.get_path(garment_id)
+    record = {
+        'input': os.path.relpath(image_path, input_dir),
+        'garment_id': garment_id,
+        'model_image': model_image_path,
+        'output': None,
+        'stage_timings': {},
+        'error': None
+    }
+
+    try:
+        if not skip_validation:
+            started = time.time()
+            check_result = await loop.run_in_executor(None, check_cloth_validity, garment_path)
+            record['stage_timings']['validation'] = round(time.time() - started, 3)
+            if not check_result['valid']:
+                record['status'] = 'rejected'
+                record['error'] = check_result['error_message']
+                return record
+
+        camera_settings = model_specs.get('camera', {})
+        started = time.time()
+        result_path = await merge_model_with_clothing_async(
+            model_image_path,
+            garment_path,
+            shot_type=camera_settings.get('shot_type', 'full_body'),
+            angle=camera_settings.get('angle', 'front'),
+            pose_description=model_specs.get('action_description', ''),
+            scene_description=model_specs.get('scene_description', '')
+        )
+        record['stage_timings']['merge'] = round(time.time() - started, 3)
+        if not os.path.exists(result_path):
+            raise Exception(f"Final image not generated: {result_path}")
+
+        record['status'] = 'completed'
+        record['output'] = result_path
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = str(e)
+    finally:
+        record['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    return record
+
+
+async def ingest(args: argparse.Namespace, model_specs: dict) -> int:
+    """Run the ingestion, returning the number of failed items"""
+    loop = asyncio.get_running_loop()
+    manifest_path = args.manifest or os.path.join(args.input_dir, DEFAULT_MANIFEST)
+    previous = load_manifest(manifest_path)
+
+    images = find_images(args.input_dir)
+    print(f"📂 Found {len(images)} images in {args.input_dir}")
+
+    # Store each image once in the garment store; its content hash tells whether it changed
+    pending = []
+    skipped = 0
+    for image_path in images:
+        try:
+            with open(image_path, 'rb') as f:
+                garment_id = await loop.run_in_executor(None, upload_store.put, f.read())
+        except Exception as e:
+            print(f"⚠️ Skipping unreadable image {image_path}: {e}")
+            continue
+        record = previous.get(os.path.relpath(image_path, args.input_dir))
+        if is_done(record, garment_id, args.recheck_rejected):
+            skipped += 1
+        else:
+            pending.append((image_path, garment_id))
+    print(f"⏭️ Skipping {skipped} items already in the manifest, {len(pending)} to process")
+    if not pending:
+        return 0
+
+    # The model image is shared by every item, so it is generated (or fetched from the cache) once
+    if args.model_image:
+        model_image_path = args.model_image
+    else:
+        print("🎨 Preparing model image...")
+        model_image_path, cached = await prepare_model_image_async(model_specs)
+        print(f"✅ Model image {'reused' if cached else 'generated'}: {model_image_path}")
+
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    writer = ManifestWriter(manifest_path)
+    counts = {'completed': 0, 'rejected': 0, 'failed': 0}
+
+    async def run(image_path: str, garment_id: str):
+        async with semaphore:
+            record = await process_item(
+                image_path, args.input_dir, garment_id, model_image_path, model_specs, args.skip_validation
+            )
+        writer.write(record)
+        counts[record['status']] += 1
+        done = sum(counts.values())
+        icon = {'completed': '✅', 'rejected': '🚫', 'failed': '❌'}[record['status']]
+        print(f"{icon} [{done}/{len(pending)}] {record['input']}: {record['output'] or record['error']}")
+
+    try:
+        await asyncio.gather(*(run(image_path, garment_id) for image_path, garment_id in pending))
+    finally:
+        writer.close()
+
+    print(f"\n🎉 Done: {counts['completed']} completed, {counts['rejected']} rejected, {counts['failed']} failed")
+    print(f"📝 Manifest: {manifest_path}")
+    return counts['failed']
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk virtual try-on for a directory of garment images")
+    parser.add_argument('input_dir', help="Directory of garment images (searched recursively)")
+    parser.add_argument('--manifest', help=f"JSONL manifest path (default: <input_dir>/{DEFAULT_MANIFEST})")
+    parser.add_argument('--concurrency', type=int, default=4, help="Items processed concurrently")
+    parser.add_argument('--model-image', help="Use an existing model image instead of generating one")
+    parser.add_argument('--skip-validation', action='store_true', help="Do not run the clothing check")
+    parser.add_argument('--recheck-rejected', action='store_true', help="Process items rejected by a previous run again")
+    parser.add_argument('--gender', default='female')
+    parser.add_argument('--age', type=int, default=25)
+    parser.add_argument('--nationality', default='Chinese')
+    parser.add_argument('--height', type=int, default=170)
+    parser.add_argument('--weight', type=int, default=60)
+    parser.add_argument('--shot-type', default='full_body', choices=['full_body', 'half_body'])
+    parser.add_argument('--angle', default='front', choices=['front', 'side'])
+    parser.add_argument('--pose', default='', help="Action description, e.g. 自然站立姿势")
+    parser.add_argument('--scene', default='', help="Scene description, e.g. 简约工作室背景")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if not os.path.isdir(args.input_dir):
+        print(f"❌ Not a directory: {args.input_dir}")
+        return 2
+    if args.model_image and not os.path.exists(args.model_image):
+        print(f"❌ Model image not found: {args.model_image}")
+        return 2
+
+    model_specs = {
+        'gender': args.gender,
+        'age': args.age,
+        'nationality': args.nationality,
+        'height': args.height,
+        'weight': args.weight,
+        'camera': {'shot_type': args.shot_type, 'angle': args.angle},
+        'action_description': args.pose,
+        'scene_description': args.scene
+    }
+
+    try:
+        failed = asyncio.run(ingest(args, model_specs))
+    except KeyboardInterrupt:
+        print("\n🛑 Interrupted, re-run the same command to resume")
+        return 130
+    finally:
+        close_clients()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
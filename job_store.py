@@ -0,0 +1,215 @@
+"""
+Durable job store for asynchronous try-on generation
+
+Jobs are persisted in a local SQLite database so that queued work survives
+process restarts and can be shared by several uvicorn worker processes.
+A job moves through: queued -> running -> completed / failed.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', 'jobs.db')
+# Running jobs whose heartbeat is older than this are considered abandoned
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 900))
+# Running jobs are given up (failed) once this many workers have claimed them
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    stage_timings TEXT NOT NULL DEFAULT '{}',
+    stage_started_at REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """SQLite backed job queue shared by API handlers and job workers"""
+
+    def __init__(self,
+                 db_path: str = JOB_DB_PATH,
+                 lease_seconds: int = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, kind: str, payload: Dict) -> str:
+        """Queue a new job and return its ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), now, now)
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict]:
+        """
+        Atomically claim the oldest runnable job
+
+        Runnable means queued, or running with an expired lease (the worker
+        that owned it crashed or the process was restarted). Expired jobs
+        that already used up max_attempts are failed instead, so a job that
+        keeps killing its worker is not claimed forever.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, "
+                    "stage_started_at = NULL, updated_at = ? "
+                    "WHERE status = 'running' AND updated_at < ? AND attempts >= ?",
+                    (f"Abandoned after {self.max_attempts} attempts", now, now,
+                     now - self.lease_seconds, self.max_attempts)
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' "
+                    "OR (status = 'running' AND updated_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now - self.lease_seconds,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', stage = NULL, stage_timings = '{}', "
+                    "stage_started_at = NULL, started_at = ?, updated_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (now, now, row['id'])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        job = self._row_to_dict(row)
+        job['status'] = 'running'
+        job['attempts'] += 1
+        return job
+
+    def mark_stage(self, job_id: str, stage: str) -> None:
+        """Record that a job entered a new stage, closing the timing of the previous one"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT stage, stage_timings, stage_started_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return
+            timings = json.loads(row['stage_timings'] or '{}')
+            if row['stage'] and row['stage_started_at']:
+                timings[row['stage']] = round(now - row['stage_started_at'], 3)
+            conn.execute(
+                "UPDATE jobs SET stage = ?, stage_timings = ?, stage_started_at = ?, "
+                "updated_at = ? WHERE id = ?",
+                (stage, json.dumps(timings), now, now, job_id)
+            )
+
+    def heartbeat(self, job_id: str) -> None:
+        """Renew the lease of a running job, so a slow stage is not mistaken for a crashed worker"""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id)
+            )
+
+    def complete(self, job_id: str, result: Dict) -> None:
+        """Mark a job as completed with its result"""
+        self._finish(job_id, 'completed', result=result)
+
+    def fail(self, job_id: str, error: str) -> None:
+        """Mark a job as failed"""
+        self._finish(job_id, 'failed', error=error)
+
+    def _finish(self, job_id: str, status: str,
+                result: Optional[Dict] = None, error: Optional[str] = None) -> None:
+        self.mark_stage(job_id, status)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, "
+                "stage_started_at = NULL, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None,
+                 error, now, now, job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Get job by ID, or None if unknown"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def queue_depth(self) -> int:
+        """Number of jobs waiting to be picked up"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def pending_payloads(self) -> List[Dict]:
+        """Payloads of jobs that are queued or running, whose input files must be kept"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT payload FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return [json.loads(row['payload']) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        return {
+            'job_id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'stage': row['stage'],
+            'payload': json.loads(row['payload']),
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'stage_timings': json.loads(row['stage_timings'] or '{}'),
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+            'attempts': row['attempts']
+        }
+
+    @staticmethod
+    def to_public(job: Dict) -> Dict:
+        """Strip internal fields before returning a job to API clients"""
+        public = {k: v for k, v in job.items() if k not in ('payload', 'kind')}
+        if job['started_at'] and job['finished_at']:
+            public['total_seconds'] = round(job['finished_at'] - job['started_at'], 3)
+        return public
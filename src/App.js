@@ -47,6 +47,9 @@ function App() {
   const [isModelGenerating, setIsModelGenerating] = useState(false);
   const [imageMergeProgress, setImageMergeProgress] = useState(0);
   const [isImageMerging, setIsImageMerging] = useState(false);
+  // 每个阶段的真实耗时（秒），来自后端SSE事件
+  const [stageTimings, setStageTimings] = useState({});
+  const stageKeys = ['description', 'model_generation', 'merge'];
   
   // 自定义弹窗状态
   const [showModal, setShowModal] = useState(false);
@@ -58,38 +61,37 @@ function App() {
     onConfirm: () => setShowModal(false)
   });
 
-  // 创建真实的进度模拟函数
-  const createProgressSimulation = (setProgress, targetTime = 30000) => {
-    const interval = 500; // 每500ms更新一次
-    const maxProgress = 90; // 最大进度90%
-    const totalSteps = targetTime / interval; // 总步数
-    const baseIncrement = maxProgress / totalSteps; // 基础增长量
-    
-    let currentProgress = 0;
-    let step = 0;
-    
-    const progressInterval = setInterval(() => {
-      step++;
-      
-      // 使用指数衰减公式让进度条开始快，后面慢
-      const progressFactor = 1 - Math.exp(-step / (totalSteps * 0.3));
-      const targetProgress = maxProgress * progressFactor;
-      
-      // 添加一些随机波动让进度更自然
-      const randomFactor = 0.5 + Math.random() * 0.5; // 0.5-1.0
-      const increment = (targetProgress - currentProgress) * 0.1 * randomFactor;
-      
-      currentProgress = Math.min(currentProgress + increment, maxProgress);
-      setProgress(Math.floor(currentProgress));
-      
-      // 如果达到目标时间，停在90%
-      if (step >= totalSteps) {
-        setProgress(90);
-        clearInterval(progressInterval);
+  // 读取Server-Sent Events流，每收到一个事件就回调一次
+  const readEventStream = async (response, onEvent) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let eventName = 'message';
+        let dataText = '';
+        rawEvent.split('\n').forEach(line => {
+          if (line.startsWith('event:')) {
+            eventName = line.slice(6).trim();
+          } else if (line.startsWith('data:')) {
+            dataText += line.slice(5).trim();
+          }
+        });
+        // 忽略心跳注释
+        if (dataText) {
+          onEvent(eventName, JSON.parse(dataText));
+        }
       }
-    }, interval);
-    
-    return progressInterval;
+    }
   };
 
   // 显示错误弹窗的函数
@@ -145,11 +147,32 @@ function App() {
     setModelImage(null);
     setError(null);
     setCurrentStep(0);
+    setStageTimings({});
     
     // 重置所有步骤状态
     setProcessSteps(prev => prev.map(step => ({ ...step, status: 'waiting' })));
 
     try {
+      // 上传衣服图片一次，后续请求只传garmentId
+      console.log('📤 Uploading clothing image...');
+      setSuccessMessage('📤 正在上传衣服图片...');
+      
+      const uploadResponse = await fetch(`${API_BASE_URL}/api/uploads`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          clothingImage: previewImage
+        })
+      });
+      
+      if (!uploadResponse.ok) {
+        throw new Error(`Image upload failed: ${uploadResponse.status}`);
+      }
+      
+      const { garment_id: garmentId } = await uploadResponse.json();
+      
       // 第一步：验证衣服图片
       console.log('🔍 Validating clothing image...');
       setSuccessMessage('🔍 正在验证上传的衣服图片...');
@@ -160,7 +183,7 @@ function App() {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          clothingImage: previewImage
+          garmentId
         })
       });
       
@@ -215,113 +238,74 @@ function App() {
         })));
       };
 
-      // 第一步：ModelDescriptionAgent（快速完成）
-      updateStep(0, 'processing');
-      await new Promise(resolve => setTimeout(resolve, 1000)); // 短暂延迟用于UI显示
-      updateStep(0, 'completed');
-      
-      // 第二步：ModelGenerationAgent - 生成模特图片
-      updateStep(1, 'processing');
-      setIsModelGenerating(true);
-      setModelGenerationProgress(0);
-      
-      // 启动真实的进度模拟 - 30秒到90%
-      const modelProgressInterval = createProgressSimulation(setModelGenerationProgress, 30000);
-      
-      console.log('🎨 Calling model generation API...');
-      const modelResponse = await fetch(`${API_BASE_URL}/api/generate-model-only`, {
+      // 通过SSE接收真实的阶段进度
+      const stageIndex = { description: 0, model_generation: 1, merge: 2 };
+      let finalResult = null;
+      let streamError = null;
+
+      console.log('📡 Calling streamed step-by-step API...');
+      const streamResponse = await fetch(`${API_BASE_URL}/api/generate-step-by-step/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify(modelParams)
+        body: JSON.stringify({
+          garmentId,
+          ...modelParams
+        })
       });
-      
-      // 清除进度模拟，完成到100%
-      clearInterval(modelProgressInterval);
-      setModelGenerationProgress(100);
-      setIsModelGenerating(false);
 
-      if (!modelResponse.ok) {
-        throw new Error(`Model generation failed: ${modelResponse.status}`);
+      if (!streamResponse.ok) {
+        throw new Error(`Generation failed: ${streamResponse.status}`);
       }
 
-      const modelResult = await modelResponse.json();
-
-      if (modelResult.success && modelResult.result.model_image.success) {
-        // 模特生成成功，立即显示模特图片
-        updateStep(1, 'completed');
-        const modelImageUrl = `${API_BASE_URL}${modelResult.result.model_image.image_url}`;
-        setModelImage(modelImageUrl);
-        console.log('✅ Model image generated and displayed:', modelImageUrl);
-        
-        // 显示中间成功消息
-        setSuccessMessage('🎨 专属模特生成完成！正在进行试衣合并...');
-        
-        // 等待用户查看模特图片
-        await new Promise(resolve => setTimeout(resolve, 2000));
-        
-        // 第三步：ImageMergeAgent - 图像合并
-        updateStep(2, 'processing');
-        setSuccessMessage('👕 正在进行虚拟试衣合并...');
-        setIsImageMerging(true);
-        setImageMergeProgress(0);
-        
-        // 启动图像合并进度模拟 - 30秒到90%
-        const mergeProgressInterval = createProgressSimulation(setImageMergeProgress, 30000);
-        
-        console.log('👕 Calling clothing merge API...');
-        const mergeResponse = await fetch(`${API_BASE_URL}/api/merge-clothing-only`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({
-            clothingImage: previewImage, // base64图片数据
-            modelImagePath: modelResult.result.model_image.image_path,
-            shot_type: formData.shotType === 'full_body' ? '全身' : '半身',
-            angle: formData.angle === 'front' ? '正面' : '侧面',
-            pose_description: formData.actionDescription || '自然站立姿势',
-            scene_description: formData.sceneDescription || '简约工作室背景'
-          })
-        });
-        
-        // 清除进度模拟，完成到100%
-        clearInterval(mergeProgressInterval);
-        setImageMergeProgress(100);
-        setIsImageMerging(false);
-
-        if (!mergeResponse.ok) {
-          throw new Error(`Clothing merge failed: ${mergeResponse.status}`);
+      await readEventStream(streamResponse, (event, data) => {
+        if (event === 'stage_started') {
+          updateStep(stageIndex[data.stage], 'processing');
+          if (data.stage === 'model_generation') {
+            setIsModelGenerating(true);
+            setModelGenerationProgress(0);
+          } else if (data.stage === 'merge') {
+            setSuccessMessage('👕 正在进行虚拟试衣合并...');
+            setIsImageMerging(true);
+            setImageMergeProgress(0);
+          }
+        } else if (event === 'stage_completed') {
+          updateStep(stageIndex[data.stage], 'completed');
+          setStageTimings(prev => ({ ...prev, [data.stage]: data.elapsed_seconds }));
+          if (data.stage === 'model_generation') {
+            setModelGenerationProgress(100);
+            setIsModelGenerating(false);
+            // 模特生成成功，立即显示模特图片（合并仍在进行）
+            const modelImageUrl = `${API_BASE_URL}${data.model_image.image_url}`;
+            setModelImage(modelImageUrl);
+            setSuccessMessage('🎨 专属模特生成完成！正在进行试衣合并...');
+            console.log('✅ Model image generated and displayed:', modelImageUrl);
+          } else if (data.stage === 'merge') {
+            setImageMergeProgress(100);
+            setIsImageMerging(false);
+          }
+        } else if (event === 'result') {
+          finalResult = data;
+        } else if (event === 'error') {
+          streamError = data.error;
         }
+      });
 
-        const mergeResult = await mergeResponse.json();
-
-        if (mergeResult.success && mergeResult.result.final_image.success) {
-          // 合并成功，显示最终结果
-          updateStep(2, 'completed');
-          
-          // 保存最终结果
-          setGeneratedImage({
-            result: {
-              generated_image: mergeResult.result.final_image
-            }
-          });
-          
-          setSuccessMessage('🎉 虚拟试穿完成！所有步骤都已成功完成');
-          console.log('✅ Final try-on image generated:', mergeResult.result.final_image.image_url);
-        } else {
-          // 合并失败，但模特图片成功了
-          updateStep(2, 'failed');
-          setSuccessMessage('🎨 模特生成成功，但试衣合并失败');
-          setError(`图像合并失败: ${mergeResult.error || '未知错误'}`);
-        }
-      } else {
-        // 模特生成失败
-        updateStep(1, 'failed');
-        throw new Error(modelResult.error || '模特生成失败');
+      if (streamError || !finalResult) {
+        throw new Error(streamError || '生成流意外中断');
       }
 
+      // 保存最终结果
+      setGeneratedImage({
+        result: {
+          generated_image: finalResult.final_image
+        }
+      });
+
+      setSuccessMessage('🎉 虚拟试穿完成！所有步骤都已成功完成');
+      console.log('✅ Final try-on image generated:', finalResult.final_image.image_url, finalResult.stage_timings);
+
     } catch (error) {
       console.error('Generation error:', error);
       setError(`生成失败: ${error.message}`);
@@ -358,6 +342,7 @@ function App() {
     setError(null);
     setSuccessMessage(null);
     setCurrentStep(0);
+    setStageTimings({});
     setProcessSteps([
       { id: 1, name: '📝 ModelDescriptionAgent', description: '智能分析模特参数，生成详细描述', status: 'waiting' },
       { id: 2, name: '🎨 ModelGenerationAgent', description: '基于描述生成专属模特图像', status: 'waiting' },
@@ -603,7 +588,11 @@ function App() {
                           <h4>{step.name}</h4>
                           <p>{step.description}</p>
                           <div className="step-status">
-                            {step.status === 'completed' && '✅ 完成'}
+                            {step.status === 'completed' && (
+                              stageTimings[stageKeys[index]] !== undefined
+                                ? `✅ 完成 (${stageTimings[stageKeys[index]].toFixed(1)}s)`
+                                : '✅ 完成'
+                            )}
                             {step.status === 'processing' && '🔄 处理中...'}
                             {step.status === 'waiting' && '⏳ 等待中'}
                             {step.status === 'failed' && '❌ 失败'}
@@ -622,12 +611,12 @@ function App() {
                                 <div className="simple-progress">
                                   <div className="simple-progress-bar">
                                     <div 
-                                      className="simple-progress-fill" 
-                                      style={{ width: `${modelGenerationProgress}%` }}
+                                      className={`simple-progress-fill ${modelGenerationProgress < 100 ? 'indeterminate' : ''}`}
+                                      style={modelGenerationProgress < 100 ? undefined : { width: '100%' }}
                                     ></div>
                                   </div>
                                   <p className="simple-progress-text">
-                                    {Math.round(modelGenerationProgress)}% - 🎨 AI正在绘制您的专属模特...
+                                    🎨 AI正在绘制您的专属模特...
                                   </p>
                                 </div>
                               )}
@@ -640,12 +629,12 @@ function App() {
                                 <div className="simple-progress">
                                   <div className="simple-progress-bar">
                                     <div 
-                                      className="simple-progress-fill" 
-                                      style={{ width: `${imageMergeProgress}%` }}
+                                      className={`simple-progress-fill ${imageMergeProgress < 100 ? 'indeterminate' : ''}`}
+                                      style={imageMergeProgress < 100 ? undefined : { width: '100%' }}
                                     ></div>
                                   </div>
                                   <p className="simple-progress-text">
-                                    {Math.round(imageMergeProgress)}% - 👕 AI正在完美融合模特与服装...
+                                    👕 AI正在完美融合模特与服装...
                                   </p>
                                 </div>
                               )}
@@ -0,0 +1,184 @@
+import asyncio
+import base64
+import importlib
+import os
+from io import BytesIO
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope='module')
+def api_server(tmp_path_factory):
+    """The app imported in a scratch directory, since it creates its folders and databases on import"""
+    original_cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('server'))
+    try:
+        yield importlib.import_module('api_server')
+    finally:
+        os.chdir(original_cwd)
+
+
+@pytest.fixture
+def client(api_server):
+    # Not used as a context manager, so startup hooks (job workers, warm-up) do not run
+    return TestClient(api_server.app)
+
+
+def test_rejected_oversized_request_is_traced_and_counted(api_server, client):
+    from function_agents.metrics import render_metrics
+
+    response = client.post('/api/generate-model', content=b'{}', headers={
+        'content-type': 'application/json',
+        'content-length': str(api_server.MAX_JSON_BODY_LENGTH + 1)
+    })
+
+    assert response.status_code == 413
+    assert response.headers['x-trace-id']
+    assert 'status="413"' in render_metrics()
+
+
+@pytest.fixture
+def generated_image(api_server):
+    from PIL import Image
+    from function_agents.storage import shard_path
+
+    path = shard_path(api_server.IMAGE_FOLDER, 'tryon_0123abcd.jpg')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', (1024, 1536), (30, 60, 90)).save(path, quality=90)
+    return 'tryon_0123abcd.jpg'
+
+
+def test_image_revalidation_answers_304(client, generated_image):
+    response = client.get(f'/imgs/{generated_image}', headers={'accept': 'image/jpeg'})
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['cache-control']
+    etag = response.headers['etag']
+
+    for if_none_match in (etag, f'W/{etag}', f'"other", {etag}'):
+        revalidated = client.get(f'/imgs/{generated_image}', headers={'accept': 'image/jpeg', 'if-none-match': if_none_match})
+        assert revalidated.status_code == 304
+        assert revalidated.content == b''
+        assert revalidated.headers['etag'] == etag
+    assert client.get(f'/imgs/{generated_image}', headers={'accept': 'image/jpeg', 'if-none-match': '"other"'}).status_code == 200
+    assert client.get(f'/imgs/{generated_image}', headers={
+        'accept': 'image/jpeg', 'if-modified-since': response.headers['last-modified']
+    }).status_code == 304
+
+
+def test_derivative_revalidation_answers_304(client, generated_image):
+    from image_derivatives import FORMATS
+
+    url = f'/imgs/{generated_image}?w=384'
+    response = client.get(url, headers={'accept': 'image/webp,image/*'})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == FORMATS['webp' if 'webp' in FORMATS else 'jpeg'][1]
+    assert 'Accept' in response.headers['vary']
+
+    revalidated = client.get(url, headers={'accept': 'image/webp,image/*', 'if-none-match': response.headers['etag']})
+    assert revalidated.status_code == 304
+
+
+def save_image(path):
+    from PIL import Image
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', (64, 96), (200, 200, 200)).save(path)
+    return path
+
+
+@pytest.fixture
+def fake_pipeline(api_server, monkeypatch):
+    """Replace the upstream stages with instant local ones; returns the call log"""
+    import function_agents
+
+    calls = []
+
+    async def prepare_model_image_async(model_params, progress_callback=None):
+        calls.append('model')
+        for stage in ('description', 'model_generation'):
+            if progress_callback is not None:
+                progress_callback(stage)
+            await asyncio.sleep(0.05)
+        return save_image('imgs/model_0123abcd.jpg'), False
+
+    async def merge_model_with_clothing_async(model_image_path, clothing_path, *args):
+        calls.append('merge')
+        await asyncio.sleep(0.05)
+        return f"Saved to {save_image('imgs/tryon_4567cdef.jpg')}"
+
+    async def merge_batch_async(model_image_path, clothing_paths, model_params, concurrency=4):
+        for index in reversed(range(len(clothing_paths))):
+            calls.append('merge')
+            if clothing_paths[index].endswith('bad.jpg'):
+                yield index, None, ValueError('upstream refused')
+            else:
+                yield index, save_image(f'imgs/tryon_{index:08x}.jpg'), None
+
+    monkeypatch.setattr(api_server, 'prepare_model_image_async', prepare_model_image_async)
+    monkeypatch.setattr(function_agents, 'merge_model_with_clothing_async', merge_model_with_clothing_async)
+    monkeypatch.setattr(api_server, 'merge_batch_async', merge_batch_async)
+    monkeypatch.setattr(api_server, 'SSE_HEARTBEAT_INTERVAL', 0.02)
+    return calls
+
+
+def collect(events):
+    async def run():
+        return [event async for event in events]
+    return asyncio.run(run())
+
+
+def test_step_by_step_events_report_each_stage(api_server, fake_pipeline):
+    clothing = save_image('uploads/cloth.jpg')
+    events = collect(api_server.step_by_step_events(clothing, {'camera': {}}))
+
+    stages = [(event, data['stage']) for event, data in events if event.startswith('stage_')]
+    assert stages == [
+        ('stage_started', 'description'), ('stage_completed', 'description'),
+        ('stage_started', 'model_generation'), ('stage_completed', 'model_generation'),
+        ('stage_started', 'merge'), ('stage_completed', 'merge')
+    ]
+    assert ('heartbeat', None) in events
+    event, result = events[-1]
+    assert event == 'result'
+    assert set(result['stage_timings']) == {'description', 'model_generation', 'merge'}
+    assert result['final_image']['image_url'] == '/imgs/tryon_4567cdef.jpg'
+    assert not os.path.exists(clothing)
+
+
+def test_step_by_step_stream_is_server_sent_events(client, fake_pipeline):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', (64, 96), (10, 20, 30)).save(buffer, 'JPEG')
+    response = client.post('/api/generate-step-by-step/stream', json={
+        'clothingImage': 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+    })
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    assert 'event: stage_started\ndata: {"stage": "description"}\n\n' in response.text
+    assert ': keep-alive\n\n' in response.text
+    assert response.text.split('\n\n')[-2].startswith('event: result\n')
+
+
+def test_batch_events_share_one_model_and_report_failures(api_server, fake_pipeline):
+    garments = [
+        {'id': 'a', 'filepath': save_image('uploads/a.jpg'), 'is_temporary': True},
+        {'id': 'b', 'filepath': save_image('uploads/bad.jpg'), 'is_temporary': True}
+    ]
+    events = [(event, data) for event, data in collect(api_server.batch_tryon_events(garments, {}, None, 2))
+              if event != 'heartbeat']
+
+    assert fake_pipeline == ['model', 'merge', 'merge']
+    assert [event for event, _ in events] == ['model_ready', 'item_completed', 'item_completed', 'result']
+    assert events[0][1]['cached'] is False
+    assert [(item['id'], item['success']) for _, item in events[1:3]] == [('b', False), ('a', True)]
+    assert events[1][1]['error'] == 'upstream refused'
+    assert (events[-1][1]['succeeded'], events[-1][1]['failed']) == (1, 1)
+    assert not any(os.path.exists(garment['filepath']) for garment in garments)
+
+
+def test_batch_rejects_empty_garment_list(client):
+    response = client.post('/api/tryon/batch', json={'garments': []})
+    assert response.status_code == 400
@@ -0,0 +1,66 @@
+import random
+
+from PIL import Image, ImageDraw
+
+from function_agents.cloth_check_cache import ClothCheckCache, compute_image_hashes
+
+
+def make_cache(tmp_path, **options):
+    options.setdefault('db_path', str(tmp_path / 'cloth_check_cache.db'))
+    return ClothCheckCache(**options)
+
+
+def garment(path, color, shifted=False):
+    """A plain shirt shape; shifted draws it a few pixels over, as a re-encoded or re-cropped photo would be"""
+    image = Image.new('RGB', (256, 256), 'white')
+    offset = 3 if shifted else 0
+    ImageDraw.Draw(image).polygon([(60 + offset, 40), (196 + offset, 40), (230 + offset, 100), (196 + offset, 110),
+                                   (196 + offset, 230), (60 + offset, 230), (60 + offset, 110), (26 + offset, 100)],
+                                  fill=color)
+    image.save(path, quality=90)
+    return compute_image_hashes(str(path))
+
+
+def test_exact_and_perceptual_hits(tmp_path):
+    cache = make_cache(tmp_path)
+    original = garment(tmp_path / 'a.jpg', 'navy')
+    cache.store(original, True)
+
+    assert cache.lookup(original) is True
+    assert cache.lookup(garment(tmp_path / 'b.jpg', 'navy', shifted=True)) is True
+    stats = cache.get_stats()
+    assert (stats['exact_hits'], stats['perceptual_hits']) == (1, 1)
+
+
+def test_negative_distance_disables_perceptual_lookup(tmp_path):
+    cache = make_cache(tmp_path, max_distance=-1)
+    cache.store(garment(tmp_path / 'a.jpg', 'navy'), True)
+
+    assert cache.lookup(garment(tmp_path / 'b.jpg', 'navy', shifted=True)) is None
+
+
+def test_index_matches_a_full_scan(tmp_path):
+    rng = random.Random(7)
+    for distance in (0, 4, 10):
+        cache = make_cache(tmp_path, max_distance=distance, db_path='')
+        stored = [(f"{i:064x}", rng.getrandbits(64), rng.getrandbits(64)) for i in range(300)]
+        for hashes in stored:
+            cache.store(hashes, True)
+        for sha256, ahash, dhash in stored[:50]:
+            # Flip a few bits of a stored hash, so some probes are near an entry and some are not
+            flips = sum(1 << bit for bit in rng.sample(range(64), rng.randint(0, 2 * distance + 2)))
+            probe = ('probe', ahash, dhash ^ flips)
+            near = [entry for entry in stored
+                    if bin(entry[2] ^ probe[2]).count('1') <= distance and bin(entry[1] ^ probe[1]).count('1') <= distance]
+            assert (cache.lookup(probe) is True) == bool(near)
+
+
+def test_entries_are_reloaded_and_bounded(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    for i in range(3):
+        cache.store((f"{i:064x}", i, i << 32), i != 1)
+
+    reloaded = make_cache(tmp_path, max_entries=2)
+    assert reloaded.get_stats()['entries'] == 2
+    assert reloaded.lookup((f"{2:064x}", 2, 2 << 32)) is True
+    assert reloaded.lookup((f"{1:064x}", 1, 1 << 32)) is False
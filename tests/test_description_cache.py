@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from function_agents.model_description_agent import DescriptionCache
+
+
+def make_cache(tmp_path, **options):
+    options.setdefault('db_path', str(tmp_path / 'description_cache.db'))
+    return DescriptionCache(**options)
+
+
+def test_memory_tier_hits_and_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2, db_path='')
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.set('c', 'C')
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('A', 'C')
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    make_cache(tmp_path).set('prompt', 'description')
+
+    cache = make_cache(tmp_path)
+    assert cache.get('prompt') == 'description'
+    assert cache.get('prompt') == 'description'
+    assert (cache.disk_hits, cache.hits) == (1, 1)
+
+
+def test_expired_entries_miss(tmp_path):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    cache._disk_set('prompt', ('stale', time.time() - 120))
+
+    assert cache.get('prompt') is None
+    assert cache.misses == 1
+
+
+def test_async_tier_matches_sync_tier(tmp_path):
+    async def run():
+        await make_cache(tmp_path).set_async('prompt', 'description')
+        cache = make_cache(tmp_path)
+        return await cache.get_async('prompt'), await cache.get_async('other'), cache
+
+    found, missing, cache = asyncio.run(run())
+    assert (found, missing) == ('description', None)
+    assert (cache.disk_hits, cache.misses) == (1, 1)
@@ -0,0 +1,89 @@
+import sqlite3
+import time
+
+from job_store import JobStore
+
+
+def make_store(tmp_path, **options):
+    return JobStore(db_path=str(tmp_path / 'jobs.db'), **options)
+
+
+def expire_lease(store, job_id, seconds):
+    """Pretend the job's last heartbeat was `seconds` ago"""
+    with sqlite3.connect(store.db_path) as conn:
+        conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - seconds, job_id))
+
+
+def test_claim_takes_oldest_queued_job_once(tmp_path):
+    store = make_store(tmp_path)
+    first = store.submit('tryon', {'n': 1})
+    store.submit('tryon', {'n': 2})
+
+    job = store.claim()
+    assert (job['job_id'], job['status'], job['attempts']) == (first, 'running', 1)
+    assert store.claim()['payload'] == {'n': 2}
+    assert store.claim() is None
+    assert store.queue_depth() == 0
+
+
+def test_running_job_is_not_reclaimed_within_its_lease(tmp_path):
+    store = make_store(tmp_path, lease_seconds=60)
+    job_id = store.submit('tryon', {})
+    store.claim()
+
+    expire_lease(store, job_id, 30)
+    assert store.claim() is None
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    store = make_store(tmp_path, lease_seconds=60)
+    job_id = store.submit('tryon', {})
+    store.claim()
+    store.mark_stage(job_id, 'description')
+
+    expire_lease(store, job_id, 120)
+    job = store.claim()
+    assert (job['job_id'], job['attempts']) == (job_id, 2)
+    # A new attempt starts its stage timings over
+    assert store.get(job_id)['stage'] is None
+
+
+def test_heartbeat_renews_the_lease(tmp_path):
+    store = make_store(tmp_path, lease_seconds=60)
+    job_id = store.submit('tryon', {})
+    store.claim()
+
+    expire_lease(store, job_id, 120)
+    store.heartbeat(job_id)
+    assert store.claim() is None
+
+
+def test_job_fails_after_max_attempts(tmp_path):
+    store = make_store(tmp_path, lease_seconds=60, max_attempts=2)
+    job_id = store.submit('tryon', {})
+    for _ in range(2):
+        assert store.claim()['job_id'] == job_id
+        expire_lease(store, job_id, 120)
+
+    assert store.claim() is None
+    job = store.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Abandoned after 2 attempts'
+    assert job['attempts'] == 2
+
+
+def test_stage_timings_and_completion(tmp_path):
+    store = make_store(tmp_path)
+    job_id = store.submit('tryon', {'clothing_path': 'uploads/a.jpg'})
+    store.claim()
+    assert store.pending_payloads() == [{'clothing_path': 'uploads/a.jpg'}]
+
+    store.mark_stage(job_id, 'description')
+    store.mark_stage(job_id, 'merge')
+    store.complete(job_id, {'generated_image': {'filename': 'tryon_0123abcd.jpg'}})
+
+    public = JobStore.to_public(store.get(job_id))
+    assert public['status'] == 'completed'
+    assert set(public['stage_timings']) == {'description', 'merge'}
+    assert 'payload' not in public and 'total_seconds' in public
+    assert store.pending_payloads() == []
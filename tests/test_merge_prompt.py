@@ -0,0 +1,44 @@
+import re
+
+from function_agents.image_merge_agent import agent, build_merge_prompt
+
+
+def sentences(prompt):
+    return re.findall(r'[^.]+\.', prompt)
+
+
+def agent_example_prompt():
+    """The example prompt in the orchestrator agent's instructions"""
+    return re.search(r'Example prompt:\s*"([^"]+)"', agent.instructions).group(1)
+
+
+def test_fast_prompt_has_the_agent_prompt_structure():
+    example = sentences(agent_example_prompt())
+    prompt = sentences(build_merge_prompt('full_body', 'front', 'Natural standing pose', 'Simple studio background'))
+
+    assert len(prompt) == len(example) == 4
+    # Shot type and angle are fixed sentences
+    assert prompt[:2] == example[:2]
+    # Pose and scene are full sentences about the model and the background, not bare fragments
+    assert prompt[2] == ' The model is in a natural standing pose.'
+    assert prompt[3] == ' The background is a simple studio.'
+    assert example[3].startswith(' The background is')
+
+
+def test_translated_fragments_become_sentences():
+    prompt = build_merge_prompt('half_body', 'side', 'Walking toward the viewer.', 'An outdoor garden')
+    assert prompt == ("This is a half body fashion photograph of a model wearing the uploaded clothing. "
+                      "The model is positioned at a side-facing angle. "
+                      "The model is walking toward the viewer. "
+                      "The background is an outdoor garden.")
+    assert sentences(build_merge_prompt('full_body', 'front', 'hands on hips'))[2] == ' The model is in a hands on hips pose.'
+
+
+def test_full_sentences_and_missing_parts():
+    example = agent_example_prompt()
+    pose, scene = sentences(example)[2:]
+    assert build_merge_prompt('full_body', 'front', pose, scene) == example
+
+    prompt = sentences(build_merge_prompt('full_body', 'front'))
+    assert len(prompt) == 3
+    assert prompt[2].startswith(' The model')
@@ -0,0 +1,67 @@
+import os
+
+from function_agents.model_cache import ModelImageCache
+
+SPECS = {'gender': 'female', 'age': 25, 'nationality': 'Chinese', 'height': 170, 'weight': 60}
+
+
+def make_cache(tmp_path, **options):
+    return ModelImageCache(db_path=str(tmp_path / 'model_cache.db'), **options)
+
+
+def make_image(tmp_path, name, size=100):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+def test_key_ignores_camera_pose_and_scene(tmp_path):
+    cache = make_cache(tmp_path)
+    styled = {**SPECS, 'gender': ' Female ', 'camera': {'angle': 'side'},
+              'action_description': '走路', 'scene_description': '街道'}
+    assert cache.make_key(styled) == cache.make_key(SPECS)
+
+
+def test_bucketing_shares_images_between_similar_specs(tmp_path):
+    cache = make_cache(tmp_path, age_bucket=5, height_bucket=10)
+    image = make_image(tmp_path, 'model_00000001.jpg')
+    cache.put(SPECS, image)
+
+    assert cache.get({**SPECS, 'age': 27, 'height': 178}) == image
+    assert cache.get({**SPECS, 'age': 30}) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_variants_fill_up_then_rotate(tmp_path):
+    cache = make_cache(tmp_path, variants=2)
+    first = make_image(tmp_path, 'model_00000001.jpg')
+    cache.put(SPECS, first)
+    assert cache.get(SPECS) is None
+
+    second = make_image(tmp_path, 'model_00000002.jpg')
+    cache.put(SPECS, second)
+    assert [cache.get(SPECS) for _ in range(3)] == [first, second, first]
+
+
+def test_removed_files_are_dropped(tmp_path):
+    cache = make_cache(tmp_path)
+    image = make_image(tmp_path, 'model_00000001.jpg')
+    cache.put(SPECS, image)
+    os.remove(image)
+
+    assert cache.get(SPECS) is None
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_least_recently_used_images_are_evicted_over_budget(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=250)
+    old = make_image(tmp_path, 'model_00000001.jpg')
+    cache.put({**SPECS, 'age': 30}, old)
+    kept = make_image(tmp_path, 'model_00000002.jpg')
+    cache.put(SPECS, kept)
+    newest = make_image(tmp_path, 'model_00000003.jpg')
+    cache.put({**SPECS, 'age': 40}, newest)
+
+    assert not os.path.exists(old)
+    assert cache.get(SPECS) == kept
+    assert cache.get_stats()['size_bytes'] == 200
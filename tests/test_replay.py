@@ -0,0 +1,26 @@
+import os
+import socket
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASSETTE = os.path.join(REPO_ROOT, 'benchmarks', 'cassettes', 'tryon')
+BASELINE = os.path.join(REPO_ROOT, 'benchmarks', 'cassettes', 'tryon-baseline.json')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_replayed_tryon_has_no_overhead_regression(tmp_path):
+    """End-to-end try-on against the committed cassette: no network, no recording misses, no slowdown"""
+    env = {key: value for key, value in os.environ.items() if key != 'OPENAI_API_KEY'}
+    result = subprocess.run(
+        [sys.executable, os.path.join(REPO_ROOT, 'benchmarks', 'replay_tryon.py'), 'replay',
+         '--cassette', CASSETTE, '--baseline', BASELINE, '--iterations', '3', '--port', str(free_port())],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=600
+    )
+    assert result.returncode == 0, result.stdout[-4000:] + result.stderr[-4000:]
+    assert '✅ No regressions' in result.stdout
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from function_agents import scheduler
+from function_agents.scheduler import UpstreamScheduler, request_priority
+
+COMPLETION = {
+    'id': 'chatcmpl-test',
+    'object': 'chat.completion',
+    'created': 0,
+    'model': 'gpt-4o',
+    'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': 'ok'}}]
+}
+
+
+def rate_limited_client(failures, headers=None):
+    """Client whose first `failures` requests are answered with 429, and the requests it saw"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) <= failures:
+            return httpx.Response(429, headers=headers or {}, json={'error': {'message': 'Rate limited'}})
+        return httpx.Response(200, json=COMPLETION)
+
+    client = openai.AsyncOpenAI(api_key='test', base_url='http://mock/v1', max_retries=0,
+                                http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return client, requests
+
+
+def complete(client):
+    return lambda: client.chat.completions.create(model='gpt-4o', messages=[{'role': 'user', 'content': 'hi'}])
+
+
+def test_retry_after_is_honoured():
+    client, requests = rate_limited_client(1, {'retry-after-ms': '300'})
+    upstream = UpstreamScheduler(rate_limits={}, backoff_max=5)
+
+    started = time.monotonic()
+    result = asyncio.run(upstream.call('chat', 'gpt-4o', complete(client)))
+
+    assert result.choices[0].message.content == 'ok'
+    assert len(requests) == 2
+    assert time.monotonic() - started >= 0.3
+    assert upstream.get_stats()['gpt-4o']['rate_limited'] == 1
+
+
+def test_retry_after_is_capped_at_backoff_max():
+    client, requests = rate_limited_client(1, {'retry-after': '3600'})
+    upstream = UpstreamScheduler(rate_limits={}, backoff_max=0.2)
+
+    started = time.monotonic()
+    asyncio.run(upstream.call('chat', 'gpt-4o', complete(client)))
+
+    assert len(requests) == 2
+    assert 0.2 <= time.monotonic() - started < 2
+
+
+def test_retries_stop_at_max_attempts():
+    client, requests = rate_limited_client(100, {'retry-after-ms': '10'})
+    upstream = UpstreamScheduler(rate_limits={}, max_attempts=3)
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(upstream.call('chat', 'gpt-4o', complete(client)))
+
+    assert len(requests) == 3
+    stats = upstream.get_stats()['gpt-4o']
+    assert (stats['retries'], stats['failures']) == (2, 1)
+
+
+def test_client_errors_are_not_retried():
+    upstream = UpstreamScheduler(rate_limits={})
+    request = httpx.Request('POST', 'http://mock/v1/chat/completions')
+    error = openai.BadRequestError('Bad request', response=httpx.Response(400, request=request), body=None)
+
+    assert upstream.retry_delay(error, 1) is None
+
+
+def test_interactive_calls_go_ahead_of_bulk(monkeypatch):
+    monkeypatch.setitem(scheduler.UPSTREAM_CONCURRENCY, 'chat', 1)
+    upstream = UpstreamScheduler(rate_limits={})
+    order = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            await release.wait()
+
+        async def record(name):
+            order.append(name)
+
+        async def call(name, priority):
+            with request_priority(priority):
+                await upstream.call('chat', 'gpt-4o', lambda: record(name))
+
+        # One call holds the only slot while bulk, then interactive work queues up
+        holder = asyncio.create_task(upstream.call('chat', 'gpt-4o', hold))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(call('bulk 1', 'bulk')), asyncio.create_task(call('bulk 2', 'bulk'))]
+        await asyncio.sleep(0)
+        waiting.append(asyncio.create_task(call('interactive', 'interactive')))
+        await asyncio.sleep(0)
+        assert upstream.get_stats()['gpt-4o']['waiting'] == 3
+        release.set()
+        await asyncio.gather(holder, *waiting)
+
+    asyncio.run(run())
+
+    assert order == ['interactive', 'bulk 1', 'bulk 2']
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from function_agents.single_flight import SingleFlight
+
+
+def counting_call(calls, result='done', error=None):
+    """make_call that counts how often the work really ran"""
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        if error is not None:
+            raise error
+        return result
+    return work
+
+
+def test_concurrent_identical_calls_share_one_run():
+    flight = SingleFlight('test_share')
+    calls = []
+
+    async def run():
+        return await asyncio.gather(*(flight.run('key', counting_call(calls)) for _ in range(5)))
+
+    assert asyncio.run(run()) == ['done'] * 5
+    assert len(calls) == 1
+    assert flight.get_stats() == {'leaders': 1, 'followers': 4, 'in_flight': 0}
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight('test_keys')
+    calls = []
+
+    async def run():
+        return await asyncio.gather(flight.run('a', counting_call(calls, 'a')),
+                                    flight.run('b', counting_call(calls, 'b')))
+
+    assert asyncio.run(run()) == ['a', 'b']
+    assert len(calls) == 2
+
+
+def test_finished_calls_are_not_remembered():
+    flight = SingleFlight('test_forget')
+    calls = []
+
+    async def run():
+        await flight.run('key', counting_call(calls))
+        await flight.run('key', counting_call(calls))
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_errors_reach_every_caller():
+    flight = SingleFlight('test_errors')
+    calls = []
+
+    async def run():
+        return await asyncio.gather(*(flight.run('key', counting_call(calls, error=ValueError('boom')))
+                                      for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight('test_cancel')
+    calls = []
+
+    async def run():
+        leader = asyncio.create_task(flight.run('key', counting_call(calls)))
+        follower = asyncio.create_task(flight.run('key', counting_call(calls)))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == 'done'
+    assert len(calls) == 1
@@ -0,0 +1,46 @@
+import os
+import shutil
+import subprocess
+import time
+
+from function_agents import storage
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OLD = time.time() - 365 * 24 * 3600
+
+
+def tracked_images():
+    """Repository files under imgs/, from git when available"""
+    try:
+        output = subprocess.run(['git', 'ls-files', storage.IMAGE_FOLDER], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        paths = output.split()
+    except (OSError, subprocess.CalledProcessError):
+        paths = []
+    if not paths:
+        folder = os.path.join(REPO_ROOT, storage.EXAMPLE_IMAGE_FOLDER)
+        paths = [os.path.join(storage.EXAMPLE_IMAGE_FOLDER, name) for name in os.listdir(folder)]
+    return paths
+
+
+def test_sweep_never_touches_tracked_images(tmp_path, monkeypatch):
+    tracked = tracked_images()
+    assert tracked
+    for path in tracked:
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        shutil.copy(os.path.join(REPO_ROOT, path), tmp_path / path)
+    generated = storage.shard_path(storage.IMAGE_FOLDER, 'tryon_0123abcd.jpg')
+    os.makedirs(tmp_path / os.path.dirname(generated), exist_ok=True)
+    (tmp_path / generated).write_bytes(b'x' * 1024)
+    for path in tracked + [generated]:
+        os.utime(tmp_path / path, (OLD, OLD))
+
+    # Everything is past its TTL and the images area is far over its quota
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('STORAGE_IMAGES_MAX_BYTES', '1')
+    monkeypatch.setattr(storage, '_manager', None)
+    storage.get_storage_manager().sweep()
+
+    assert not os.path.exists(generated)
+    for path in tracked:
+        assert os.path.exists(path), f"janitor removed tracked file {path}"
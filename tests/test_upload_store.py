@@ -0,0 +1,32 @@
+from PIL import Image
+
+from upload_store import prepare_image_file
+
+EXIF_ORIENTATION = 0x0112
+
+
+def test_rgb_png_becomes_jpeg(tmp_path):
+    path = tmp_path / 'garment.png'
+    Image.new('RGB', (40, 20), (200, 10, 10)).save(path)
+
+    jpeg_path = prepare_image_file(str(path))
+
+    assert jpeg_path == str(tmp_path / 'garment.jpg')
+    assert not path.exists()
+    with Image.open(jpeg_path) as image:
+        assert (image.format, image.mode, image.size) == ('JPEG', 'RGB', (40, 20))
+
+
+def test_exif_rotated_jpeg_is_made_upright(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    image = Image.new('RGB', (40, 20), (10, 200, 10))
+    exif = image.getexif()
+    exif[EXIF_ORIENTATION] = 6  # rotate 90 degrees clockwise to display
+    image.save(path, exif=exif)
+
+    jpeg_path = prepare_image_file(str(path))
+
+    assert jpeg_path == str(path)
+    with Image.open(jpeg_path) as converted:
+        assert converted.size == (20, 40)
+        assert converted.getexif().get(EXIF_ORIENTATION, 1) == 1
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+import upload_stream
+from upload_stream import UploadTooLarge, receive_upload
+
+BOUNDARY = 'test-boundary'
+
+
+class FakeRequest:
+    """Just what receive_upload reads from a Starlette request"""
+
+    def __init__(self, body: bytes, content_type: str, chunk_size: int = 1000):
+        self.headers = {'content-type': content_type, 'content-length': str(len(body))}
+        self.query_params = {'gender': 'male'}
+        self._chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def stream(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+def multipart_body(image: bytes) -> bytes:
+    return (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="gender"\r\n\r\nfemale\r\n'
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="clothing"; filename="shirt.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + image + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+@pytest.fixture
+def writer_threads(monkeypatch):
+    """Threads that wrote spool data, with a small batch size so an upload takes several writes"""
+    monkeypatch.setattr(upload_stream, 'SPOOL_WRITE_BYTES', 4096)
+    threads = []
+    write = upload_stream._SpoolFile._write
+
+    def recording_write(self, data):
+        threads.append(threading.current_thread())
+        write(self, data)
+
+    monkeypatch.setattr(upload_stream._SpoolFile, '_write', recording_write)
+    return threads
+
+
+def test_multipart_upload_is_written_off_the_event_loop(tmp_path, writer_threads):
+    image = os.urandom(20000)
+    request = FakeRequest(multipart_body(image), f'multipart/form-data; boundary={BOUNDARY}')
+
+    path, fields = asyncio.run(receive_upload(request, str(tmp_path), 1024 * 1024))
+
+    with open(path, 'rb') as f:
+        assert f.read() == image
+    assert fields == {'gender': 'female'}
+    assert len(writer_threads) > 1
+    assert threading.main_thread() not in writer_threads
+
+
+def test_raw_upload_is_written_off_the_event_loop(tmp_path, writer_threads):
+    image = os.urandom(20000)
+
+    path, fields = asyncio.run(receive_upload(FakeRequest(image, 'image/jpeg'), str(tmp_path), 1024 * 1024))
+
+    with open(path, 'rb') as f:
+        assert f.read() == image
+    assert fields == {'gender': 'male'}
+    assert threading.main_thread() not in writer_threads
+
+
+def test_oversized_upload_leaves_no_file(tmp_path, writer_threads):
+    request = FakeRequest(multipart_body(os.urandom(20000)), f'multipart/form-data; boundary={BOUNDARY}')
+    # Declared within the limit, so the limit is only crossed while streaming
+    request.headers['content-length'] = '100'
+
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(receive_upload(request, str(tmp_path), 10000))
+    assert os.listdir(tmp_path) == []
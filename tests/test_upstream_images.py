@@ -0,0 +1,60 @@
+import os
+import shutil
+from io import BytesIO
+
+from PIL import Image
+
+from function_agents import upstream_images
+
+
+def photo(path, size):
+    Image.new('RGB', size, (200, 40, 40)).save(path, quality=90)
+    return str(path)
+
+
+def count_resizes(monkeypatch):
+    resizes = []
+    resize = upstream_images._resize
+
+    def counting_resize(image, box):
+        resizes.append(box)
+        return resize(image, box)
+
+    monkeypatch.setattr(upstream_images, '_resize', counting_resize)
+    return resizes
+
+
+def test_same_garment_in_different_files_is_resized_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(upstream_images, 'UPSTREAM_DERIVATIVE_FOLDER', str(tmp_path / 'derivatives'))
+    resizes = count_resizes(monkeypatch)
+    first = photo(tmp_path / 'upload_1.jpg', (2000, 3000))
+    # A repeated base64 upload lands in a new uuid-named temporary file
+    second = shutil.copy(first, tmp_path / 'upload_2.jpg')
+
+    data, mime_type = upstream_images.get_upstream_image(first, 'edit')
+    assert upstream_images.get_upstream_image(second, 'edit') == (data, mime_type)
+    assert mime_type == 'image/jpeg'
+    assert Image.open(BytesIO(data)).size == (1024, 1536)
+    assert len(resizes) == 1
+
+
+def test_validation_derivative_is_cached_by_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(upstream_images, 'UPSTREAM_DERIVATIVE_FOLDER', str(tmp_path / 'derivatives'))
+    resizes = count_resizes(monkeypatch)
+    with open(photo(tmp_path / 'garment.jpg', (3000, 2000)), 'rb') as f:
+        image_bytes = f.read()
+
+    first = upstream_images.downscale_image_bytes(image_bytes, 'validation')
+    assert upstream_images.downscale_image_bytes(bytes(image_bytes), 'validation') == first
+    assert Image.open(BytesIO(first)).size == (512, 341)
+    assert len(resizes) == 1
+
+
+def test_images_that_fit_are_sent_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(upstream_images, 'UPSTREAM_DERIVATIVE_FOLDER', str(tmp_path / 'derivatives'))
+    path = photo(tmp_path / 'small.png', (400, 600))
+    with open(path, 'rb') as f:
+        original = f.read()
+
+    assert upstream_images.get_upstream_image(path, 'edit') == (original, 'image/png')
+    assert not os.path.exists(tmp_path / 'derivatives')
@@ -0,0 +1,160 @@
+"""
+Content-addressed store for uploaded garment images
+
+Uploads are identified by the SHA-256 of their raw bytes, so the same
+garment is decoded, normalized and written to disk only once no matter how
+many times (or by how many endpoints) it is used.
+"""
+
+import hashlib
+import os
+import re
+import uuid
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from function_agents.artifact_store import garment_key, get_artifact_store
+from function_agents.metrics import observe_stage
+from function_agents.tracing import traced
+from function_agents.storage import GARMENT_FOLDER, shard_path, touch_access
+
+_GARMENT_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+_EXIF_ORIENTATION = 0x0112
+
+
+def normalize_image(image: Image.Image) -> Image.Image:
+    """Convert an image to upright RGB, flattening transparency onto a white background"""
+    # Re-encoding drops the EXIF data, so apply its rotation to the pixels
+    image = ImageOps.exif_transpose(image)
+    if image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+@observe_stage('upload_decode')
+def prepare_image_bytes(image_bytes: bytes) -> bytes:
+    """
+    Get RGB JPEG bytes for an uploaded image
+
+    RGB JPEGs (without a rotation in their EXIF data) are returned as they
+    are: only the header is parsed, nothing is decoded or re-encoded. Other
+    images are normalized and encoded as JPEG.
+    """
+    image = Image.open(BytesIO(image_bytes))
+    if (image.format == 'JPEG' and image.mode == 'RGB'
+            and image.getexif().get(_EXIF_ORIENTATION, 1) == 1):
+        return image_bytes
+
+    output = BytesIO()
+    normalize_image(image).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+@observe_stage('upload_decode')
+def prepare_image_file(path: str) -> str:
+    """
+    Turn an uploaded image file into an RGB JPEG file, returning its path
+
+    Like prepare_image_bytes, RGB JPEGs are only renamed, never decoded. The
+    original file is replaced.
+    """
+    with Image.open(path) as image:
+        if (image.format == 'JPEG' and image.mode == 'RGB'
+                and image.getexif().get(_EXIF_ORIENTATION, 1) == 1):
+            converted = None
+        else:
+            # Decode while the file is still open; the save below happens after it is closed
+            image.load()
+            converted = normalize_image(image)
+
+    jpeg_path = os.path.splitext(path)[0] + '.jpg'
+    if converted is None:
+        os.replace(path, jpeg_path)
+    else:
+        converted.save(jpeg_path, format="JPEG", quality=90)
+        if jpeg_path != path:
+            os.remove(path)
+    return jpeg_path
+
+
+class UploadStore:
+    """Stores one normalized JPEG per distinct uploaded image"""
+
+    def __init__(self, folder: str = GARMENT_FOLDER):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def is_valid_id(garment_id: str) -> bool:
+        """Check that a garment ID is a well-formed SHA-256 hex digest"""
+        return bool(_GARMENT_ID_PATTERN.match(garment_id or ''))
+
+    def path_for(self, garment_id: str) -> str:
+        """Get the file path of a stored garment (whether or not it exists)"""
+        if not self.is_valid_id(garment_id):
+            raise ValueError(f"Invalid garment ID: {garment_id}")
+        return shard_path(self.folder, f"{garment_id}.jpg")
+
+    def _find(self, garment_id: str) -> Optional[str]:
+        if not self.is_valid_id(garment_id):
+            return None
+        # Garments stored before sharding sit directly in the folder
+        for path in (self.path_for(garment_id), os.path.join(self.folder, f"{garment_id}.jpg")):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def exists(self, garment_id: str) -> bool:
+        return self.get_path(garment_id) is not None
+
+    @traced('upload_store.put')
+    def put(self, image_bytes: bytes) -> str:
+        """
+        Store raw image bytes and return their garment ID
+
+        Bytes already in the store are not decoded again, and RGB JPEGs are
+        stored without re-encoding.
+        """
+        garment_id = hashlib.sha256(image_bytes).hexdigest()
+        existing = self._find(garment_id)
+        if existing is not None:
+            touch_access(existing)
+            return garment_id
+
+        jpeg_bytes = prepare_image_bytes(image_bytes)
+        path = self.path_for(garment_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary name first so concurrent uploads never see a partial file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(jpeg_bytes)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        # Let the other API nodes resolve the garment ID too
+        get_artifact_store().upload(path, garment_key(garment_id))
+        return garment_id
+
+    def get_path(self, garment_id: str) -> Optional[str]:
+        """Get the file path of a stored garment, or None if unknown"""
+        path = self._find(garment_id)
+        if path is not None:
+            touch_access(path)
+            return path
+
+        # Uploaded through another node
+        store = get_artifact_store()
+        if store.remote and self.is_valid_id(garment_id):
+            path = self.path_for(garment_id)
+            if store.download(garment_key(garment_id), path):
+                return path
+        return None
@@ -0,0 +1,212 @@
+"""
+Streaming image uploads
+
+Receives multipart/form-data or raw image bodies chunk by chunk straight into
+a spool file, so memory per upload stays bounded no matter how large the
+image is, and uploads over the size limit are rejected as soon as the limit
+is crossed rather than after the whole body has been read. Received bytes
+are written in batches in the default executor, so disk writes never block
+the event loop.
+"""
+
+import asyncio
+import os
+import uuid
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+
+from function_agents.tracing import traced
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_FIELD_BYTES = 64 * 1024  # Form fields are small parameters, never images
+# Received bytes are buffered up to this size before a write is handed to the executor
+SPOOL_WRITE_BYTES = int(os.getenv('UPLOAD_SPOOL_WRITE_BYTES', 1024 * 1024))
+
+
+class UploadTooLarge(Exception):
+    """The request body exceeded the size limit"""
+
+
+class InvalidUpload(Exception):
+    """The request body is not a usable image upload"""
+
+
+class _SpoolFile:
+    """Spool file written in batches in the default executor; data is added from sync parser callbacks"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._pending = bytearray()
+
+    def add(self, data: bytes) -> None:
+        self._pending += data
+
+    async def flush(self, force: bool = False) -> None:
+        """Write buffered bytes once there are enough of them (or any, if forced)"""
+        if len(self._pending) < SPOOL_WRITE_BYTES and not (force and self._pending):
+            return
+        data, self._pending = bytes(self._pending), bytearray()
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+    def _write(self, data: bytes) -> None:
+        if self._file is None:
+            self._file = open(self.path, 'wb')
+        self._file.write(data)
+
+    def _close(self) -> None:
+        if self._file is None:
+            # Nothing was received; still leave an (empty) file behind
+            self._file = open(self.path, 'wb')
+        self._file.close()
+
+    def _discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    async def close(self) -> None:
+        await self.flush(force=True)
+        await asyncio.get_running_loop().run_in_executor(None, self._close)
+
+    async def discard(self) -> None:
+        """Close and remove the file after a failed upload"""
+        await asyncio.get_running_loop().run_in_executor(None, self._discard)
+
+
+def _check_declared_length(request: Request, max_bytes: int) -> None:
+    declared = request.headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+
+
+@traced('receive_upload')
+async def receive_upload(request: Request,
+                         folder: str,
+                         max_bytes: int,
+                         file_field: str = 'clothing') -> Tuple[str, Dict[str, str]]:
+    """
+    Stream an image upload to a spool file
+
+    Accepts multipart/form-data (the image in `file_field`, parameters as
+    other fields) or a raw image/* body (parameters in the query string).
+
+    Returns:
+        (spool_file_path, fields); the caller owns and must remove the file
+    """
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type.startswith(b'image/'):
+        path = await _receive_raw(request, folder, max_bytes)
+        return path, dict(request.query_params)
+    if content_type == b'multipart/form-data' and options.get(b'boundary'):
+        return await _receive_multipart(request, folder, max_bytes, options[b'boundary'], file_field)
+    raise InvalidUpload("Expected multipart/form-data or an image/* body")
+
+
+async def _receive_raw(request: Request, folder: str, max_bytes: int) -> str:
+    _check_declared_length(request, max_bytes)
+    spool = _SpoolFile(os.path.join(folder, f"{uuid.uuid4()}.upload"))
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            spool.add(chunk)
+            await spool.flush()
+        if received == 0:
+            raise InvalidUpload("Empty upload")
+        await spool.close()
+        return spool.path
+    except BaseException:
+        await asyncio.shield(spool.discard())
+        raise
+
+
+async def _receive_multipart(request: Request,
+                             folder: str,
+                             max_bytes: int,
+                             boundary: bytes,
+                             file_field: str) -> Tuple[str, Dict[str, str]]:
+    _check_declared_length(request, max_bytes)
+    spool = _SpoolFile(os.path.join(folder, f"{uuid.uuid4()}.upload"))
+    fields: Dict[str, str] = {}
+    state = {'header_field': b'', 'header_value': b'', 'headers': {}, 'name': None,
+             'file': None, 'buffer': None, 'file_done': False}
+
+    def on_part_begin():
+        state.update(headers={}, name=None, buffer=None)
+
+    def on_header_field(data, start, end):
+        state['header_field'] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state['header_value'] += data[start:end]
+
+    def on_header_end():
+        state['headers'][state['header_field'].lower()] = state['header_value']
+        state['header_field'] = state['header_value'] = b''
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state['headers'].get(b'content-disposition', b''))
+        name = disposition.get(b'name', b'').decode('utf-8', 'replace')
+        state['name'] = name
+        if name == file_field and b'filename' in disposition:
+            if state['file_done']:
+                raise InvalidUpload(f"More than one '{file_field}' file")
+            state['file'] = spool
+        else:
+            state['buffer'] = bytearray()
+
+    def on_part_data(data, start, end):
+        if state['file'] is not None:
+            state['file'].add(data[start:end])
+        elif state['buffer'] is not None:
+            state['buffer'] += data[start:end]
+            if len(state['buffer']) > MAX_FIELD_BYTES:
+                raise InvalidUpload(f"Form field '{state['name']}' is too large")
+
+    def on_part_end():
+        if state['file'] is not None:
+            state['file'] = None
+            state['file_done'] = True
+        elif state['buffer'] is not None and state['name']:
+            fields[state['name']] = state['buffer'].decode('utf-8', 'replace')
+
+    parser = MultipartParser(boundary, {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+    })
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            parser.write(chunk)
+            await spool.flush()
+        parser.finalize()
+        if not state['file_done']:
+            raise InvalidUpload(f"Missing '{file_field}' file")
+        await spool.close()
+        return spool.path, fields
+    except BaseException:
+        await asyncio.shield(spool.discard())
+        raise
+
+
+def parse_bool(value: Optional[str]) -> bool:
+    """Interpret a form or query string flag"""
+    return (value or '').strip().lower() in ('1', 'true', 'yes', 'on')